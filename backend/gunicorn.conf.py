@@ -0,0 +1,26 @@
+"""Gunicorn settings (`gunicorn -c gunicorn.conf.py "src.app:create_app()"`).
+
+The default gevent worker keeps idle /events streams cheap: each open
+connection is a greenlet instead of a whole worker.  The app factory runs in
+each worker after the fork, so the optional warm-up (``WARMUP_ON_START``)
+never shares connections between workers; keep ``preload_app`` off.
+
+psycopg2 blocks the whole worker while it waits on Postgres unless it is
+given a gevent wait callback, so ``post_fork`` installs psycogreen's under
+gevent workers.
+"""
+import os
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = 5
+
+
+def post_fork(server, worker):
+    if 'gevent' in server.cfg.worker_class_str:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
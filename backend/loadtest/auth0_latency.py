@@ -0,0 +1,145 @@
+"""Catalog throughput while Auth0 is slow, per gunicorn worker class.
+
+Starts the Auth0 stub with a large artificial latency, runs the API under
+gunicorn once per worker class, and drives a mix of ``GET /movies`` and
+``GET /users`` from concurrent clients.  With sync workers every slow
+``/users`` call holds the worker and catalog throughput collapses; with
+gevent workers it should stay close to the no-latency baseline.
+
+    cd backend && python -m loadtest.auth0_latency --latency 2 --duration 15
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from .auth0_stub import Auth0Stub
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(worker_class, stub_url, database_url, port, extra_env=None):
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        SKIP_AUTH='true',
+        AUTH0_BASE_URL=stub_url,
+        DATABASE_URL=database_url,
+        GUNICORN_WORKER_CLASS=worker_class,
+        WEB_CONCURRENCY='1',
+        GUNICORN_TIMEOUT='120',
+        # A handful of clients from one address would drain any sane budget.
+        RATE_LIMIT_ENABLED='false',
+    )
+    env.update(extra_env or {})
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'src.app:create_app()'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url + '/', timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'gunicorn ({worker_class}) did not start')
+
+
+def drive(base_url, clients, duration, users_share):
+    """Run ``clients`` looping clients; return latencies per traffic class."""
+    results = {'catalog': [], 'users': [], 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            kind = 'users' if random.random() < users_share else 'catalog'
+            path = '/users' if kind == 'users' else '/movies'
+            started = time.perf_counter()
+            try:
+                status = session.get(base_url + path, timeout=60).status_code
+            except requests.RequestException:
+                status = None
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 200:
+                    results[kind].append(elapsed)
+                elif status == 503:
+                    results['rejected'] += 1
+                else:
+                    results['errors'] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def report(label, results, duration):
+    catalog = results['catalog']
+    print(
+        f'{label:<10} catalog {len(catalog) / duration:8.1f} req/s  '
+        f'p50 {percentile(catalog, 0.50) * 1000:8.1f} ms  '
+        f'p99 {percentile(catalog, 0.99) * 1000:8.1f} ms  '
+        f'users {len(results["users"]):5d} ok {results["rejected"]:5d} shed  errors {results["errors"]}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=2.0, help='seconds added to every Auth0 response')
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--users-share', type=float, default=0.2, help='fraction of requests hitting /users')
+    parser.add_argument('--worker-classes', default='sync,gevent')
+    args = parser.parse_args()
+
+    stub = Auth0Stub(latency=args.latency).start()
+    print(f'Auth0 latency {args.latency:.1f}s, {args.clients} clients, {args.duration:.0f}s per run')
+
+    try:
+        for worker_class in args.worker_classes.split(','):
+            with tempfile.TemporaryDirectory() as tmp:
+                database_url = f'sqlite:///{os.path.join(tmp, "loadtest.db")}'
+                process, base_url = start_server(worker_class, stub.url, database_url, free_port())
+                try:
+                    requests.post(base_url + '/setup-db', timeout=30)
+                    report(worker_class, drive(base_url, args.clients, args.duration, args.users_share), args.duration)
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""Local stand-in for the Auth0 tenant used by the load and resilience tests.
+
+Serves the JWKS, the token endpoint and the Management API routes that
+``src/auth/auth0_management.py`` calls, and mints RS256 access tokens for
+each role that the API accepts as if Auth0 had issued them (``mint_token``,
+or ``POST /__tokens {"role": "Casting Director"}``).  Faults can be injected
+with an artificial per-request latency and a random error rate, set from
+Python or at runtime with ``POST /__faults {"latency": 2, "error_rate": 0.5}``.
+Point the app at it with ``AUTH0_BASE_URL=http://127.0.0.1:<port>``; the
+issuer and audience default to the app's ``AUTH0_DOMAIN`` and
+``API_AUDIENCE``.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from urllib.parse import unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from jose import jwk, jwt
+
+
+ROLES = [
+    {'id': 'rol_assistant', 'name': 'Casting Assistant'},
+    {'id': 'rol_director', 'name': 'Casting Director'},
+    {'id': 'rol_producer', 'name': 'Executive Producer'},
+]
+
+_ASSISTANT = ['get:movies', 'get:actors']
+_DIRECTOR = _ASSISTANT + [
+    'post:actors', 'patch:actors', 'delete:actors', 'patch:movies',
+    'post:casting', 'delete:casting', 'get:users'
+]
+ROLE_PERMISSIONS = {
+    'Casting Assistant': _ASSISTANT,
+    'Casting Director': _DIRECTOR,
+    'Executive Producer': _DIRECTOR + ['post:movies', 'delete:movies', 'post:users', 'patch:users', 'delete:users'],
+}
+
+SIGNING_KEY_ID = 'stub-signing-key'
+
+
+@lru_cache(maxsize=None)
+def signing_key_pem(bits=2048):
+    """PEM of an RSA key, generated once per process (cryptography if installed)"""
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa as crypto_rsa
+    except ImportError:
+        import rsa
+
+        return rsa.newkeys(bits)[1].save_pkcs1().decode()
+
+    key = crypto_rsa.generate_private_key(public_exponent=65537, key_size=bits)
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption()
+    ).decode()
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that time out on purpose drop the connection mid-response.
+        pass
+
+
+class Auth0Stub:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, error_status=503,
+                 issuer=None, audience=None, key_bits=2048):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        domain = os.environ.get('AUTH0_DOMAIN', 'dev-dzv8dgf6ff6qu41d.us.auth0.com')
+        self.issuer = issuer or f'https://{domain}/'
+        self.audience = audience or os.environ.get('API_AUDIENCE', 'casting-agency')
+        self.key_bits = key_bits
+        self.users = {
+            f'auth0|user{number}': {
+                'user_id': f'auth0|user{number}',
+                'email': f'user{number}@example.com',
+                'name': f'User {number}',
+                'permissions': list(ROLE_PERMISSIONS['Casting Assistant']),
+                'roles': ROLES[:1]
+            }
+            for number in range(1, 51)
+        }
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = _QuietServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def set_faults(self, latency=None, error_rate=None, error_status=None):
+        if latency is not None:
+            self.latency = latency
+        if error_rate is not None:
+            self.error_rate = error_rate
+        if error_status is not None:
+            self.error_status = error_status
+
+    @property
+    def jwks(self):
+        public_key = jwk.construct(signing_key_pem(self.key_bits), 'RS256').public_key().to_dict()
+        return {'keys': [dict(public_key, kid=SIGNING_KEY_ID, use='sig')]}
+
+    def mint_token(self, role, user_id=None, expires_in=3600, **claims):
+        """RS256 access token for ``role`` with that role's permissions"""
+        now = int(time.time())
+        payload = {
+            'iss': self.issuer,
+            'aud': self.audience,
+            'sub': user_id or f'auth0|{role.lower().replace(" ", "-")}',
+            'iat': now,
+            'exp': now + expires_in,
+            'permissions': list(ROLE_PERMISSIONS[role]),
+        }
+        payload.update(claims)
+        return jwt.encode(payload, signing_key_pem(self.key_bits), algorithm='RS256',
+                          headers={'kid': SIGNING_KEY_ID})
+
+    def handle(self, method, path, body):
+        """Return ``(status, payload)`` for one Management API call."""
+        path = path.split('?', 1)[0]
+
+        if method == 'POST' and path == '/__faults':
+            self.set_faults(**(body or {}))
+            return 200, {'latency': self.latency, 'error_rate': self.error_rate, 'error_status': self.error_status}
+
+        if method == 'POST' and path == '/__tokens':
+            body = body or {}
+            if body.get('role') not in ROLE_PERMISSIONS:
+                return 400, {'message': f'role must be one of {sorted(ROLE_PERMISSIONS)}'}
+            return 200, {'access_token': self.mint_token(body['role'], body.get('user_id'),
+                                                         body.get('expires_in', 3600))}
+
+        if self.error_rate and random.random() < self.error_rate:
+            return self.error_status, {'statusCode': self.error_status, 'message': 'Injected failure'}
+
+        if method == 'POST' and path == '/oauth/token':
+            return 200, {'access_token': 'stub-management-token', 'token_type': 'Bearer', 'expires_in': 86400}
+
+        if method == 'GET' and path == '/.well-known/jwks.json':
+            return 200, self.jwks
+
+        if method == 'GET' and path == '/api/v2/roles':
+            return 200, ROLES
+
+        if path == '/api/v2/users':
+            if method == 'GET':
+                users = list(self.users.values())
+                return 200, {'users': users, 'total': len(users), 'start': 0, 'limit': len(users)}
+            if method == 'POST':
+                with self._lock:
+                    user_id = f'auth0|user{len(self.users) + 1}'
+                    user = {'user_id': user_id, 'email': body.get('email'), 'name': body.get('name'), 'roles': []}
+                    self.users[user_id] = user
+                return 201, user
+
+        match = re.fullmatch(r'/api/v2/users/([^/]+)(/roles)?', path)
+        if match:
+            user_id, roles = match.groups()
+            user_id = unquote(user_id)
+            user = self.users.get(user_id)
+            if user is None:
+                return 404, {'statusCode': 404, 'message': 'The user does not exist.'}
+            if roles:
+                if method == 'POST':
+                    assigned = [role for role in ROLES if role['id'] in (body or {}).get('roles', [])]
+                    user['roles'] = [role for role in user.get('roles', []) if role not in assigned] + assigned
+                    return 204, None
+                return 200, user.get('roles', [])
+            if method == 'GET':
+                return 200, user
+            if method == 'PATCH':
+                user.update(body or {})
+                return 200, user
+            if method == 'DELETE':
+                with self._lock:
+                    self.users.pop(user_id, None)
+                return 204, None
+
+        return 404, {'statusCode': 404, 'message': 'Not found'}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _dispatch(self):
+                with stub._lock:
+                    stub.request_count += 1
+                if stub.latency and self.path != '/__faults':
+                    time.sleep(stub.latency)
+
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                status, payload = stub.handle(self.command, self.path, body)
+
+                data = b'' if payload is None else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _dispatch
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    args = parser.parse_args()
+
+    stub = Auth0Stub(port=args.port, latency=args.latency, error_rate=args.error_rate,
+                     error_status=args.error_status).start()
+    print(f'Auth0 stub listening on {stub.url}')
+    for role in ROLE_PERMISSIONS:
+        print(f'{role}: {stub.mint_token(role)}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
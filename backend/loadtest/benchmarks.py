@@ -0,0 +1,268 @@
+"""Performance regression gate: statement budgets and timing baselines.
+
+Two kinds of check, both against ``perf_baselines.json`` next to this file:
+
+statements
+    The number of SQL statements one request to an endpoint runs, counted by
+    the request log (``db_queries``).  It is checked exactly: going over the
+    budget usually means a new N+1 or a lost set-based statement, and going
+    under means the budget is stale and should be lowered.  Requests
+    run against the seed data plus ``EXTRA_ROWS`` cast actors and movies, so
+    per-row queries show up as a large overshoot.
+timings
+    Best-of-``repeat`` wall time of a hot path, in milliseconds.  A run fails
+    when it is slower than the baseline times ``tolerance``
+    (``PERF_TOLERANCE`` overrides it on slow machines).
+
+``PerformanceTestCase`` in ``src/test_app.py`` checks the statement budgets
+on every run; the timings (including the 100k-actor import) only run there
+with ``PERF_GATE=1``, and always run from this script.  After an intended
+change, or to record baselines on a new reference machine:
+
+    cd backend && python -m loadtest.benchmarks            # compare
+    cd backend && PERF_GATE=1 python -m pytest src/test_app.py -k Performance
+    cd backend && python -m loadtest.benchmarks --update   # rewrite baselines
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from collections import namedtuple
+from datetime import date
+from unittest.mock import patch
+
+from flask import g
+
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perf_baselines.json')
+DEFAULT_TOLERANCE = 3.0
+EXTRA_ROWS = 100
+
+# (method, path, json body); ids past the seed data come from add_catalog_rows.
+STATEMENT_SCENARIOS = (
+    ('GET', '/movies', None),
+    ('GET', '/movies?sort=cast_count', None),
+    ('GET', '/actors', None),
+    ('GET', '/movies/1', None),
+    ('GET', '/movies/1?include_actors=true', None),
+    ('GET', '/actors/1', None),
+    ('GET', '/movies/1/actors', None),
+    ('GET', '/actors/1/movies', None),
+    ('GET', '/actors/1/costars', None),
+    ('GET', '/search?q=the', None),
+    ('GET', '/stats/movies-by-year', None),
+    ('GET', '/stats/busiest-actors', None),
+    ('GET', '/changes', None),
+    ('POST', '/actors', {'name': 'Budget Actor', 'birth_date': '1990-01-01', 'gender': 'Female'}),
+    ('PATCH', '/actors/2', {'gender': 'Female'}),
+    ('POST', '/movies/5/actors/3', None),
+    ('DELETE', '/movies/5/actors/3', None),
+    ('DELETE', '/actors/4', None),
+)
+
+Benchmark = namedtuple('Benchmark', 'name repeat prepare')
+
+
+def load_baselines(path=BASELINES_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def tolerance(baselines):
+    return float(os.environ.get('PERF_TOLERANCE', baselines.get('tolerance', DEFAULT_TOLERANCE)))
+
+
+def scenario_key(method, path):
+    return f'{method} {path}'
+
+
+def add_catalog_rows(count=EXTRA_ROWS):
+    """``count`` actors and movies, each actor cast in the movie with its id"""
+    from sqlalchemy import insert
+
+    from src.database.models import Actor, Movie, db, movie_actor, rebuild_casting_counters
+    from src.database.search import rebuild_search_index
+
+    first_movie = db.session.query(db.func.max(Movie.id)).scalar() + 1
+    first_actor = db.session.query(db.func.max(Actor.id)).scalar() + 1
+    db.session.execute(insert(Movie), [
+        {'id': first_movie + n, 'title': f'Movie {n}', 'release_date': date(1950 + n % 70, 1, 1)}
+        for n in range(count)
+    ])
+    db.session.execute(insert(Actor), [
+        {'id': first_actor + n, 'name': f'Actor {n}', 'birth_date': date(1950 + n % 50, 1, 1), 'gender': 'Male'}
+        for n in range(count)
+    ])
+    db.session.execute(insert(movie_actor), [
+        {'movie_id': movie_id, 'actor_id': actor_id}
+        for n in range(count)
+        for movie_id, actor_id in ((first_movie + n, first_actor + n), (1, first_actor + n))
+    ])
+    db.session.commit()
+    rebuild_casting_counters()
+    rebuild_search_index(db.session)
+
+
+def count_statements(app, method, path, body=None):
+    """``(status, statements)`` for one request, from the request log's timings"""
+    with app.test_client() as client:
+        response = client.open(path, method=method, json=body)
+        return response.status_code, g.timings.db_queries
+
+
+def measure_statements(app):
+    from src.database.models import Tombstone, db, utcnow
+
+    # Periodic housekeeping would add a statement to whichever request runs
+    # it first; get it out of the way so counts do not depend on test order.
+    with app.app_context():
+        Tombstone.purge_expired(utcnow())
+        db.session.commit()
+    return {
+        scenario_key(method, path): count_statements(app, method, path, body)
+        for method, path, body in STATEMENT_SCENARIOS
+    }
+
+
+def _serialize_actors():
+    from src.database.models import Actor
+
+    actors = []
+    for n in range(10000):
+        actor = Actor(name=f'Actor {n}', birth_date=date(1940 + n % 60, 1 + n % 12, 1 + n % 28), gender='Female')
+        actor.id, actor.filmography_count, actor.version = n + 1, n % 7, 1
+        actors.append(actor)
+    return lambda: json.dumps([actor.format() for actor in actors]), None
+
+
+def _verify_tokens():
+    from loadtest.auth0_stub import Auth0Stub
+    from src.auth.auth import verify_decode_jwt
+
+    stub = Auth0Stub(key_bits=1024)
+    tokens = [stub.mint_token('Casting Director', user_id=f'auth0|user{n}') for n in range(100)]
+    jwks = stub.jwks
+
+    def run():
+        with patch('src.auth.auth.fetch_jwks', return_value=jwks):
+            for token in tokens:
+                verify_decode_jwt(token)
+    return run, None
+
+
+def _filter_users():
+    from loadtest.policy_benchmark import ROLE_PERMISSIONS, make_users
+    from src.auth.role_hierarchy import filter_users_by_access_level
+
+    users = make_users(1000)
+    director = ROLE_PERMISSIONS['Casting Director']
+
+    def run():
+        for _ in range(100):
+            filter_users_by_access_level(users, director)
+    return run, None
+
+
+def _bulk_import():
+    from sqlalchemy import delete, insert
+
+    from src.database.models import Actor, db
+    from src.database.search import rebuild_search_index
+
+    rng = random.Random(7)
+    rows = [
+        {'name': f'Imported Actor {n}', 'birth_date': date(rng.randint(1930, 2005), rng.randint(1, 12), 1),
+         'gender': rng.choice(['Female', 'Male'])}
+        for n in range(100000)
+    ]
+    first_id = db.session.query(db.func.max(Actor.id)).scalar() + 1
+
+    def run():
+        db.session.execute(insert(Actor), rows)
+        db.session.commit()
+        rebuild_search_index(db.session)
+
+    def reset():
+        db.session.execute(delete(Actor).where(Actor.id >= first_id))
+        db.session.commit()
+        rebuild_search_index(db.session)
+    return run, reset
+
+
+BENCHMARKS = (
+    Benchmark('serialize_10k_actors', 3, _serialize_actors),
+    Benchmark('verify_100_tokens', 3, _verify_tokens),
+    Benchmark('filter_1k_users_x100', 3, _filter_users),
+    Benchmark('bulk_import_100k_actors', 1, _bulk_import),
+)
+
+
+def time_benchmark(benchmark):
+    """Best of ``benchmark.repeat`` runs in milliseconds; needs an app context"""
+    run, reset = benchmark.prepare()
+    best = None
+    for _ in range(benchmark.repeat):
+        started = time.perf_counter()
+        run()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+        if reset is not None:
+            reset()
+    return best
+
+
+def build_app(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['SKIP_AUTH'] = 'true'
+    from src.app import create_app
+    from src.database.models import db_drop_and_create_all
+
+    app = create_app()
+    with app.app_context():
+        db_drop_and_create_all()
+        add_catalog_rows()
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--update', action='store_true', help='write the measured values as the new baselines')
+    args = parser.parse_args()
+
+    baselines = load_baselines()
+    limit = tolerance(baselines)
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(f'sqlite:///{os.path.join(tmp, "benchmarks.db")}')
+        statements = measure_statements(app)
+        with app.app_context():
+            timings = {benchmark.name: round(time_benchmark(benchmark), 1) for benchmark in BENCHMARKS}
+
+    print(f'{"statements":<36} {"budget":>8} {"actual":>8}')
+    for key, (status, count) in statements.items():
+        budget = baselines['statements'].get(key)
+        off = '  NEW' if budget is None else '  OVER' if count > budget else '  UNDER' if count < budget else ''
+        failed |= bool(off)
+        print(f'{key:<36} {budget if budget is not None else "-":>8} {count:>8}  {status}{off}')
+    print(f'\n{"timings (ms, tolerance x" + str(limit) + ")":<36} {"baseline":>8} {"actual":>8}')
+    for name, elapsed in timings.items():
+        baseline = baselines['timings_ms'].get(name)
+        slow = baseline is None or elapsed > baseline * limit
+        failed |= slow
+        print(f'{name:<36} {baseline if baseline is not None else "-":>8} {elapsed:>8}{"  SLOW" if slow else ""}')
+
+    if args.update:
+        baselines['statements'] = {key: count for key, (_, count) in statements.items()}
+        baselines['timings_ms'] = timings
+        with open(BASELINES_PATH, 'w') as f:
+            json.dump(baselines, f, indent=2)
+            f.write('\n')
+        print(f'\nBaselines written to {BASELINES_PATH}')
+    elif failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Micro-benchmark for the role hierarchy policy over a large user list.
+
+Times ``filter_users_by_access_level`` and per-user manage decisions for a
+Casting Director over synthetic users, next to the previous list-scanning
+level resolution for comparison.
+
+    cd backend && python -m loadtest.policy_benchmark --users 10000
+"""
+import argparse
+import random
+import timeit
+
+from src.auth import role_hierarchy
+from src.auth.role_hierarchy import (
+    ROLE_HIERARCHY,
+    can_manage_user,
+    compile_permissions,
+    filter_users_by_access_level,
+)
+
+
+ROLE_PERMISSIONS = {
+    'Casting Assistant': ['get:movies', 'get:actors', 'get:movie-actors', 'get:actor-movies'],
+    'Casting Director': [
+        'get:movies', 'get:actors', 'get:movie-actors', 'get:actor-movies',
+        'post:actors', 'delete:actors', 'patch:actors', 'patch:movies',
+        'post:movie-actors', 'delete:movie-actors', 'get:users', 'get:roles'
+    ],
+    'Executive Producer': [
+        'get:movies', 'get:actors', 'get:movie-actors', 'get:actor-movies',
+        'post:actors', 'delete:actors', 'patch:actors', 'patch:movies',
+        'post:movie-actors', 'delete:movie-actors', 'get:users', 'get:roles',
+        'post:movies', 'delete:movies', 'post:users', 'patch:users', 'delete:users'
+    ],
+}
+
+
+def list_scan_level(permissions):
+    """Level resolution as it was before the policy was compiled."""
+    if not permissions:
+        return 0
+    if 'delete:movies' in permissions and 'post:movies' in permissions:
+        return ROLE_HIERARCHY['Executive Producer']
+    if 'delete:actors' in permissions or 'post:actors' in permissions:
+        return ROLE_HIERARCHY['Casting Director']
+    if 'get:movies' in permissions or 'get:actors' in permissions:
+        return ROLE_HIERARCHY['Casting Assistant']
+    return 0
+
+
+def list_scan_can_manage(manager_permissions, target_user_roles):
+    manager_level = list_scan_level(manager_permissions)
+    target_level = 0
+    for role in target_user_roles:
+        target_level = max(target_level, ROLE_HIERARCHY.get(role.get('name', ''), 0))
+    if manager_level == ROLE_HIERARCHY['Executive Producer']:
+        return target_level < ROLE_HIERARCHY['Executive Producer']
+    if manager_level == ROLE_HIERARCHY['Casting Director']:
+        return target_level <= ROLE_HIERARCHY['Casting Assistant']
+    return False
+
+
+def list_scan_filter(users, manager_permissions):
+    if list_scan_level(manager_permissions) != ROLE_HIERARCHY['Casting Director']:
+        return users
+    return [
+        user for user in users
+        if list_scan_level(user.get('permissions', [])) <= ROLE_HIERARCHY['Casting Assistant']
+    ]
+
+
+def make_users(count, seed=7):
+    rng = random.Random(seed)
+    roles = list(ROLE_PERMISSIONS)
+    users = []
+    for index in range(count):
+        role = rng.choice(roles)
+        users.append({
+            'user_id': f'auth0|{index}',
+            'permissions': list(ROLE_PERMISSIONS[role]),
+            'roles': [{'name': role}],
+        })
+    return users
+
+
+def report(label, seconds, repeat, users):
+    per_call = seconds / repeat
+    print(f"{label:<28} {per_call * 1000:9.3f} ms/call {per_call / users * 1e9:9.1f} ns/user")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    users = make_users(args.users)
+    director = ROLE_PERMISSIONS['Casting Director']
+    assert list_scan_filter(users, director) == filter_users_by_access_level(users, director)
+
+    def list_scan_decide_all():
+        for user in users:
+            list_scan_can_manage(director, user['roles'])
+
+    def compiled_decide_all():
+        policy = compile_permissions(director)
+        for user in users:
+            can_manage_user(policy, user['roles'])
+
+    print(f"{args.users} users, best of 3 x {args.repeat} runs")
+    benchmarks = (
+        ('filter (list scan)', lambda: list_scan_filter(users, director)),
+        ('filter (compiled)', lambda: filter_users_by_access_level(users, director)),
+        ('manage (list scan)', list_scan_decide_all),
+        ('manage (compiled)', compiled_decide_all),
+    )
+    for label, function in benchmarks:
+        role_hierarchy._compile.cache_clear()
+        best = min(timeit.repeat(function, number=args.repeat, repeat=3))
+        report(label, best, args.repeat, args.users)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""Replay a realistic mix of catalog and user-management traffic.
+
+Starts the Auth0 stub and the API under gunicorn with real token checks
+(``SKIP_AUTH=false``), or targets a running server with ``--base-url`` and
+``--stub-url``; without a stub, only the anonymous scenarios run.  Clients
+pick a scenario by weight for every request, each with a token minted by the
+stub for the role that normally makes that call, and the run reports
+throughput and latency percentiles per scenario.
+
+    cd backend && python -m loadtest.traffic_mix --duration 30 --clients 16
+    cd backend && python -m loadtest.traffic_mix --mix browse=50,search=20,users=30
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import requests
+
+from .auth0_latency import free_port, percentile, start_server
+from .auth0_stub import Auth0Stub
+
+
+Scenario = namedtuple('Scenario', 'name weight role request')
+
+MOVIE_IDS = range(1, 6)
+ACTOR_IDS = range(1, 6)
+SEARCH_TERMS = ('the', 'god', 'dark', 'pulp', 'forr', 'tom', 'morgan')
+
+
+def _browse(rng):
+    return 'GET', rng.choice(['/movies', '/actors']), None
+
+
+def _details(rng):
+    if rng.random() < 0.5:
+        return 'GET', f'/movies/{rng.choice(MOVIE_IDS)}?include_actors=true', None
+    return 'GET', f'/actors/{rng.choice(ACTOR_IDS)}/movies', None
+
+
+def _search(rng):
+    return 'GET', f'/search?q={rng.choice(SEARCH_TERMS)}', None
+
+
+def _stats(rng):
+    return 'GET', rng.choice(['/stats/movies-by-year', '/stats/busiest-actors', '/stats/cast-sizes']), None
+
+
+def _edit_actor(rng):
+    return 'PATCH', f'/actors/{rng.choice(ACTOR_IDS)}', {'age': rng.randint(20, 80)}
+
+
+def _casting(rng):
+    method = rng.choice(['POST', 'DELETE'])
+    return method, f'/movies/{rng.choice(MOVIE_IDS)}/actors/{rng.choice(ACTOR_IDS)}', None
+
+
+def _users(rng):
+    return 'GET', rng.choice(['/users', '/roles', f'/users/auth0%7Cuser{rng.randint(1, 50)}/roles']), None
+
+
+SCENARIOS = (
+    Scenario('browse', 40, None, _browse),
+    Scenario('details', 20, 'Casting Assistant', _details),
+    Scenario('search', 10, 'Casting Assistant', _search),
+    Scenario('stats', 5, 'Casting Assistant', _stats),
+    Scenario('edit_actor', 8, 'Casting Director', _edit_actor),
+    Scenario('casting', 5, 'Casting Director', _casting),
+    Scenario('users', 12, 'Executive Producer', _users),
+)
+
+
+def parse_mix(text):
+    """``name=weight,...`` over the default scenarios; unnamed ones drop out"""
+    if not text:
+        return SCENARIOS
+    weights = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight)
+    unknown = set(weights) - {scenario.name for scenario in SCENARIOS}
+    if unknown:
+        raise ValueError(f'unknown scenarios: {", ".join(sorted(unknown))}')
+    return tuple(scenario._replace(weight=weights[scenario.name]) for scenario in SCENARIOS if scenario.name in weights)
+
+
+def mint_tokens(stub_url, scenarios):
+    tokens = {}
+    for role in {scenario.role for scenario in scenarios if scenario.role}:
+        response = requests.post(f'{stub_url}/__tokens', json={'role': role}, timeout=30)
+        response.raise_for_status()
+        tokens[role] = response.json()['access_token']
+    return tokens
+
+
+def drive(base_url, scenarios, tokens, clients, duration, seed=0):
+    """Run ``clients`` looping clients; return ``{scenario: {'latencies', 'statuses'}}``"""
+    results = {scenario.name: {'latencies': [], 'statuses': {}} for scenario in scenarios}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+    weights = [scenario.weight for scenario in scenarios]
+
+    def client(number):
+        rng = random.Random(seed + number)
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            scenario = rng.choices(scenarios, weights)[0]
+            method, path, body = scenario.request(rng)
+            headers = {'Accept-Encoding': 'gzip'}
+            if scenario.role:
+                headers['Authorization'] = f'Bearer {tokens[scenario.role]}'
+            started = time.perf_counter()
+            try:
+                status = session.request(method, base_url + path, json=body, headers=headers, timeout=60).status_code
+            except requests.RequestException:
+                status = 'error'
+            elapsed = time.perf_counter() - started
+            with lock:
+                result = results[scenario.name]
+                result['latencies'].append(elapsed)
+                result['statuses'][status] = result['statuses'].get(status, 0) + 1
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results, duration):
+    rows = []
+    everything = []
+    for name, result in results.items():
+        latencies = result['latencies']
+        everything.extend(latencies)
+        rows.append((name, latencies, result['statuses']))
+    rows.append(('total', everything, {}))
+
+    lines = [f'{"scenario":<12} {"req/s":>8} {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"max ms":>8}  statuses']
+    for name, latencies, statuses in rows:
+        statuses = ' '.join(f'{status}:{count}' for status, count in sorted(statuses.items(), key=str))
+        lines.append(
+            f'{name:<12} {len(latencies) / duration:8.1f} '
+            f'{percentile(latencies, 0.50) * 1000:8.1f} {percentile(latencies, 0.90) * 1000:8.1f} '
+            f'{percentile(latencies, 0.99) * 1000:8.1f} {max(latencies, default=0) * 1000:8.1f}  {statuses}'
+        )
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--mix', help='name=weight,... over: ' + ', '.join(scenario.name for scenario in SCENARIOS))
+    parser.add_argument('--auth0-latency', type=float, default=0.05, help='seconds added to every stub response')
+    parser.add_argument('--auth0-error-rate', type=float, default=0.0)
+    parser.add_argument('--worker-class', default='gevent')
+    parser.add_argument('--base-url', help='drive a running server instead of starting one')
+    parser.add_argument('--stub-url', help='stub the running server trusts (with --base-url)')
+    args = parser.parse_args()
+    scenarios = parse_mix(args.mix)
+
+    if args.base_url:
+        if args.stub_url:
+            tokens = mint_tokens(args.stub_url, scenarios)
+        else:
+            # No stub to mint tokens from: only anonymous scenarios can run.
+            dropped = [scenario.name for scenario in scenarios if scenario.role]
+            scenarios = tuple(scenario for scenario in scenarios if not scenario.role)
+            if not scenarios:
+                parser.error('every scenario in the mix needs a token; pass --stub-url')
+            if dropped:
+                print(f'warning: no --stub-url, skipping scenarios that need a token: {", ".join(dropped)}')
+            tokens = {}
+        print(summarize(drive(args.base_url, scenarios, tokens, args.clients, args.duration), args.duration))
+        return
+
+    stub = Auth0Stub(latency=args.auth0_latency, error_rate=args.auth0_error_rate).start()
+    try:
+        tokens = {role: stub.mint_token(role) for role in {scenario.role for scenario in scenarios if scenario.role}}
+        with tempfile.TemporaryDirectory() as tmp:
+            database_url = f'sqlite:///{os.path.join(tmp, "loadtest.db")}'
+            process, base_url = start_server(args.worker_class, stub.url, database_url, free_port(),
+                                             extra_env={'SKIP_AUTH': 'false'})
+            try:
+                requests.post(base_url + '/setup-db', timeout=30)
+                print(f'{args.worker_class} worker, {args.clients} clients, {args.duration:.0f}s, '
+                      f'Auth0 latency {args.auth0_latency * 1000:.0f} ms')
+                print(summarize(drive(base_url, scenarios, tokens, args.clients, args.duration), args.duration))
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
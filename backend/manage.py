@@ -2,23 +2,32 @@
 """
 Database migration management script using Flask-Migrate
 """
-from flask_migrate import Migrate, init, migrate as migrate_cmd, upgrade, downgrade
-from src.app import create_app
+import sys
 
-app = create_app()
 
-if __name__ == '__main__':
-    import sys
+def create_cli_app():
+    """Database and migrations only: no routes, CORS or Auth0 clients"""
+    from flask import Flask
+    from src.database.models import setup_db
+
+    app = Flask('src')
+    setup_db(app)
+    return app
 
-    with app.app_context():
+
+if __name__ == '__main__':
+    with create_cli_app().app_context():
         if len(sys.argv) < 2:
-            print("Usage: python manage.py [init|migrate|upgrade|downgrade|seed]")
+            print("Usage: python manage.py [init|migrate|upgrade|downgrade|seed|reindex|recount|worker]")
             print("\nCommands:")
             print("  init      - Initialize migrations directory")
             print("  migrate   - Create a new migration")
             print("  upgrade   - Apply migrations to database")
             print("  downgrade - Revert last migration")
             print("  seed      - Seed database with demo data")
+            print("  reindex   - Rebuild the movie/actor search index")
+            print("  recount   - Rebuild cast_count/filmography_count counters")
+            print("  worker    - Run background jobs (--once to drain the queue and exit)")
             sys.exit(1)
 
         command = sys.argv[1]
@@ -54,7 +63,28 @@ if __name__ == '__main__':
             db_drop_and_create_all()
             print("Database seeded successfully!")
 
+        elif command == 'reindex':
+            print("Rebuilding search index...")
+            from src.database.models import db
+            from src.database.search import rebuild_search_index
+            rebuild_search_index(db.session)
+            print("Search index rebuilt!")
+
+        elif command == 'recount':
+            print("Rebuilding casting counters...")
+            from src.database.models import rebuild_casting_counters
+            rebuild_casting_counters()
+            print("Casting counters rebuilt!")
+
+        elif command == 'worker':
+            from src.jobs.worker import run_worker
+            if '--once' in sys.argv[2:]:
+                print(f"Ran {run_worker(once=True)} job(s)")
+            else:
+                print("Worker started, waiting for jobs...")
+                run_worker()
+
         else:
             print(f"Unknown command: {command}")
-            print("Available commands: init, migrate, upgrade, downgrade, seed")
+            print("Available commands: init, migrate, upgrade, downgrade, seed, reindex, recount, worker")
             sys.exit(1)
\ No newline at end of file
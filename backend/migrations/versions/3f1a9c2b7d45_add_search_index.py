@@ -0,0 +1,40 @@
+"""Add search index
+
+Revision ID: 3f1a9c2b7d45
+Revises: d27895d09910
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a9c2b7d45'
+down_revision = 'd27895d09910'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(label, tokenize='trigram')")
+        op.execute("INSERT INTO search_index (rowid, label) SELECT id * 2, title FROM movies")
+        op.execute("INSERT INTO search_index (rowid, label) SELECT id * 2 + 1, name FROM actors")
+
+    elif dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_movies_title_trgm ON movies USING gin (title gin_trgm_ops)")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_actors_name_trgm ON actors USING gin (name gin_trgm_ops)")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS search_index")
+
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_actors_name_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_movies_title_trgm")
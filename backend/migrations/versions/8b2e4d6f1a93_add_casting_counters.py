@@ -0,0 +1,46 @@
+"""Add casting counters
+
+Revision ID: 8b2e4d6f1a93
+Revises: 3f1a9c2b7d45
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f1a93'
+down_revision = '3f1a9c2b7d45'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.add_column(sa.Column('cast_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_index('ix_movies_cast_count', ['cast_count'])
+
+    with op.batch_alter_table('actors') as batch_op:
+        batch_op.add_column(sa.Column('filmography_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_index('ix_actors_filmography_count', ['filmography_count'])
+
+    if sa.inspect(op.get_bind()).has_table('movie_actor'):
+        op.execute(
+            "UPDATE movies SET cast_count = "
+            "(SELECT count(*) FROM movie_actor WHERE movie_actor.movie_id = movies.id)"
+        )
+        op.execute(
+            "UPDATE actors SET filmography_count = "
+            "(SELECT count(*) FROM movie_actor WHERE movie_actor.actor_id = actors.id)"
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('actors') as batch_op:
+        batch_op.drop_index('ix_actors_filmography_count')
+        batch_op.drop_column('filmography_count')
+
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.drop_index('ix_movies_cast_count')
+        batch_op.drop_column('cast_count')
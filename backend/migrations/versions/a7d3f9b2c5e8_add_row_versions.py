@@ -0,0 +1,32 @@
+"""Add row versions to movies and actors
+
+Revision ID: a7d3f9b2c5e8
+Revises: f6c2d8e4a1b7
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3f9b2c5e8'
+down_revision = 'f6c2d8e4a1b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+    with op.batch_alter_table('actors') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('actors') as batch_op:
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,27 @@
+"""Add search prefix indexes
+
+Revision ID: b3e8f1c6d2a4
+Revises: a7d3f9b2c5e8
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8f1c6d2a4'
+down_revision = 'a7d3f9b2c5e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE INDEX IF NOT EXISTS ix_movies_title_prefix ON movies (lower(title))")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_actors_name_prefix ON actors (lower(name))")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("DROP INDEX IF EXISTS ix_actors_name_prefix")
+        op.execute("DROP INDEX IF EXISTS ix_movies_title_prefix")
@@ -0,0 +1,63 @@
+"""Add delta sync tracking
+
+Revision ID: c4d7e9a2f816
+Revises: 8b2e4d6f1a93
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d7e9a2f816'
+down_revision = '8b2e4d6f1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                      server_default=sa.func.current_timestamp()))
+        batch_op.create_index('ix_movies_updated_at', ['updated_at'])
+
+    with op.batch_alter_table('actors') as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                      server_default=sa.func.current_timestamp()))
+        batch_op.create_index('ix_actors_updated_at', ['updated_at'])
+
+    if sa.inspect(op.get_bind()).has_table('movie_actor'):
+        with op.batch_alter_table('movie_actor') as batch_op:
+            batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=False,
+                                          server_default=sa.func.current_timestamp()))
+            batch_op.create_index('ix_movie_actor_created_at', ['created_at'])
+
+    op.create_table('tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=True),
+    sa.Column('movie_id', sa.Integer(), nullable=True),
+    sa.Column('actor_id', sa.Integer(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstones_deleted_at', 'tombstones', ['deleted_at'])
+
+
+def downgrade():
+    op.drop_index('ix_tombstones_deleted_at', table_name='tombstones')
+    op.drop_table('tombstones')
+
+    if sa.inspect(op.get_bind()).has_table('movie_actor'):
+        with op.batch_alter_table('movie_actor') as batch_op:
+            batch_op.drop_index('ix_movie_actor_created_at')
+            batch_op.drop_column('created_at')
+
+    with op.batch_alter_table('actors') as batch_op:
+        batch_op.drop_index('ix_actors_updated_at')
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.drop_index('ix_movies_updated_at')
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,48 @@
+"""Record job creator levels and drop plaintext job passwords
+
+Revision ID: c9d4e2f7a1b6
+Revises: b3e8f1c6d2a4
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9d4e2f7a1b6'
+down_revision = 'b3e8f1c6d2a4'
+branch_labels = None
+depends_on = None
+
+
+jobs = sa.table(
+    'jobs',
+    sa.column('id', sa.Integer),
+    sa.column('status', sa.String),
+    sa.column('payload', sa.JSON),
+    sa.column('error', sa.Text),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('jobs') as batch_op:
+        batch_op.add_column(sa.Column('created_by_level', sa.Integer(), nullable=True))
+
+    # Passwords queued before they were encrypted are removed; those jobs
+    # cannot run any more and have to be submitted again.
+    bind = op.get_bind()
+    for job_id, payload in bind.execute(sa.select(jobs.c.id, jobs.c.payload)):
+        if payload and 'password' in payload:
+            bind.execute(
+                jobs.update().where(jobs.c.id == job_id).values(
+                    status='failed',
+                    payload={key: value for key, value in payload.items() if key != 'password'},
+                    error='Queued with an unencrypted password; create the user again'
+                )
+            )
+
+
+def downgrade():
+    with op.batch_alter_table('jobs') as batch_op:
+        batch_op.drop_column('created_by_level')
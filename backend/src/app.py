@@ -1,8 +1,30 @@
-from flask import Flask, request, abort, jsonify
-from flask_sqlalchemy import SQLAlchemy
-from flask_cors import CORS
-from .database.models import db_drop_and_create_all, setup_db, Movie, Actor
-from .auth.auth import AuthError, requires_auth
+import hashlib
+import hmac
+import os
+from flask import Flask, Response, request, abort, jsonify
+from .database.models import (
+    db,
+    db_drop_and_create_all,
+    setup_db,
+    adjust_casting_counters,
+    Movie,
+    Actor,
+    Tombstone,
+    Job
+)
+from .database.changes import InvalidCursorError, ResyncRequiredError, changes_since
+from .events.feed import stream_events
+from .database.search import SEARCH_KINDS, SearchQueryError, search_catalog
+from .database.costar_graph import costar_index
+from .database.signals import notify_catalog_change
+from .database.stats import (
+    stats_cache,
+    movies_per_year,
+    cast_size_distribution,
+    actors_by_gender,
+    busiest_actors
+)
+from .auth.auth import SKIP_AUTH, AuthError, current_principal, requires_auth
 from .auth.auth0_management import (
     Auth0ManagementError,
     get_management_api_token,
@@ -17,48 +39,170 @@ from .auth.auth0_management import (
 )
 from .auth.role_hierarchy import (
     filter_users_by_access_level,
-    get_user_role_level,
     enforce_user_management_access,
     enforce_role_assignment_access,
-    get_assignable_roles
+    get_assignable_roles,
+    PRODUCER_LEVEL
 )
+from .jobs.queue import can_seal_secrets, enqueue
+from .jobs.tasks import ASSIGN_USER_ROLES, PROVISION_USER
+from .idempotency import idempotent
+from .resilience import ConcurrencyLimit
+from .compression import compress_response
+from .cors import CorsPolicy, cors_origins
+from .singleflight import SingleFlight, coalesce_reads
+from .metrics import register_metric, render_metrics
+from .profiling import init_profiling, profiler
+from .public_catalog import public_catalog
+from .rate_limit import init_rate_limits, rate_limited
+from .request_log import init_request_logging, log_handler_error
+from .warmup import BEST_EFFORT_STEPS, WarmUp, default_steps, warmup_enabled
 from datetime import datetime
 
 
 def create_app(test_config=None):
     app = Flask(__name__)
     setup_db(app)
-
-    CORS(app, resources={
-        r"/*": {
-            "origins": [
-                "http://localhost:4200",
-                "http://127.0.0.1:4200",
-                "https://casting-agency-frontend.onrender.com",
-                "https://casting-agency-frontend-oj6g.onrender.com"
-            ],
-            "methods": ["GET", "POST", "PATCH", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
-            "supports_credentials": True
-        }
-    })
-
-    # CORS Headers
-    @app.after_request
-    def after_request(response):
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,true')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PATCH,DELETE,OPTIONS')
+    # First hooks in, so the access log covers everything below.
+    init_request_logging(app)
+    # Armed through /profiling; a no-op check otherwise.
+    init_profiling(app)
+
+    CorsPolicy(
+        origins=cors_origins(),
+        methods=['GET', 'POST', 'PATCH', 'DELETE', 'OPTIONS'],
+        allow_headers=['Content-Type', 'Authorization', 'Prefer', 'Idempotency-Key', 'If-Match', 'X-Request-ID'],
+        expose_headers=[
+            'ETag', 'Location', 'X-Request-ID', 'Retry-After',
+            'RateLimit-Policy', 'RateLimit-Limit', 'RateLimit-Remaining', 'RateLimit-Reset'
+        ]
+    ).init_app(app)
+
+    # Token buckets per caller, checked after CORS so preflights are free;
+    # see src/rate_limit.py.
+    init_rate_limits(app)
+
+    # gzip/brotli/zstd for large text bodies; see src/compression.py.
+    app.after_request(compress_response)
+
+    # User management handlers wait on Auth0; cap how many may be in flight
+    # so a slow tenant cannot take every connection from catalog traffic.
+    user_management_limit = ConcurrencyLimit(
+        'user management',
+        int(os.environ.get('USER_MANAGEMENT_CONCURRENCY', 10))
+    )
+    register_metric(
+        'user_management_in_flight', 'gauge',
+        'User management requests currently in flight',
+        lambda: user_management_limit.in_flight
+    )
+    register_metric(
+        'user_management_rejected_total', 'counter',
+        'User management requests refused with 503',
+        lambda: user_management_limit.rejected
+    )
+
+    # Opt-in (WARMUP_ON_START): open a DB connection and preload Auth0 keys
+    # and the token in the background; /ready waits for the database only.
+    warmup = app.extensions['warmup'] = WarmUp(
+        app, default_steps(SKIP_AUTH) if warmup_enabled() else {}, best_effort=BEST_EFFORT_STEPS
+    )
+
+    # Identical concurrent catalog reads share one query and serialization.
+    catalog_reads = SingleFlight('catalog_reads')
+
+    # Slow Auth0 writes can run on the job worker instead of the request.
+    # USER_JOBS_ASYNC makes that the default; clients can opt in per request
+    # with `Prefer: respond-async`.  Neither applies unless JOB_WORKER_ENABLED
+    # says a `manage.py worker` process is deployed to run the jobs.
+    job_worker_enabled = os.environ.get('JOB_WORKER_ENABLED', 'False').lower() == 'true'
+    user_jobs_async = os.environ.get('USER_JOBS_ASYNC', 'False').lower() == 'true'
+
+    def wants_async():
+        if not job_worker_enabled:
+            return False
+        return user_jobs_async or 'respond-async' in request.headers.get('Prefer', '')
+
+    def job_accepted(job):
+        response = jsonify({
+            'success': True,
+            'job': job.format()
+        })
+        response.headers['Location'] = f'/jobs/{job.id}'
+        return response, 202
+
+    def if_match_versions():
+        """Row versions named by If-Match, or None when any version will do"""
+        if_match = request.if_match
+        if not if_match or if_match.star_tag:
+            return None
+        versions = (tag.partition('-')[0] for tag in if_match.as_set())
+        return [int(version) for version in versions if version.isdigit()]
+
+    def abort_missing_or_modified(model, row_id, versions):
+        # Only reached when the conditional write matched no row.
+        if versions is not None and db.session.get(model, row_id) is not None:
+            abort(412)
+        abort(404)
+
+    def with_etag(response, version):
+        # "<version>-<digest>": If-Match only reads the version, while the body
+        # digest tells apart representations of one version (include_actors,
+        # casting counters that change without a version bump).
+        digest = hashlib.sha1(response.get_data()).hexdigest()[:16]
+        response.set_etag(f'{version}-{digest}')
         return response
 
+    def auth0_error_response(error):
+        response = jsonify({
+            'success': False,
+            'error': error.status_code,
+            'message': error.message
+        })
+        if error.retry_after is not None:
+            response.headers['Retry-After'] = str(error.retry_after)
+        return response, error.status_code
+
     # ROUTES
 
     @app.route('/')
+    @rate_limited(None)
     def index():
         return jsonify({
             'success': True,
             'message': 'Welcome to the Casting Agency API'
         })
 
+    @app.route('/ready')
+    @rate_limited(None)
+    def ready():
+        """Readiness for health checks: 503 until the blocking warm-up steps succeed"""
+        is_ready = warmup.ready
+        response = jsonify({
+            'success': is_ready,
+            'ready': is_ready,
+            'checks': warmup.status()
+        })
+        if not is_ready:
+            response.headers['Retry-After'] = '1'
+        return response, 200 if is_ready else 503
+
+    # Metrics show traffic, errors and breaker state, so scrapers present
+    # METRICS_TOKEN as a bearer token; without one the route does not exist.
+    metrics_token = os.environ.get('METRICS_TOKEN')
+
+    @app.route('/metrics')
+    def metrics():
+        if not metrics_token:
+            abort(404)
+        presented = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(presented.encode(), metrics_token.encode()):
+            raise AuthError({
+                'code': 'unauthorized',
+                'description': 'A valid metrics token is required.'
+            }, 401)
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
     @app.route('/setup-db', methods=['POST'])
     def setup_database():
         """Initialize the database with tables and demo data
@@ -73,20 +217,51 @@ def create_app(test_config=None):
                 'message': 'Database initialized successfully with demo data'
             }), 200
         except Exception as e:
+            log_handler_error(e)
             return jsonify({
                 'success': False,
                 'error': 500,
                 'message': f'Database initialization failed: {str(e)}'
             }), 500
 
+    # PUBLIC CATALOG (anonymous and shared-cacheable; never reads a token)
+
+    def public_list(kind):
+        sort = request.args.get('sort', 'id')
+
+        if sort not in public_catalog.sorts(kind):
+            abort(400)
+
+        return public_catalog.response(kind, sort)
+
+    @app.route('/public/movies', methods=['GET'])
+    def get_public_movies():
+        """Get all movies from the prebuilt public list"""
+        return public_list('movies')
+
+    @app.route('/public/actors', methods=['GET'])
+    def get_public_actors():
+        """Get all actors from the prebuilt public list"""
+        return public_list('actors')
+
     # MOVIE ENDPOINTS
 
     @app.route('/movies', methods=['GET'])
     @requires_auth('get:movies')
+    @coalesce_reads(catalog_reads)
     def get_movies(payload):
         """Get all movies"""
+        sort_orders = {
+            'id': (Movie.id,),
+            'cast_count': (Movie.cast_count.desc(), Movie.id)
+        }
+        sort = request.args.get('sort', 'id')
+
+        if sort not in sort_orders:
+            abort(400)
+
         try:
-            movies = Movie.query.order_by(Movie.id).all()
+            movies = Movie.query.order_by(*sort_orders[sort]).all()
 
             return jsonify({
                 'success': True,
@@ -94,10 +269,12 @@ def create_app(test_config=None):
                 'total_movies': len(movies)
             })
         except Exception as e:
+            log_handler_error(e)
             abort(422)
 
     @app.route('/movies/<int:movie_id>', methods=['GET'])
     @requires_auth('get:movies')
+    @coalesce_reads(catalog_reads)
     def get_movie(payload, movie_id):
         """Get a specific movie by ID"""
         movie = Movie.query.get(movie_id)
@@ -108,13 +285,14 @@ def create_app(test_config=None):
         # Check if actors should be included
         include_actors = request.args.get('include_actors', 'false').lower() == 'true'
 
-        return jsonify({
+        return with_etag(jsonify({
             'success': True,
             'movie': movie.format(include_actors=include_actors)
-        })
+        }), movie.version)
 
     @app.route('/movies', methods=['POST'])
     @requires_auth('post:movies')
+    @idempotent
     def create_movie(payload):
         """Create a new movie"""
         body = request.get_json()
@@ -135,76 +313,91 @@ def create_app(test_config=None):
             movie = Movie(title=title, release_date=release_date_obj)
             movie.insert()
 
-            return jsonify({
+            return with_etag(jsonify({
                 'success': True,
                 'created': movie.id,
                 'movie': movie.format()
-            }), 201
+            }), movie.version), 201
         except ValueError:
             abort(400)
         except Exception as e:
+            log_handler_error(e)
             abort(422)
 
     @app.route('/movies/<int:movie_id>', methods=['PATCH'])
     @requires_auth('patch:movies')
     def update_movie(payload, movie_id):
         """Update a movie"""
-        movie = Movie.query.get(movie_id)
-
-        if movie is None:
-            abort(404)
-
         body = request.get_json()
 
         if not body:
             abort(400)
 
+        versions = if_match_versions()
+
         try:
+            values = {}
             if 'title' in body:
-                movie.title = body['title']
+                values['title'] = body['title']
 
             if 'release_date' in body:
-                release_date_obj = datetime.strptime(body['release_date'], '%Y-%m-%d').date()
-                movie.release_date = release_date_obj
+                values['release_date'] = datetime.strptime(body['release_date'], '%Y-%m-%d').date()
 
-            movie.update()
-
-            return jsonify({
-                'success': True,
-                'movie': movie.format()
-            })
+            movie = Movie.update_by_id(movie_id, values, versions)
         except ValueError:
             abort(400)
         except Exception as e:
+            log_handler_error(e)
+            db.session.rollback()
             abort(422)
 
+        if movie is None:
+            abort_missing_or_modified(Movie, movie_id, versions)
+
+        return with_etag(jsonify({
+            'success': True,
+            'movie': movie.format()
+        }), movie.version)
+
     @app.route('/movies/<int:movie_id>', methods=['DELETE'])
     @requires_auth('delete:movies')
     def delete_movie(payload, movie_id):
         """Delete a movie"""
-        movie = Movie.query.get(movie_id)
-
-        if movie is None:
-            abort(404)
+        versions = if_match_versions()
 
         try:
-            movie.delete()
-
-            return jsonify({
-                'success': True,
-                'deleted': movie_id
-            })
+            deleted = Movie.delete_by_id(movie_id, versions)
         except Exception as e:
+            log_handler_error(e)
+            db.session.rollback()
             abort(422)
 
+        if not deleted:
+            abort_missing_or_modified(Movie, movie_id, versions)
+
+        return jsonify({
+            'success': True,
+            'deleted': movie_id
+        })
+
     # ACTOR ENDPOINTS
 
     @app.route('/actors', methods=['GET'])
     @requires_auth('get:actors')
+    @coalesce_reads(catalog_reads)
     def get_actors(payload):
         """Get all actors"""
+        sort_orders = {
+            'id': (Actor.id,),
+            'filmography_count': (Actor.filmography_count.desc(), Actor.id)
+        }
+        sort = request.args.get('sort', 'id')
+
+        if sort not in sort_orders:
+            abort(400)
+
         try:
-            actors = Actor.query.order_by(Actor.id).all()
+            actors = Actor.query.order_by(*sort_orders[sort]).all()
 
             return jsonify({
                 'success': True,
@@ -212,11 +405,12 @@ def create_app(test_config=None):
                 'total_actors': len(actors)
             })
         except Exception as e:
-            print(e)
+            log_handler_error(e)
             abort(422)
 
     @app.route('/actors/<int:actor_id>', methods=['GET'])
     @requires_auth('get:actors')
+    @coalesce_reads(catalog_reads)
     def get_actor(payload, actor_id):
         """Get a specific actor by ID"""
         actor = Actor.query.get(actor_id)
@@ -227,13 +421,14 @@ def create_app(test_config=None):
         # Check if movies should be included
         include_movies = request.args.get('include_movies', 'false').lower() == 'true'
 
-        return jsonify({
+        return with_etag(jsonify({
             'success': True,
             'actor': actor.format(include_movies=include_movies)
-        })
+        }), actor.version)
 
     @app.route('/actors', methods=['POST'])
     @requires_auth('post:actors')
+    @idempotent
     def create_actor(payload):
         """Create a new actor"""
         body = request.get_json()
@@ -254,75 +449,81 @@ def create_app(test_config=None):
             actor = Actor(name=name, birth_date=birth_date_obj, gender=gender)
             actor.insert()
 
-            return jsonify({
+            return with_etag(jsonify({
                 'success': True,
                 'created': actor.id,
                 'actor': actor.format()
-            }), 201
+            }), actor.version), 201
         except ValueError:
             abort(400)
         except Exception as e:
+            log_handler_error(e)
             abort(422)
 
     @app.route('/actors/<int:actor_id>', methods=['PATCH'])
     @requires_auth('patch:actors')
     def update_actor(payload, actor_id):
         """Update an actor"""
-        actor = Actor.query.get(actor_id)
-
-        if actor is None:
-            abort(404)
-
         body = request.get_json()
 
         if not body:
             abort(400)
 
+        versions = if_match_versions()
+
         try:
+            values = {}
             if 'name' in body:
-                actor.name = body['name']
+                values['name'] = body['name']
 
             if 'birth_date' in body:
-                birth_date_obj = datetime.strptime(body['birth_date'], '%Y-%m-%d').date()
-                actor.birth_date = birth_date_obj
+                values['birth_date'] = datetime.strptime(body['birth_date'], '%Y-%m-%d').date()
 
             if 'gender' in body:
-                actor.gender = body['gender']
+                values['gender'] = body['gender']
 
-            actor.update()
-
-            return jsonify({
-                'success': True,
-                'actor': actor.format()
-            })
+            actor = Actor.update_by_id(actor_id, values, versions)
         except ValueError:
             abort(400)
         except Exception as e:
+            log_handler_error(e)
+            db.session.rollback()
             abort(422)
 
+        if actor is None:
+            abort_missing_or_modified(Actor, actor_id, versions)
+
+        return with_etag(jsonify({
+            'success': True,
+            'actor': actor.format()
+        }), actor.version)
+
     @app.route('/actors/<int:actor_id>', methods=['DELETE'])
     @requires_auth('delete:actors')
     def delete_actor(payload, actor_id):
         """Delete an actor"""
-        actor = Actor.query.get(actor_id)
-
-        if actor is None:
-            abort(404)
+        versions = if_match_versions()
 
         try:
-            actor.delete()
-
-            return jsonify({
-                'success': True,
-                'deleted': actor_id
-            })
+            deleted = Actor.delete_by_id(actor_id, versions)
         except Exception as e:
+            log_handler_error(e)
+            db.session.rollback()
             abort(422)
 
+        if not deleted:
+            abort_missing_or_modified(Actor, actor_id, versions)
+
+        return jsonify({
+            'success': True,
+            'deleted': actor_id
+        })
+
     # RELATIONSHIP ENDPOINTS
 
     @app.route('/movies/<int:movie_id>/actors', methods=['GET'])
     @requires_auth('get:movies')
+    @coalesce_reads(catalog_reads)
     def get_movie_actors(payload, movie_id):
         """Get all actors for a specific movie"""
         movie = Movie.query.get(movie_id)
@@ -335,11 +536,12 @@ def create_app(test_config=None):
             'movie_id': movie_id,
             'movie_title': movie.title,
             'actors': [actor.format() for actor in movie.actors],
-            'total_actors': len(movie.actors)
+            'total_actors': movie.cast_count
         })
 
     @app.route('/actors/<int:actor_id>/movies', methods=['GET'])
     @requires_auth('get:actors')
+    @coalesce_reads(catalog_reads)
     def get_actor_movies(payload, actor_id):
         """Get all movies for a specific actor"""
         actor = Actor.query.get(actor_id)
@@ -352,11 +554,12 @@ def create_app(test_config=None):
             'actor_id': actor_id,
             'actor_name': actor.name,
             'movies': [movie.format() for movie in actor.movies],
-            'total_movies': len(actor.movies)
+            'total_movies': actor.filmography_count
         })
 
     @app.route('/movies/<int:movie_id>/actors/<int:actor_id>', methods=['POST'])
     @requires_auth('post:casting')
+    @idempotent
     def assign_actor_to_movie(payload, movie_id, actor_id):
         """Assign an actor to a movie"""
         movie = Movie.query.get(movie_id)
@@ -374,8 +577,10 @@ def create_app(test_config=None):
                 }), 400
 
             movie.actors.append(actor)
+            adjust_casting_counters(movie_id, actor_id, 1)
             from src.database.models import db
             db.session.commit()
+            notify_catalog_change('casting', 'create', movie_id=movie_id, actor_id=actor_id)
 
             return jsonify({
                 'success': True,
@@ -383,6 +588,7 @@ def create_app(test_config=None):
                 'movie': movie.format(include_actors=True)
             }), 201
         except Exception as e:
+            log_handler_error(e)
             from src.database.models import db
             db.session.rollback()
             abort(422)
@@ -406,8 +612,11 @@ def create_app(test_config=None):
                 }), 400
 
             movie.actors.remove(actor)
+            adjust_casting_counters(movie_id, actor_id, -1)
+            Tombstone.record_casting(movie_id, actor_id)
             from src.database.models import db
             db.session.commit()
+            notify_catalog_change('casting', 'delete', movie_id=movie_id, actor_id=actor_id)
 
             return jsonify({
                 'success': True,
@@ -415,12 +624,243 @@ def create_app(test_config=None):
                 'movie': movie.format(include_actors=True)
             })
         except Exception as e:
+            log_handler_error(e)
             from src.database.models import db
             db.session.rollback()
             abort(422)
 
+    # CO-STAR GRAPH ENDPOINTS
+
+    @app.route('/actors/<int:actor_id>/costars', methods=['GET'])
+    @rate_limited('expensive')
+    @requires_auth('get:actors')
+    @coalesce_reads(catalog_reads)
+    def get_actor_costars(payload, actor_id):
+        """Get actors who worked with an actor, most frequent collaborators first"""
+        actor = Actor.query.get(actor_id)
+
+        if actor is None:
+            abort(404)
+
+        limit = request.args.get('limit', 50, type=int)
+
+        if limit < 1 or limit > 500:
+            abort(400)
+
+        costar_index.ensure_built(db.session)
+        total, ranked = costar_index.costars(actor_id, limit)
+        names = dict(
+            db.session.query(Actor.id, Actor.name)
+            .filter(Actor.id.in_([costar_id for costar_id, _ in ranked]))
+            .all()
+        )
+
+        return jsonify({
+            'success': True,
+            'actor_id': actor_id,
+            'actor_name': actor.name,
+            'costars': [
+                {'id': costar_id, 'name': names.get(costar_id), 'shared_movies': shared}
+                for costar_id, shared in ranked
+            ],
+            'total_costars': total
+        })
+
+    @app.route('/actors/<int:actor_id>/path/<int:target_id>', methods=['GET'])
+    @rate_limited('expensive')
+    @requires_auth('get:actors')
+    @coalesce_reads(catalog_reads)
+    def get_actor_path(payload, actor_id, target_id):
+        """Get the shortest chain of shared movies between two actors"""
+        max_degrees = request.args.get('max_degrees', 6, type=int)
+
+        if max_degrees < 1 or max_degrees > 12:
+            abort(400)
+
+        found = Actor.query.filter(Actor.id.in_([actor_id, target_id])).count()
+        if found != len({actor_id, target_id}):
+            abort(404)
+
+        costar_index.ensure_built(db.session)
+        path = costar_index.shortest_path(actor_id, target_id, max_degrees)
+
+        if path is None:
+            return jsonify({
+                'success': True,
+                'connected': False,
+                'degrees': None,
+                'path': []
+            })
+
+        actor_ids = path[0::2]
+        movie_ids = path[1::2]
+        names = dict(db.session.query(Actor.id, Actor.name).filter(Actor.id.in_(actor_ids)).all())
+        titles = dict(db.session.query(Movie.id, Movie.title).filter(Movie.id.in_(movie_ids)).all())
+
+        steps = []
+        for position, node_id in enumerate(path):
+            if position % 2 == 0:
+                steps.append({'type': 'actor', 'id': node_id, 'name': names.get(node_id)})
+            else:
+                steps.append({'type': 'movie', 'id': node_id, 'title': titles.get(node_id)})
+
+        return jsonify({
+            'success': True,
+            'connected': True,
+            'degrees': len(movie_ids),
+            'path': steps
+        })
+
+    # STATISTICS ENDPOINTS
+
+    @app.route('/stats/movies-by-year', methods=['GET'])
+    @rate_limited('expensive')
+    @requires_auth('get:movies')
+    @coalesce_reads(catalog_reads)
+    def get_movies_by_year_stats(payload):
+        """Get the number of movies released per year"""
+        return jsonify({
+            'success': True,
+            'movies_by_year': stats_cache.get_or_compute('movies-by-year', movies_per_year)
+        })
+
+    @app.route('/stats/cast-sizes', methods=['GET'])
+    @rate_limited('expensive')
+    @requires_auth('get:movies')
+    @coalesce_reads(catalog_reads)
+    def get_cast_size_stats(payload):
+        """Get how many movies have each cast size"""
+        return jsonify({
+            'success': True,
+            'cast_sizes': stats_cache.get_or_compute('cast-sizes', cast_size_distribution)
+        })
+
+    @app.route('/stats/actors-by-gender', methods=['GET'])
+    @rate_limited('expensive')
+    @requires_auth('get:actors')
+    @coalesce_reads(catalog_reads)
+    def get_actors_by_gender_stats(payload):
+        """Get the number of actors per gender"""
+        return jsonify({
+            'success': True,
+            'actors_by_gender': stats_cache.get_or_compute('actors-by-gender', actors_by_gender)
+        })
+
+    @app.route('/stats/busiest-actors', methods=['GET'])
+    @rate_limited('expensive')
+    @requires_auth('get:actors')
+    @coalesce_reads(catalog_reads)
+    def get_busiest_actors_stats(payload):
+        """Get the actors cast in the most movies"""
+        limit = request.args.get('limit', 10, type=int)
+
+        if limit < 1 or limit > 100:
+            abort(400)
+
+        return jsonify({
+            'success': True,
+            'busiest_actors': stats_cache.get_or_compute(
+                ('busiest-actors', limit),
+                lambda: busiest_actors(limit)
+            )
+        })
+
+    # SEARCH ENDPOINTS
+
+    # Each kind of result needs the permission its own listing does.
+    search_permissions = {
+        'movie': 'get:movies',
+        'actor': 'get:actors',
+        None: ('get:movies', 'get:actors')
+    }
+
+    def search_results(payload):
+        query = request.args.get('q', '')
+        search_type = request.args.get('type', None)
+        page = request.args.get('page', 0, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+
+        if page < 0 or per_page < 1 or per_page > 100:
+            abort(400)
+
+        kinds = (search_type,) if search_type else SEARCH_KINDS
+
+        try:
+            results, has_more = search_catalog(db.session, query, kinds, page, per_page)
+        except SearchQueryError:
+            abort(400)
+
+        return jsonify({
+            'success': True,
+            'query': query,
+            'results': results,
+            'page': page,
+            'per_page': per_page,
+            'has_more': has_more
+        })
+
+    search_views = {
+        search_type: requires_auth(permission)(coalesce_reads(catalog_reads)(search_results))
+        for search_type, permission in search_permissions.items()
+    }
+
+    @app.route('/search', methods=['GET'])
+    @rate_limited('expensive')
+    def search():
+        """Ranked prefix/fuzzy search over movie titles and actor names"""
+        view = search_views.get(request.args.get('type'), search_views[None])
+        return view()
+
+    # DELTA SYNC ENDPOINTS
+
+    @app.route('/changes', methods=['GET'])
+    @requires_auth('get:movies')
+    @coalesce_reads(catalog_reads)
+    def get_changes(payload):
+        """Get movies, actors and castings changed after a sync cursor"""
+        cursor = request.args.get('since', None)
+        limit = request.args.get('limit', 100, type=int)
+
+        if limit < 1 or limit > 500:
+            abort(400)
+
+        try:
+            changes, next_cursor, has_more = changes_since(cursor, limit)
+        except InvalidCursorError:
+            abort(400)
+        except ResyncRequiredError as e:
+            return jsonify({
+                'success': False,
+                'error': 410,
+                'message': str(e),
+                'resync_required': True
+            }), 410
+
+        return jsonify({
+            'success': True,
+            'changes': changes,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        })
+
+    # EVENT STREAM ENDPOINTS
+
+    @app.route('/events', methods=['GET'])
+    @requires_auth('get:movies')
+    def get_events(payload):
+        """Stream movie, actor and casting changes as Server-Sent Events"""
+        return Response(
+            stream_events(),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+
     # USER MANAGEMENT ENDPOINTS
     @app.route('/users', methods=['GET'])
+    @user_management_limit
     @requires_auth('get:users')
     def get_users(payload):
 
@@ -434,8 +874,8 @@ def create_app(test_config=None):
             result = get_auth0_users(mgmt_token, page, per_page, search)
             users = result.get('users', [])
 
-            manager_permissions = payload.get('permissions', [])
-            filtered_users = filter_users_by_access_level(users, manager_permissions)
+            principal = current_principal(payload)
+            filtered_users = filter_users_by_access_level(users, principal)
 
             return jsonify({
                 'success': True,
@@ -443,15 +883,12 @@ def create_app(test_config=None):
                 'total': len(filtered_users),
                 'page': page,
                 'per_page': per_page,
-                'your_role_level': get_user_role_level(manager_permissions)
+                'your_role_level': principal.level
             }), 200
         except Auth0ManagementError as e:
-            return jsonify({
-                'success': False,
-                'error': e.status_code,
-                'message': e.message
-            }), e.status_code
+            return auth0_error_response(e)
         except Exception as e:
+            log_handler_error(e)
             return jsonify({
                 'success': False,
                 'error': 500,
@@ -460,6 +897,7 @@ def create_app(test_config=None):
 
 
     @app.route('/users/<user_id>', methods=['GET'])
+    @user_management_limit
     @requires_auth('get:users')
     def get_user(payload, user_id):
         try:
@@ -467,21 +905,16 @@ def create_app(test_config=None):
             user = get_auth0_user(mgmt_token, user_id)
 
             user_roles = get_user_roles(mgmt_token, user_id)
-            manager_permissions = payload.get('permissions', [])
-
-            enforce_user_management_access(manager_permissions, user_roles)
+            enforce_user_management_access(current_principal(payload), user_roles)
 
             return jsonify({
                 'success': True,
                 'user': user
             }), 200
         except Auth0ManagementError as e:
-            return jsonify({
-                'success': False,
-                'error': e.status_code,
-                'message': e.message
-            }), e.status_code
+            return auth0_error_response(e)
         except Exception as e:
+            log_handler_error(e)
             return jsonify({
                 'success': False,
                 'error': 500,
@@ -490,7 +923,9 @@ def create_app(test_config=None):
 
 
     @app.route('/users', methods=['POST'])
+    @user_management_limit
     @requires_auth('post:users')
+    @idempotent
     def create_user(payload):
         try:
             body = request.get_json()
@@ -510,8 +945,19 @@ def create_app(test_config=None):
                     'message': 'Email and password are required'
                 }), 400
 
-            manager_permissions = payload.get('permissions', [])
-            enforce_role_assignment_access(manager_permissions, role_name)
+            principal = current_principal(payload)
+            enforce_role_assignment_access(principal, role_name)
+
+            # The password can only be queued encrypted; without
+            # JOB_SECRET_KEY the user is provisioned in the request.
+            if wants_async() and can_seal_secrets():
+                job = enqueue(PROVISION_USER, {
+                    'email': email,
+                    'password': password,
+                    'name': name,
+                    'role': role_name
+                }, created_by=principal.user_id, created_by_level=principal.level)
+                return job_accepted(job)
 
             mgmt_token = get_management_api_token()
             user = create_auth0_user(mgmt_token, email, password, name)
@@ -533,12 +979,9 @@ def create_app(test_config=None):
                 'role_assigned': role_name
             }), 201
         except Auth0ManagementError as e:
-            return jsonify({
-                'success': False,
-                'error': e.status_code,
-                'message': e.message
-            }), e.status_code
+            return auth0_error_response(e)
         except Exception as e:
+            log_handler_error(e)
             return jsonify({
                 'success': False,
                 'error': 500,
@@ -547,6 +990,7 @@ def create_app(test_config=None):
 
 
     @app.route('/users/<user_id>', methods=['PATCH'])
+    @user_management_limit
     @requires_auth('patch:users')
     def update_user(payload, user_id):
         try:
@@ -558,8 +1002,7 @@ def create_app(test_config=None):
             mgmt_token = get_management_api_token()
 
             user_roles = get_user_roles(mgmt_token, user_id)
-            manager_permissions = payload.get('permissions', [])
-            enforce_user_management_access(manager_permissions, user_roles)
+            enforce_user_management_access(current_principal(payload), user_roles)
 
             user = update_auth0_user(mgmt_token, user_id, body)
 
@@ -568,12 +1011,9 @@ def create_app(test_config=None):
                 'user': user
             }), 200
         except Auth0ManagementError as e:
-            return jsonify({
-                'success': False,
-                'error': e.status_code,
-                'message': e.message
-            }), e.status_code
+            return auth0_error_response(e)
         except Exception as e:
+            log_handler_error(e)
             return jsonify({
                 'success': False,
                 'error': 500,
@@ -582,14 +1022,14 @@ def create_app(test_config=None):
 
 
     @app.route('/users/<user_id>', methods=['DELETE'])
+    @user_management_limit
     @requires_auth('delete:users')
     def delete_user(payload, user_id):
         try:
             mgmt_token = get_management_api_token()
 
             user_roles = get_user_roles(mgmt_token, user_id)
-            manager_permissions = payload.get('permissions', [])
-            enforce_user_management_access(manager_permissions, user_roles)
+            enforce_user_management_access(current_principal(payload), user_roles)
 
             delete_auth0_user(mgmt_token, user_id)
 
@@ -598,12 +1038,9 @@ def create_app(test_config=None):
                 'deleted': user_id
             }), 200
         except Auth0ManagementError as e:
-            return jsonify({
-                'success': False,
-                'error': e.status_code,
-                'message': e.message
-            }), e.status_code
+            return auth0_error_response(e)
         except Exception as e:
+            log_handler_error(e)
             return jsonify({
                 'success': False,
                 'error': 500,
@@ -612,6 +1049,7 @@ def create_app(test_config=None):
 
 
     @app.route('/users/<user_id>/roles', methods=['GET'])
+    @user_management_limit
     @requires_auth('get:users')
     def get_user_roles_endpoint(payload, user_id):
         try:
@@ -623,12 +1061,9 @@ def create_app(test_config=None):
                 'roles': roles
             }), 200
         except Auth0ManagementError as e:
-            return jsonify({
-                'success': False,
-                'error': e.status_code,
-                'message': e.message
-            }), e.status_code
+            return auth0_error_response(e)
         except Exception as e:
+            log_handler_error(e)
             return jsonify({
                 'success': False,
                 'error': 500,
@@ -637,7 +1072,9 @@ def create_app(test_config=None):
 
 
     @app.route('/users/<user_id>/roles', methods=['POST'])
+    @user_management_limit
     @requires_auth('post:users')
+    @idempotent
     def assign_user_roles(payload, user_id):
         try:
             body = request.get_json()
@@ -650,11 +1087,11 @@ def create_app(test_config=None):
                 }), 400
 
             role_ids = body.get('roles')
-            manager_permissions = payload.get('permissions', [])
+            principal = current_principal(payload)
             mgmt_token = get_management_api_token()
 
             user_roles = get_user_roles(mgmt_token, user_id)
-            enforce_user_management_access(manager_permissions, user_roles)
+            enforce_user_management_access(principal, user_roles)
 
             all_roles = get_all_roles(mgmt_token)
             for role_id in role_ids:
@@ -665,7 +1102,14 @@ def create_app(test_config=None):
                         break
 
                 if role_name:
-                    enforce_role_assignment_access(manager_permissions, role_name)
+                    enforce_role_assignment_access(principal, role_name)
+
+            if wants_async():
+                job = enqueue(ASSIGN_USER_ROLES, {
+                    'user_id': user_id,
+                    'roles': role_ids
+                }, created_by=principal.user_id, created_by_level=principal.level)
+                return job_accepted(job)
 
             assign_roles_to_user(mgmt_token, user_id, role_ids)
 
@@ -674,12 +1118,9 @@ def create_app(test_config=None):
                 'message': 'Roles assigned successfully'
             }), 200
         except Auth0ManagementError as e:
-            return jsonify({
-                'success': False,
-                'error': e.status_code,
-                'message': e.message
-            }), e.status_code
+            return auth0_error_response(e)
         except Exception as e:
+            log_handler_error(e)
             return jsonify({
                 'success': False,
                 'error': 500,
@@ -688,28 +1129,26 @@ def create_app(test_config=None):
 
 
     @app.route('/roles', methods=['GET'])
+    @user_management_limit
     @requires_auth('get:users')
     def get_roles(payload):
         try:
             mgmt_token = get_management_api_token()
             all_roles = get_all_roles(mgmt_token)
 
-            manager_permissions = payload.get('permissions', [])
-            assignable_roles = get_assignable_roles(manager_permissions, all_roles)
+            principal = current_principal(payload)
+            assignable_roles = get_assignable_roles(principal, all_roles)
 
             return jsonify({
                 'success': True,
                 'roles': assignable_roles,
                 'total': len(assignable_roles),
-                'your_role_level': get_user_role_level(manager_permissions)
+                'your_role_level': principal.level
             }), 200
         except Auth0ManagementError as e:
-            return jsonify({
-                'success': False,
-                'error': e.status_code,
-                'message': e.message
-            }), e.status_code
+            return auth0_error_response(e)
         except Exception as e:
+            log_handler_error(e)
             return jsonify({
                 'success': False,
                 'error': 500,
@@ -717,15 +1156,100 @@ def create_app(test_config=None):
             }), 500
 
 
+    @app.route('/jobs/<int:job_id>', methods=['GET'])
+    @requires_auth('get:users')
+    def get_job(payload, job_id):
+        job = db.session.get(Job, job_id)
+        principal = current_principal(payload)
+
+        # Visible to its creator and to roles above the creator's; anyone
+        # else gets the same 404 as for a missing job.
+        if job is not None and job.created_by != principal.user_id:
+            creator_level = PRODUCER_LEVEL if job.created_by_level is None else job.created_by_level
+            if principal.level <= creator_level:
+                job = None
+
+        if job is None:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'job': job.format()
+        }), 200
+
+
+    @app.route('/profiling', methods=['POST'])
+    @requires_auth('profile:api')
+    def start_profiling(payload):
+        """Profile the next requests to a route, or sample this worker"""
+        body = request.get_json(silent=True) or {}
+        try:
+            if body.get('mode') == 'requests':
+                session = profiler.profile_requests(body.get('route'), body.get('count', 10))
+            elif body.get('mode') == 'sample':
+                session = profiler.sample(body.get('seconds', 10), body.get('interval_ms', 10))
+            else:
+                raise ValueError('mode must be "requests" or "sample"')
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': 400,
+                'message': str(e)
+            }), 400
+
+        return jsonify({
+            'success': True,
+            'profile': session.format()
+        }), 202, {'Location': f'/profiling/{session.id}'}
+
+    @app.route('/profiling/<session_id>', methods=['GET'])
+    @requires_auth('profile:api')
+    def get_profiling(payload, session_id):
+        session = profiler.get(session_id)
+
+        if session is None:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'profile': session.format()
+        }), 200
+
+    @app.route('/profiling/<session_id>/report', methods=['GET'])
+    @requires_auth('profile:api')
+    def get_profiling_report(payload, session_id):
+        """Download a report; ?format= picks one of the session's formats"""
+        session = profiler.get(session_id)
+
+        if session is None:
+            abort(404)
+
+        report_format = request.args.get('format', session.formats[0])
+        if report_format not in session.formats:
+            abort(400)
+
+        report = session.report(report_format)
+        if report is None:
+            abort(404)
+
+        if report_format == 'pstats':
+            return Response(report, mimetype='application/octet-stream', headers={
+                'Content-Disposition': f'attachment; filename=profile-{session.id}.pstats'
+            })
+        return Response(report, mimetype='text/plain')
+
     # ERROR HANDLERS
 
     @app.errorhandler(AuthError)
     def auth_error(error):
-        return jsonify({
+        response = jsonify({
             'success': False,
             'error': error.status_code,
             'message': error.error['description']
-        }), error.status_code
+        })
+        if 'retry_after' in error.error:
+            response.headers['Retry-After'] = str(error.error['retry_after'])
+        return response, error.status_code
 
     @app.errorhandler(400)
     def bad_request(error):
@@ -743,6 +1267,14 @@ def create_app(test_config=None):
             'message': 'resource not found'
         }), 404
 
+    @app.errorhandler(412)
+    def precondition_failed(error):
+        return jsonify({
+            'success': False,
+            'error': 412,
+            'message': 'resource was modified, fetch it again and retry'
+        }), 412
+
     @app.errorhandler(422)
     def unprocessable(error):
         return jsonify({
@@ -751,6 +1283,27 @@ def create_app(test_config=None):
             'message': 'unprocessable'
         }), 422
 
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        response = jsonify({
+            'success': False,
+            'error': 429,
+            'message': error.description
+        })
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response, 429
+
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        response = jsonify({
+            'success': False,
+            'error': 503,
+            'message': error.description
+        })
+        if getattr(error, 'retry_after', None) is not None:
+            response.headers['Retry-After'] = str(error.retry_after)
+        return response, 503
+
     @app.errorhandler(500)
     def internal_server_error(error):
         return jsonify({
@@ -759,10 +1312,11 @@ def create_app(test_config=None):
             'message': 'internal server error'
         }), 500
 
-    return app
+    if warmup.steps:
+        warmup.start()
 
-APP = create_app()
+    return app
 
 
 if __name__ == '__main__':
-    APP.run(host='0.0.0.0', port=8080, debug=True)
+    create_app().run(host='0.0.0.0', port=8080, debug=True)
@@ -1,14 +1,28 @@
 import json
-from flask import request
+from blinker import Namespace
+from flask import current_app, g, request
 from functools import wraps
 from jose import jwt
 import os
-from urllib.request import urlopen
+import time
+from .http_client import AUTH0_BASE_URL, Auth0UnavailableError, auth0_flight, auth0_request
+from .role_hierarchy import CompiledPermissions, compile_permissions
 
 AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN', 'dev-dzv8dgf6ff6qu41d.us.auth0.com')
 ALGORITHMS = ['RS256']
 API_AUDIENCE = os.environ.get('API_AUDIENCE', 'casting-agency')
 SKIP_AUTH = os.environ.get('SKIP_AUTH', 'False').lower() == 'true'
+PUBLIC_PERMISSIONS = ('get:movies', 'get:actors')
+PUBLIC_PAYLOAD = {'permissions': list(PUBLIC_PERMISSIONS)}
+JWKS_CACHE_TTL = int(os.environ.get('JWKS_CACHE_TTL', 600))
+# An unknown ``kid`` refetches the key set (rotation), at most this often.
+JWKS_MIN_REFRESH_INTERVAL = 30
+
+_jwks_cache = {'jwks': None, 'fetched_at': 0.0}
+
+# Sent with the token's ``sub`` once its signature and claims have been
+# verified; the rate limiter charges the principal's bucket on it.
+principal_verified = Namespace().signal('principal-verified')
 
 '''
 AuthError Exception
@@ -20,6 +34,33 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+class Principal(CompiledPermissions):
+    '''Caller of the current request, built once from the token payload'''
+    __slots__ = ('user_id',)
+
+    def __init__(self, user_id, permissions, level):
+        super().__init__(permissions, level)
+        self.user_id = user_id
+
+    @classmethod
+    def from_payload(cls, payload):
+        policy = compile_permissions(payload.get('permissions', []))
+        return cls(payload.get('sub'), policy.permissions, policy.level)
+
+
+def current_principal(payload):
+    '''Principal stored by requires_auth, or built from the payload once'''
+    principal = g.get('principal')
+    if principal is None:
+        principal = g.principal = Principal.from_payload(payload)
+    return principal
+
+
+def _call_with_principal(f, payload, args, kwargs):
+    g.principal = Principal.from_payload(payload)
+    return f(payload, *args, **kwargs)
+
+
 def get_token_auth_header():
     auth = request.headers.get('Authorization', None)
     if not auth:
@@ -57,7 +98,7 @@ def check_permissions(permission, payload):
             'description': 'Permissions not included in JWT.'
         }, 400)
 
-    if permission not in payload['permissions']:
+    if permission not in compile_permissions(payload['permissions']):
         raise AuthError({
             'code': 'unauthorized',
             'description': 'You are not authorized to perform this action.'
@@ -65,9 +106,39 @@ def check_permissions(permission, payload):
 
     return True
 
+def fetch_jwks(refresh=False):
+    '''Auth0 signing keys, cached for JWKS_CACHE_TTL seconds'''
+    age = time.monotonic() - _jwks_cache['fetched_at']
+    if _jwks_cache['jwks'] is not None and age < JWKS_CACHE_TTL and not (refresh and age >= JWKS_MIN_REFRESH_INTERVAL):
+        return _jwks_cache['jwks']
+    jwks = auth0_flight.do('jwks', _fetch_jwks)
+    _jwks_cache.update(jwks=jwks, fetched_at=time.monotonic())
+    return jwks
+
+def reset_jwks_cache():
+    _jwks_cache.update(jwks=None, fetched_at=0.0)
+
+def _fetch_jwks():
+    try:
+        response = auth0_request('GET', f'{AUTH0_BASE_URL}/.well-known/jwks.json')
+    except Auth0UnavailableError as e:
+        raise AuthError({
+            'code': 'auth_unavailable',
+            'description': 'Authentication service unavailable, try again shortly.',
+            'retry_after': e.retry_after
+        }, 503)
+
+    if response.status_code != 200:
+        raise AuthError({
+            'code': 'auth_unavailable',
+            'description': 'Authentication service unavailable, try again shortly.',
+            'retry_after': 1
+        }, 503)
+
+    return response.json()
+
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    jwks = fetch_jwks()
     unverified_header = jwt.get_unverified_header(token)
     rsa_key = {}
     if 'kid' not in unverified_header:
@@ -76,6 +147,9 @@ def verify_decode_jwt(token):
             'description': 'Authorization malformed.'
         }, 401)
 
+    if not any(key['kid'] == unverified_header['kid'] for key in jwks['keys']):
+        jwks = fetch_jwks(refresh=True)
+
     for key in jwks['keys']:
         if key['kid'] == unverified_header['kid']:
             rsa_key = {
@@ -119,6 +193,9 @@ def verify_decode_jwt(token):
             }, 400)
 
 def requires_auth(permission=''):
+    # A tuple of permissions requires all of them.
+    permissions = (permission,) if isinstance(permission, str) else tuple(permission)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
@@ -129,31 +206,25 @@ def requires_auth(permission=''):
                         'get:movies', 'post:movies', 'patch:movies', 'delete:movies',
                         'get:actors', 'post:actors', 'patch:actors', 'delete:actors',
                         'post:casting', 'delete:casting',
-                        'get:users', 'post:users', 'patch:users', 'delete:users'
+                        'get:users', 'post:users', 'patch:users', 'delete:users',
+                        'profile:api'
                     ]
                 }
-                return f(mock_payload, *args, **kwargs)
-
-            # Public endpoints that don't require auth
-            public_permissions = ['get:movies', 'get:actors']
-
-            # For public endpoints, try to get token but don't fail if missing
-            if permission in public_permissions:
-                try:
-                    token = get_token_auth_header()
-                    payload = verify_decode_jwt(token)
-                    # Token is valid, use it
-                    return f(payload, *args, **kwargs)
-                except AuthError:
-                    # No token or invalid token, use public payload
-                    public_payload = {'permissions': public_permissions}
-                    return f(public_payload, *args, **kwargs)
+                return _call_with_principal(f, mock_payload, args, kwargs)
+
+            # Public endpoints: everyone holds these permissions and no
+            # catalog read depends on who the caller is, so the token is
+            # not even parsed (an expired one would cost a verify for nothing)
+            if all(required in PUBLIC_PERMISSIONS for required in permissions):
+                return _call_with_principal(f, PUBLIC_PAYLOAD, args, kwargs)
 
             # Protected endpoints require valid token
             token = get_token_auth_header()
             payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
-            return f(payload, *args, **kwargs)
+            principal_verified.send(current_app._get_current_object(), subject=payload.get('sub'))
+            for required in permissions:
+                check_permissions(required, payload)
+            return _call_with_principal(f, payload, args, kwargs)
 
         return wrapper
     return requires_auth_decorator
\ No newline at end of file
@@ -1,6 +1,9 @@
 import os
+import time
 import requests
+from functools import wraps
 from flask import request, abort
+from .http_client import AUTH0_BASE_URL, Auth0UnavailableError, auth0_flight, auth0_request
 
 
 # Auth0 Management API Configuration
@@ -8,17 +11,57 @@ AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN', 'dev-dzv8dgf6ff6qu41d.us.auth0.com
 AUTH0_MGMT_CLIENT_ID = os.environ.get('AUTH0_MGMT_CLIENT_ID', 'OZnaJGx6Gy4jCrgR7iaBMnzEr9kNyjRO')
 AUTH0_MGMT_CLIENT_SECRET = os.environ.get('AUTH0_MGMT_CLIENT_SECRET', 'fvuraaCQHShSaZDvh_bWWqNCz59ZuUTGxG2td04vBm2fKlKDOmLVKAKzuRgPzE-w')
 AUTH0_MGMT_AUDIENCE = f'https://{AUTH0_DOMAIN}/api/v2/'
+# A cached management token is replaced this many seconds before it expires.
+MGMT_TOKEN_REFRESH_MARGIN = 60
+
+_management_token = {'token': None, 'expires_at': 0.0}
 
 
 class Auth0ManagementError(Exception):
-    def __init__(self, message, status_code):
+    def __init__(self, message, status_code, retry_after=None, upstream_status=None):
         self.message = message
         self.status_code = status_code
+        self.retry_after = retry_after
+        # Status Auth0 itself answered with, when it answered at all.
+        self.upstream_status = upstream_status
         super().__init__(self.message)
 
+    @property
+    def rejected(self):
+        """Auth0 refused the request itself (e.g. a weak password); resending it cannot help"""
+        return self.upstream_status is not None and 400 <= self.upstream_status < 500 \
+            and self.upstream_status not in (408, 429)
+
+
+def _upstream_status(error):
+    return error.response.status_code if error.response is not None else None
+
+
+def management_call(f):
+    """Report a refused or failed Auth0 call as a 503 with a retry hint"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        except Auth0UnavailableError as e:
+            raise Auth0ManagementError(e.message, 503, e.retry_after)
+    return wrapper
+
 
 def get_management_api_token():
-    url = f'https://{AUTH0_DOMAIN}/oauth/token'
+    """Management API token, reused until shortly before it expires"""
+    if _management_token['token'] is not None and time.monotonic() < _management_token['expires_at']:
+        return _management_token['token']
+    return auth0_flight.do('management_token', _request_management_token)
+
+
+def reset_management_token():
+    _management_token.update(token=None, expires_at=0.0)
+
+
+@management_call
+def _request_management_token():
+    url = f'{AUTH0_BASE_URL}/oauth/token'
 
     payload = {
         'client_id': AUTH0_MGMT_CLIENT_ID,
@@ -30,15 +73,22 @@ def get_management_api_token():
     headers = {'content-type': 'application/json'}
 
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = auth0_request('POST', url, json=payload, headers=headers)
         response.raise_for_status()
-        return response.json()['access_token']
+        grant = response.json()
     except requests.exceptions.RequestException as e:
         raise Auth0ManagementError(f'Failed to get management API token: {str(e)}', 500)
 
+    _management_token.update(
+        token=grant['access_token'],
+        expires_at=time.monotonic() + max(grant.get('expires_in', 0) - MGMT_TOKEN_REFRESH_MARGIN, 0)
+    )
+    return grant['access_token']
 
+
+@management_call
 def get_auth0_users(token, page=0, per_page=50, search_query=None):
-    url = f'https://{AUTH0_DOMAIN}/api/v2/users'
+    url = f'{AUTH0_BASE_URL}/api/v2/users'
 
     headers = {'authorization': f'Bearer {token}'}
     params = {
@@ -51,20 +101,21 @@ def get_auth0_users(token, page=0, per_page=50, search_query=None):
         params['q'] = search_query
 
     try:
-        response = requests.get(url, headers=headers, params=params)
+        response = auth0_request('GET', url, headers=headers, params=params)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         raise Auth0ManagementError(f'Failed to fetch users: {str(e)}', 500)
 
 
+@management_call
 def get_auth0_user(token, user_id):
-    url = f'https://{AUTH0_DOMAIN}/api/v2/users/{user_id}'
+    url = f'{AUTH0_BASE_URL}/api/v2/users/{user_id}'
 
     headers = {'authorization': f'Bearer {token}'}
 
     try:
-        response = requests.get(url, headers=headers)
+        response = auth0_request('GET', url, headers=headers)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -73,8 +124,9 @@ def get_auth0_user(token, user_id):
         raise Auth0ManagementError(f'Failed to fetch user: {str(e)}', 500)
 
 
+@management_call
 def create_auth0_user(token, email, password, name=None, connection='Username-Password-Authentication'):
-    url = f'https://{AUTH0_DOMAIN}/api/v2/users'
+    url = f'{AUTH0_BASE_URL}/api/v2/users'
 
     headers = {
         'authorization': f'Bearer {token}',
@@ -92,15 +144,16 @@ def create_auth0_user(token, email, password, name=None, connection='Username-Pa
         payload['name'] = name
 
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = auth0_request('POST', url, json=payload, headers=headers)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
-        raise Auth0ManagementError(f'Failed to create user: {str(e)}', 400)
+        raise Auth0ManagementError(f'Failed to create user: {str(e)}', 400, upstream_status=_upstream_status(e))
 
 
+@management_call
 def update_auth0_user(token, user_id, updates):
-    url = f'https://{AUTH0_DOMAIN}/api/v2/users/{user_id}'
+    url = f'{AUTH0_BASE_URL}/api/v2/users/{user_id}'
 
     headers = {
         'authorization': f'Bearer {token}',
@@ -108,7 +161,7 @@ def update_auth0_user(token, user_id, updates):
     }
 
     try:
-        response = requests.patch(url, json=updates, headers=headers)
+        response = auth0_request('PATCH', url, json=updates, headers=headers)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -117,13 +170,14 @@ def update_auth0_user(token, user_id, updates):
         raise Auth0ManagementError(f'Failed to update user: {str(e)}', 400)
 
 
+@management_call
 def delete_auth0_user(token, user_id):
-    url = f'https://{AUTH0_DOMAIN}/api/v2/users/{user_id}'
+    url = f'{AUTH0_BASE_URL}/api/v2/users/{user_id}'
 
     headers = {'authorization': f'Bearer {token}'}
 
     try:
-        response = requests.delete(url, headers=headers)
+        response = auth0_request('DELETE', url, headers=headers)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
         if response.status_code == 404:
@@ -131,8 +185,9 @@ def delete_auth0_user(token, user_id):
         raise Auth0ManagementError(f'Failed to delete user: {str(e)}', 500)
 
 
+@management_call
 def assign_roles_to_user(token, user_id, role_ids):
-    url = f'https://{AUTH0_DOMAIN}/api/v2/users/{user_id}/roles'
+    url = f'{AUTH0_BASE_URL}/api/v2/users/{user_id}/roles'
 
     headers = {
         'authorization': f'Bearer {token}',
@@ -142,32 +197,38 @@ def assign_roles_to_user(token, user_id, role_ids):
     payload = {'roles': role_ids}
 
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = auth0_request('POST', url, json=payload, headers=headers)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
-        raise Auth0ManagementError(f'Failed to assign roles: {str(e)}', 400)
+        raise Auth0ManagementError(f'Failed to assign roles: {str(e)}', 400, upstream_status=_upstream_status(e))
 
 
+@management_call
 def get_user_roles(token, user_id):
-    url = f'https://{AUTH0_DOMAIN}/api/v2/users/{user_id}/roles'
+    url = f'{AUTH0_BASE_URL}/api/v2/users/{user_id}/roles'
 
     headers = {'authorization': f'Bearer {token}'}
 
     try:
-        response = requests.get(url, headers=headers)
+        response = auth0_request('GET', url, headers=headers)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         raise Auth0ManagementError(f'Failed to fetch user roles: {str(e)}', 500)
 
 
+@management_call
 def get_all_roles(token):
-    url = f'https://{AUTH0_DOMAIN}/api/v2/roles'
+    return auth0_flight.do(('roles', token), lambda: _get_all_roles(token))
+
+
+def _get_all_roles(token):
+    url = f'{AUTH0_BASE_URL}/api/v2/roles'
 
     headers = {'authorization': f'Bearer {token}'}
 
     try:
-        response = requests.get(url, headers=headers)
+        response = auth0_request('GET', url, headers=headers)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -0,0 +1,120 @@
+"""Guarded HTTP access to Auth0 shared by every outbound call.
+
+All calls go through one pooled session; reusing keep-alive connections
+saves a TLS handshake per call, and under the gevent worker (see
+``gunicorn.conf.py``) a slow response parks one greenlet instead of the
+worker.  ``auth0_request`` adds explicit timeouts, a bulkhead capping
+concurrent calls and a circuit breaker, so a degraded tenant turns into
+fast ``Auth0UnavailableError``s instead of piled-up request threads.
+"""
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..metrics import register_metric
+from ..resilience import CircuitBreaker, CircuitOpenError, ConcurrencyLimit
+from ..request_log import timed_auth0_call
+from ..singleflight import SingleFlight
+
+
+AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN', 'dev-dzv8dgf6ff6qu41d.us.auth0.com')
+# Lets the load tests point the app at a local stand-in for the tenant.
+AUTH0_BASE_URL = os.environ.get('AUTH0_BASE_URL', f'https://{AUTH0_DOMAIN}').rstrip('/')
+AUTH0_POOL_SIZE = int(os.environ.get('AUTH0_POOL_SIZE', 20))
+AUTH0_CONNECT_TIMEOUT = float(os.environ.get('AUTH0_CONNECT_TIMEOUT', 3.05))
+AUTH0_READ_TIMEOUT = float(os.environ.get('AUTH0_READ_TIMEOUT', 5))
+AUTH0_MAX_CONCURRENCY = int(os.environ.get('AUTH0_MAX_CONCURRENCY', AUTH0_POOL_SIZE))
+AUTH0_FAILURE_THRESHOLD = int(os.environ.get('AUTH0_FAILURE_THRESHOLD', 5))
+AUTH0_RESET_TIMEOUT = float(os.environ.get('AUTH0_RESET_TIMEOUT', 30))
+
+
+class Auth0UnavailableError(Exception):
+    def __init__(self, message, retry_after):
+        self.message = message
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+def create_session(pool_size=AUTH0_POOL_SIZE):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+auth0_session = create_session()
+auth0_bulkhead = ConcurrencyLimit('Auth0', AUTH0_MAX_CONCURRENCY, wait=0.1)
+auth0_breaker = CircuitBreaker('Auth0', AUTH0_FAILURE_THRESHOLD, AUTH0_RESET_TIMEOUT)
+# Concurrent identical reads (JWKS, role list) share one outbound call.
+auth0_flight = SingleFlight('auth0')
+
+
+def _is_failure(response):
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def auth0_request(method, url, **kwargs):
+    """Send one request to Auth0 through the breaker and bulkhead.
+
+    Transport errors, timeouts, 5xx and 429 count as failures.  Raises
+    ``Auth0UnavailableError`` when the call is refused or cannot complete;
+    HTTP error statuses are returned to the caller as usual.
+    """
+    if not auth0_bulkhead.try_acquire():
+        raise Auth0UnavailableError('Too many concurrent Auth0 calls', auth0_bulkhead.retry_after)
+
+    try:
+        auth0_breaker.before_call()
+    except CircuitOpenError as e:
+        auth0_bulkhead.release()
+        raise Auth0UnavailableError('Auth0 is unavailable', e.retry_after)
+
+    try:
+        kwargs.setdefault('timeout', (AUTH0_CONNECT_TIMEOUT, AUTH0_READ_TIMEOUT))
+        with timed_auth0_call():
+            response = auth0_session.request(method, url, **kwargs)
+    except requests.exceptions.RequestException as e:
+        auth0_breaker.record_failure()
+        raise Auth0UnavailableError(f'Auth0 request failed: {e.__class__.__name__}', 1)
+    finally:
+        auth0_bulkhead.release()
+
+    if _is_failure(response):
+        auth0_breaker.record_failure()
+    else:
+        auth0_breaker.record_success()
+    return response
+
+
+register_metric(
+    'auth0_circuit_state', 'gauge',
+    'Auth0 circuit breaker state (0 closed, 1 half-open, 2 open)',
+    lambda: CircuitBreaker.STATE_VALUES[auth0_breaker.state]
+)
+register_metric(
+    'auth0_circuit_consecutive_failures', 'gauge',
+    'Consecutive failed Auth0 calls',
+    lambda: auth0_breaker.consecutive_failures
+)
+register_metric(
+    'auth0_circuit_opened_total', 'counter',
+    'Times the Auth0 circuit breaker opened',
+    lambda: auth0_breaker.times_opened
+)
+register_metric(
+    'auth0_circuit_rejected_total', 'counter',
+    'Auth0 calls refused while the circuit was open',
+    lambda: auth0_breaker.rejected
+)
+register_metric(
+    'auth0_bulkhead_in_flight', 'gauge',
+    'Auth0 calls currently in flight',
+    lambda: auth0_bulkhead.in_flight
+)
+register_metric(
+    'auth0_bulkhead_rejected_total', 'counter',
+    'Auth0 calls refused because the bulkhead was full',
+    lambda: auth0_bulkhead.rejected
+)
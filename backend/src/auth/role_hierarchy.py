@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from flask import abort, jsonify
 
 ROLE_HIERARCHY = {
@@ -10,92 +12,158 @@ CASTING_ASSISTANT_ROLE = 'Casting Assistant'
 CASTING_DIRECTOR_ROLE = 'Casting Director'
 EXECUTIVE_PRODUCER_ROLE = 'Executive Producer'
 
+NO_ROLE_LEVEL = 0
+ASSISTANT_LEVEL = ROLE_HIERARCHY[CASTING_ASSISTANT_ROLE]
+DIRECTOR_LEVEL = ROLE_HIERARCHY[CASTING_DIRECTOR_ROLE]
+PRODUCER_LEVEL = ROLE_HIERARCHY[EXECUTIVE_PRODUCER_ROLE]
+LEVELS = range(NO_ROLE_LEVEL, PRODUCER_LEVEL + 1)
 
-def get_user_role_level(permissions):
+PRODUCER_PERMISSIONS = frozenset(['delete:movies', 'post:movies'])
+DIRECTOR_PERMISSIONS = frozenset(['delete:actors', 'post:actors'])
+ASSISTANT_PERMISSIONS = frozenset(['get:movies', 'get:actors'])
+
+
+class CompiledPermissions:
+    """A permission list frozen into a set with its role level resolved"""
+    __slots__ = ('permissions', 'level')
+
+    def __init__(self, permissions, level):
+        self.permissions = permissions
+        self.level = level
+
+    def __contains__(self, permission):
+        return permission in self.permissions
+
+    def __iter__(self):
+        return iter(self.permissions)
+
+    def __len__(self):
+        return len(self.permissions)
+
+
+def _resolve_level(permissions):
     if not permissions:
-        return 0
+        return NO_ROLE_LEVEL
 
-    if 'delete:movies' in permissions and 'post:movies' in permissions:
-        return ROLE_HIERARCHY['Executive Producer']
+    if PRODUCER_PERMISSIONS <= permissions:
+        return PRODUCER_LEVEL
 
-    if 'delete:actors' in permissions or 'post:actors' in permissions:
-        return ROLE_HIERARCHY['Casting Director']
+    if not DIRECTOR_PERMISSIONS.isdisjoint(permissions):
+        return DIRECTOR_LEVEL
 
-    if 'get:movies' in permissions or 'get:actors' in permissions:
-        return ROLE_HIERARCHY['Casting Assistant']
+    if not ASSISTANT_PERMISSIONS.isdisjoint(permissions):
+        return ASSISTANT_LEVEL
 
-    return 0
+    return NO_ROLE_LEVEL
 
 
-def get_role_name_from_level(level):
-    for role, lvl in ROLE_HIERARCHY.items():
-        if lvl == level:
-            return role
-    return None
+@lru_cache(maxsize=1024)
+def _compile(permissions):
+    frozen = frozenset(permissions)
+    return CompiledPermissions(frozen, _resolve_level(frozen))
 
 
-def can_manage_user(manager_permissions, target_user_roles):
-    manager_level = get_user_role_level(manager_permissions)
+def compile_permissions(permissions):
+    """Freeze permissions once; repeated lists share one cached result"""
+    if isinstance(permissions, CompiledPermissions):
+        return permissions
+    return _compile(tuple(permissions or ()))
 
-    if manager_level == 0:
-        return False, "No management permissions"
 
-    target_level = 0
-    for role in target_user_roles:
-        role_name = role.get('name', '')
-        if role_name in ROLE_HIERARCHY:
-            level = ROLE_HIERARCHY[role_name]
-            if level > target_level:
-                target_level = level
+def _within_assistant_level(permissions):
+    # Same as level <= ASSISTANT_LEVEL without freezing the list first.
+    return DIRECTOR_PERMISSIONS.isdisjoint(permissions) and not (
+        'delete:movies' in permissions and 'post:movies' in permissions
+    )
+
 
-    if manager_level == ROLE_HIERARCHY['Executive Producer']:
-        if target_level == ROLE_HIERARCHY['Executive Producer']:
+def _manage_decision(manager_level, target_level):
+    if manager_level == NO_ROLE_LEVEL:
+        return False, "No management permissions"
+
+    if manager_level == PRODUCER_LEVEL:
+        if target_level == PRODUCER_LEVEL:
             return False, "Executive Producers cannot manage other Executive Producers"
         return True, None
 
-    if manager_level == ROLE_HIERARCHY['Casting Director']:
-        if target_level > ROLE_HIERARCHY['Casting Assistant']:
+    if manager_level == DIRECTOR_LEVEL:
+        if target_level > ASSISTANT_LEVEL:
             return False, "Casting Directors can only manage Casting Assistant users"
         return True, None
 
     return False, "Insufficient permissions to manage users"
 
 
-def can_assign_role(manager_permissions, role_name):
-    manager_level = get_user_role_level(manager_permissions)
-
-    if role_name not in ROLE_HIERARCHY:
-        return False, f"Invalid role: {role_name}"
-
-    target_role_level = ROLE_HIERARCHY[role_name]
-
-    if manager_level == ROLE_HIERARCHY['Executive Producer']:
-        if target_role_level == ROLE_HIERARCHY['Executive Producer']:
+def _assign_decision(manager_level, role_level):
+    if manager_level == PRODUCER_LEVEL:
+        if role_level == PRODUCER_LEVEL:
             return False, "Cannot assign Executive Producer role via API"
         return True, None
 
-    if manager_level == ROLE_HIERARCHY['Casting Director']:
-        if target_role_level == ROLE_HIERARCHY['Casting Assistant']:
+    if manager_level == DIRECTOR_LEVEL:
+        if role_level == ASSISTANT_LEVEL:
             return True, None
         return False, "Casting Directors can only assign Casting Assistant role"
 
     return False, "Insufficient permissions to assign roles"
 
 
+# MANAGE_MATRIX[manager_level][target_level] -> (allowed, error)
+MANAGE_MATRIX = tuple(
+    tuple(_manage_decision(manager, target) for target in LEVELS) for manager in LEVELS
+)
+
+# ASSIGN_MATRIX[manager_level][role_level] -> (allowed, error)
+ASSIGN_MATRIX = tuple(
+    tuple(_assign_decision(manager, role) for role in LEVELS) for manager in LEVELS
+)
+
+
+def get_user_role_level(permissions):
+    return compile_permissions(permissions).level
+
+
+def get_role_name_from_level(level):
+    for role, lvl in ROLE_HIERARCHY.items():
+        if lvl == level:
+            return role
+    return None
+
+
+def get_highest_role_level(roles):
+    target_level = NO_ROLE_LEVEL
+    for role in roles:
+        level = ROLE_HIERARCHY.get(role.get('name', ''), NO_ROLE_LEVEL)
+        if level > target_level:
+            target_level = level
+    return target_level
+
+
+def can_manage_user(manager_permissions, target_user_roles):
+    manager_level = compile_permissions(manager_permissions).level
+    return MANAGE_MATRIX[manager_level][get_highest_role_level(target_user_roles)]
+
+
+def can_assign_role(manager_permissions, role_name):
+    manager_level = compile_permissions(manager_permissions).level
+
+    if role_name not in ROLE_HIERARCHY:
+        return False, f"Invalid role: {role_name}"
+
+    return ASSIGN_MATRIX[manager_level][ROLE_HIERARCHY[role_name]]
+
+
 def filter_users_by_access_level(users, manager_permissions):
-    manager_level = get_user_role_level(manager_permissions)
+    manager_level = compile_permissions(manager_permissions).level
 
-    if manager_level == ROLE_HIERARCHY['Executive Producer']:
+    if manager_level == PRODUCER_LEVEL:
         return users
 
-    if manager_level == ROLE_HIERARCHY['Casting Director']:
-        filtered_users = []
-        for user in users:
-            user_perms = user.get('permissions', [])
-            user_level = get_user_role_level(user_perms)
-            if user_level <= ROLE_HIERARCHY['Casting Assistant']:
-                filtered_users.append(user)
-        return filtered_users
+    if manager_level == DIRECTOR_LEVEL:
+        return [
+            user for user in users
+            if _within_assistant_level(user.get('permissions', ()))
+        ]
 
     return []
 
@@ -113,20 +181,12 @@ def enforce_role_assignment_access(manager_permissions, role_name):
 
 
 def get_assignable_roles(manager_permissions, all_roles):
-    manager_level = get_user_role_level(manager_permissions)
+    assignable_levels = ASSIGN_MATRIX[compile_permissions(manager_permissions).level]
 
     assignable = []
     for role in all_roles:
-        role_name = role.get('name', '')
-        if role_name in ROLE_HIERARCHY:
-            role_level = ROLE_HIERARCHY[role_name]
-
-            if manager_level == ROLE_HIERARCHY['Executive Producer']:
-                if role_level < ROLE_HIERARCHY['Executive Producer']:
-                    assignable.append(role)
-
-            elif manager_level == ROLE_HIERARCHY['Casting Director']:
-                if role_level == ROLE_HIERARCHY['Casting Assistant']:
-                    assignable.append(role)
+        role_level = ROLE_HIERARCHY.get(role.get('name', ''))
+        if role_level is not None and assignable_levels[role_level][0]:
+            assignable.append(role)
 
     return assignable
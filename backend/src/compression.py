@@ -0,0 +1,182 @@
+"""Negotiated compression of response bodies.
+
+gzip is always available; brotli and zstd are offered when the ``brotli``
+and ``zstandard`` packages are installed.  Bodies shorter than
+``COMPRESSION_MIN_SIZE`` bytes, streamed responses (``/events``) and
+non-text content are sent as they are.  Compressed GET bodies are kept in an
+LRU keyed by a digest of the uncompressed body and the encoding, so a hot
+catalog response is compressed once rather than on every hit.  A strong
+``ETag`` on a compressed response gets the encoding appended
+(``"<tag>-gzip"``), since the encoded bytes differ per encoding.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+from .metrics import register_metric
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+# gzip and zstd level; brotli quality is capped at 11.
+COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', 6))
+COMPRESSION_CACHE_SIZE = int(os.environ.get('COMPRESSION_CACHE_SIZE', 256))
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'image/svg+xml')
+
+
+def _gzip(data):
+    return gzip.compress(data, compresslevel=COMPRESSION_LEVEL, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=min(COMPRESSION_LEVEL, 11))
+
+
+def _zstd(data):
+    return zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(data)
+
+
+# Server preference when the client accepts several at the same quality.
+ENCODERS = OrderedDict()
+if brotli is not None:
+    ENCODERS['br'] = _brotli
+if zstandard is not None:
+    ENCODERS['zstd'] = _zstd
+ENCODERS['gzip'] = _gzip
+
+
+class CompressedBodyCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+compressed_bodies = CompressedBodyCache(COMPRESSION_CACHE_SIZE)
+_stats_lock = threading.Lock()
+_responses = {}
+_bytes_saved = [0]
+
+
+def choose_encoding(accept_encodings):
+    """Best encoding the client accepts, or None for identity"""
+    best, best_quality = None, 0
+    for name in ENCODERS:
+        quality = accept_encodings.quality(name)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def _compressible(response):
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if response.status_code < 200 or response.status_code >= 300 or response.status_code in (204, 206):
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    mimetype = response.mimetype or ''
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def compress_response(response):
+    """``after_request`` hook: compress the body for the negotiated encoding"""
+    if not _compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+
+    cacheable = request.method == 'GET'
+    key = (hashlib.sha1(data).digest(), encoding) if cacheable else None
+    body = compressed_bodies.get(key) if cacheable else None
+    if body is None:
+        body = ENCODERS[encoding](data)
+        if cacheable:
+            compressed_bodies.put(key, body)
+    if len(body) >= len(data):
+        return response
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    with _stats_lock:
+        _responses[encoding] = _responses.get(encoding, 0) + 1
+        _bytes_saved[0] += len(data) - len(body)
+
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        # The encoded body is another representation, so it needs its own
+        # strong tag; revalidating with it gets a 304 here.
+        response.set_etag(f'{etag}-{encoding}')
+        response.make_conditional(request)
+    return response
+
+
+def _response_samples():
+    with _stats_lock:
+        return [({'encoding': name}, count) for name, count in sorted(_responses.items())]
+
+
+register_metric(
+    'http_compressed_responses_total', 'counter',
+    'Responses sent with a Content-Encoding',
+    _response_samples
+)
+register_metric(
+    'http_compression_bytes_saved_total', 'counter',
+    'Response bytes not sent thanks to compression',
+    lambda: _bytes_saved[0]
+)
+register_metric(
+    'compression_cache_hits_total', 'counter',
+    'Compressed bodies served from the cache',
+    lambda: compressed_bodies.hits
+)
+register_metric(
+    'compression_cache_misses_total', 'counter',
+    'Compressed bodies that had to be computed',
+    lambda: compressed_bodies.misses
+)
@@ -0,0 +1,67 @@
+"""Cross-origin access for the Angular frontend.
+
+Every header value is built once when the policy is created.  Preflights
+are answered before any other request hook (no auth, no routing) with an
+``Access-Control-Max-Age`` long enough that a browser repeats them rarely.
+Requests without an ``Origin`` from the allow-list, same-origin calls
+included, get nothing but ``Vary: Origin``.
+"""
+import os
+
+from flask import request
+
+
+DEFAULT_ORIGINS = (
+    'http://localhost:4200',
+    'http://127.0.0.1:4200',
+    'https://casting-agency-frontend.onrender.com',
+    'https://casting-agency-frontend-oj6g.onrender.com',
+)
+# Browsers cap this (Chromium at 2 hours); the longest cap wins.
+CORS_MAX_AGE = int(os.environ.get('CORS_MAX_AGE', 86400))
+
+
+def cors_origins():
+    """Allowed origins from ``CORS_ORIGINS`` (comma separated), or the defaults"""
+    configured = os.environ.get('CORS_ORIGINS')
+    if not configured:
+        return DEFAULT_ORIGINS
+    return tuple(origin.strip().rstrip('/') for origin in configured.split(',') if origin.strip())
+
+
+class CorsPolicy:
+    def __init__(self, origins, methods, allow_headers, expose_headers=(), max_age=CORS_MAX_AGE,
+                 supports_credentials=True):
+        self.origins = frozenset(origins)
+        self.response_headers = []
+        if supports_credentials:
+            self.response_headers.append(('Access-Control-Allow-Credentials', 'true'))
+        self.preflight_headers = [('Vary', 'Origin')] + self.response_headers + [
+            ('Access-Control-Allow-Methods', ', '.join(methods)),
+            ('Access-Control-Allow-Headers', ', '.join(allow_headers)),
+            ('Access-Control-Max-Age', str(max_age)),
+        ]
+        if expose_headers:
+            self.response_headers.append(('Access-Control-Expose-Headers', ', '.join(expose_headers)))
+
+    def init_app(self, app):
+        # Preflights must not reach the hooks registered after this one.
+        app.before_request_funcs.setdefault(None, []).insert(0, self.answer_preflight)
+        app.after_request(self.add_headers)
+
+    def answer_preflight(self):
+        if request.method != 'OPTIONS' or 'Access-Control-Request-Method' not in request.headers:
+            return None
+        origin = request.headers.get('Origin')
+        if origin not in self.origins:
+            return '', 204, [('Vary', 'Origin')]
+        return '', 204, [('Access-Control-Allow-Origin', origin)] + self.preflight_headers
+
+    def add_headers(self, response):
+        response.vary.add('Origin')
+        origin = request.headers.get('Origin')
+        if origin not in self.origins or 'Access-Control-Allow-Origin' in response.headers:
+            return response
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers.extend(self.response_headers)
+        return response
@@ -0,0 +1,145 @@
+"""Delta sync: catalog rows created, updated or deleted after a cursor.
+
+Every change source is read with a keyset condition on
+``(timestamp, source, key)`` so pages never skip or repeat rows that share a
+timestamp.  The cursor is that triple, base64 encoded; clients treat it as
+opaque and send back the ``next_cursor`` of the previous page.
+
+Timestamps are taken when a row is written, not when its transaction
+commits, so a slow transaction can surface a row behind a cursor that has
+already moved on.  Rows are therefore only handed out once they are
+``SYNC_SETTLE_SECONDS`` old, and the last page's cursor stops at that
+horizon; a write is missed only if it took longer than that to commit.
+Tombstones are kept for ``TOMBSTONE_RETENTION``; an older cursor may have
+missed deletes and gets ``ResyncRequiredError``.
+"""
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, tuple_
+
+from .models import db, Movie, Actor, Tombstone, TOMBSTONE_RETENTION, movie_actor, utcnow
+
+
+SYNC_SETTLE_SECONDS = float(os.environ.get('SYNC_SETTLE_SECONDS', 5))
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+class ResyncRequiredError(Exception):
+    pass
+
+
+def _movie_change(movie):
+    return {'type': 'movie', 'action': 'upsert', 'data': movie.format()}
+
+
+def _actor_change(actor):
+    return {'type': 'actor', 'action': 'upsert', 'data': actor.format()}
+
+
+def _casting_change(casting):
+    return {
+        'type': 'casting',
+        'action': 'upsert',
+        'data': {'movie_id': casting.movie_id, 'actor_id': casting.actor_id}
+    }
+
+
+def _tombstone_change(tombstone):
+    return {'type': tombstone.entity, 'action': 'delete', 'data': tombstone.format()}
+
+
+# (name, timestamp column, key columns, row -> key, row -> change) in cursor order
+CHANGE_SOURCES = (
+    ('movie', Movie.updated_at, (Movie.id,), lambda row: [row.id], _movie_change),
+    ('actor', Actor.updated_at, (Actor.id,), lambda row: [row.id], _actor_change),
+    ('casting', movie_actor.c.created_at, (movie_actor.c.movie_id, movie_actor.c.actor_id),
+     lambda row: [row.movie_id, row.actor_id], _casting_change),
+    ('tombstone', Tombstone.deleted_at, (Tombstone.id,), lambda row: [row.id], _tombstone_change),
+)
+SOURCE_NAMES = [source[0] for source in CHANGE_SOURCES]
+
+
+def encode_cursor(timestamp, source, key):
+    raw = json.dumps([timestamp.isoformat(), source, key], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, source, key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if source not in SOURCE_NAMES or not all(isinstance(part, int) for part in key):
+            raise ValueError(source)
+        return datetime.fromisoformat(timestamp), SOURCE_NAMES.index(source), key
+    except (ValueError, TypeError):
+        raise InvalidCursorError('Invalid sync cursor')
+
+
+def _after_cursor(position, timestamp_column, key_columns, cursor):
+    since, since_position, since_key = cursor
+    if position > since_position:
+        return timestamp_column >= since
+    if position < since_position:
+        return timestamp_column > since
+    return or_(
+        timestamp_column > since,
+        and_(timestamp_column == since, tuple_(*key_columns) > tuple_(*since_key))
+    )
+
+
+def _horizon_cursor(horizon):
+    # Sorts before every row stamped at ``horizon``: first source, key 0.
+    return encode_cursor(horizon, SOURCE_NAMES[0], [0])
+
+
+def changes_since(cursor=None, limit=100):
+    """Return ``(changes, next_cursor, has_more)`` for at most ``limit`` rows."""
+    decoded = decode_cursor(cursor) if cursor else None
+    now = utcnow()
+    if decoded is not None and decoded[0] < now - TOMBSTONE_RETENTION:
+        raise ResyncRequiredError('Sync cursor is older than the tombstone retention, sync again without since')
+    horizon = now - timedelta(seconds=SYNC_SETTLE_SECONDS)
+
+    candidates = []
+    for position, (name, timestamp_column, key_columns, row_key, to_change) in enumerate(CHANGE_SOURCES):
+        if name == 'casting':
+            query = db.session.query(movie_actor)
+        else:
+            query = db.session.query(timestamp_column.class_)
+
+        query = query.filter(timestamp_column < horizon)
+        if decoded is not None:
+            query = query.filter(_after_cursor(position, timestamp_column, key_columns, decoded))
+
+        rows = query.order_by(timestamp_column, *key_columns).limit(limit + 1).all()
+        for row in rows:
+            timestamp = getattr(row, timestamp_column.key)
+            candidates.append((timestamp, position, row_key(row), row, to_change))
+
+    candidates.sort(key=lambda candidate: candidate[:3])
+    page = candidates[:limit]
+
+    changes = []
+    for timestamp, position, key, row, to_change in page:
+        change = to_change(row)
+        change['changed_at'] = timestamp.isoformat()
+        changes.append(change)
+
+    has_more = len(candidates) > limit
+    if has_more:
+        timestamp, position, key = page[-1][:3]
+        next_cursor = encode_cursor(timestamp, SOURCE_NAMES[position], key)
+    elif decoded is None or decoded[0] < horizon:
+        # Everything before the horizon has been returned; resume from it
+        # so an idle client's cursor does not age past the retention.
+        next_cursor = _horizon_cursor(horizon)
+    else:
+        next_cursor = cursor
+
+    return changes, next_cursor, has_more
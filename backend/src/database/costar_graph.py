@@ -0,0 +1,243 @@
+"""In-memory co-star graph built from the ``movie_actor`` association table.
+
+The bipartite graph is held as two adjacency maps of compact ``array('i')``
+rows (movie -> actors, actor -> movies).  It is loaded lazily with a single
+scan of ``movie_actor`` and then patched in place from ``catalog_changed``
+signals, so collaborator and path queries never join per hop.  Writes made
+by other worker processes are picked up by a periodic rebuild
+(``COSTAR_INDEX_MAX_AGE`` seconds).  Concurrent requests that find the index
+stale share one rebuild, and signals that arrive while it scans are replayed
+onto the new maps so none is lost at the swap.
+"""
+import heapq
+import os
+import threading
+import time
+from array import array
+from collections import Counter
+
+from sqlalchemy import text
+
+from ..singleflight import SingleFlight
+from .signals import catalog_changed
+
+
+COSTAR_INDEX_MAX_AGE = int(os.environ.get('COSTAR_INDEX_MAX_AGE', 300))
+
+_rebuilds = SingleFlight('costar_index')
+
+
+class CostarIndex:
+    def __init__(self, max_age=COSTAR_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._movie_actors = {}
+        self._actor_movies = {}
+        self._built_at = None
+        # Changes seen while a rebuild is scanning movie_actor, as
+        # (method name, args); replayed once the new maps are swapped in.
+        self._journal = None
+
+    @property
+    def is_built(self):
+        return self._built_at is not None
+
+    @property
+    def is_fresh(self):
+        return self.is_built and time.monotonic() - self._built_at < self.max_age
+
+    def build(self, castings):
+        movie_actors = {}
+        actor_movies = {}
+        for movie_id, actor_id in castings:
+            movie_actors.setdefault(movie_id, array('i')).append(actor_id)
+            actor_movies.setdefault(actor_id, array('i')).append(movie_id)
+
+        with self._lock:
+            journal, self._journal = self._journal, None
+            self._movie_actors = movie_actors
+            self._actor_movies = actor_movies
+            self._built_at = time.monotonic()
+            for name, args in journal or ():
+                getattr(self, name)(*args)
+
+    def ensure_built(self, session):
+        with self._lock:
+            fresh = self.is_fresh
+        if not fresh:
+            _rebuilds.do(id(self), lambda: self._rebuild(session))
+
+    def _rebuild(self, session):
+        with self._lock:
+            # A rebuild that finished while this one waited to lead is enough.
+            if self.is_fresh:
+                return
+            self._journal = []
+        try:
+            rows = session.execute(text('SELECT movie_id, actor_id FROM movie_actor')).all()
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        self.build(rows)
+
+    def _record(self, name, *args):
+        if self._journal is not None:
+            self._journal.append((name, args))
+
+    def invalidate(self):
+        with self._lock:
+            self._record('invalidate')
+            self._movie_actors = {}
+            self._actor_movies = {}
+            self._built_at = None
+
+    def add_casting(self, movie_id, actor_id):
+        with self._lock:
+            self._record('add_casting', movie_id, actor_id)
+            if not self.is_built:
+                return
+            actors = self._movie_actors.setdefault(movie_id, array('i'))
+            if actor_id not in actors:
+                actors.append(actor_id)
+                self._actor_movies.setdefault(actor_id, array('i')).append(movie_id)
+
+    def remove_casting(self, movie_id, actor_id):
+        with self._lock:
+            self._record('remove_casting', movie_id, actor_id)
+            if not self.is_built:
+                return
+            self._discard(self._movie_actors, movie_id, actor_id)
+            self._discard(self._actor_movies, actor_id, movie_id)
+
+    def remove_movie(self, movie_id):
+        with self._lock:
+            self._record('remove_movie', movie_id)
+            for actor_id in self._movie_actors.pop(movie_id, ()):
+                self._discard(self._actor_movies, actor_id, movie_id)
+
+    def remove_actor(self, actor_id):
+        with self._lock:
+            self._record('remove_actor', actor_id)
+            for movie_id in self._actor_movies.pop(actor_id, ()):
+                self._discard(self._movie_actors, movie_id, actor_id)
+
+    @staticmethod
+    def _discard(adjacency, node, neighbour):
+        row = adjacency.get(node)
+        if row is None or neighbour not in row:
+            return
+        row.remove(neighbour)
+        if not row:
+            del adjacency[node]
+
+    def costars(self, actor_id, limit=None):
+        """Return ``(total, [(costar_id, shared_movies), ...])`` by shared count."""
+        with self._lock:
+            shared = Counter()
+            for movie_id in self._actor_movies.get(actor_id, ()):
+                shared.update(self._movie_actors.get(movie_id, ()))
+        shared.pop(actor_id, None)
+
+        order = lambda item: (item[1], -item[0])
+        if limit is None:
+            ranked = sorted(shared.items(), key=order, reverse=True)
+        else:
+            ranked = heapq.nlargest(limit, shared.items(), key=order)
+        return len(shared), ranked
+
+    def shortest_path(self, source_actor_id, target_actor_id, max_degrees=6):
+        """Bidirectional BFS over actors.
+
+        Returns the path as alternating actor and movie ids
+        ``[actor, movie, actor, ..., actor]`` or ``None`` when the actors are
+        not connected within ``max_degrees`` movies.
+        """
+        if source_actor_id == target_actor_id:
+            return [source_actor_id]
+
+        with self._lock:
+            # parents[actor] = (previous actor, movie linking them)
+            forward = {source_actor_id: None}
+            backward = {target_actor_id: None}
+            forward_frontier = [source_actor_id]
+            backward_frontier = [target_actor_id]
+            degrees = 0
+
+            while forward_frontier and backward_frontier and degrees < max_degrees:
+                expand_forward = len(forward_frontier) <= len(backward_frontier)
+                if expand_forward:
+                    frontier, parents, others = forward_frontier, forward, backward
+                else:
+                    frontier, parents, others = backward_frontier, backward, forward
+
+                next_frontier = []
+                meetings = []
+                seen_movies = set()
+                for actor_id in frontier:
+                    for movie_id in self._actor_movies.get(actor_id, ()):
+                        if movie_id in seen_movies:
+                            continue
+                        seen_movies.add(movie_id)
+                        for costar_id in self._movie_actors.get(movie_id, ()):
+                            if costar_id in parents:
+                                continue
+                            parents[costar_id] = (actor_id, movie_id)
+                            next_frontier.append(costar_id)
+                            if costar_id in others:
+                                meetings.append(costar_id)
+
+                degrees += 1
+                if meetings:
+                    meeting = min(meetings, key=lambda actor: self._depth(forward, actor) + self._depth(backward, actor))
+                    return self._join(forward, backward, meeting)
+
+                if expand_forward:
+                    forward_frontier = next_frontier
+                else:
+                    backward_frontier = next_frontier
+
+        return None
+
+    @staticmethod
+    def _depth(parents, actor_id):
+        depth = 0
+        while parents[actor_id] is not None:
+            actor_id = parents[actor_id][0]
+            depth += 1
+        return depth
+
+    @staticmethod
+    def _join(forward, backward, meeting):
+        head = [meeting]
+        node = meeting
+        while forward[node] is not None:
+            previous, movie_id = forward[node]
+            head.extend((movie_id, previous))
+            node = previous
+        head.reverse()
+
+        node = meeting
+        while backward[node] is not None:
+            following, movie_id = backward[node]
+            head.extend((movie_id, following))
+            node = following
+        return head
+
+
+costar_index = CostarIndex()
+
+
+@catalog_changed.connect
+def _apply_catalog_change(entity, action=None, entity_id=None, **details):
+    if entity == 'casting':
+        if action == 'create':
+            costar_index.add_casting(details['movie_id'], details['actor_id'])
+        elif action == 'delete':
+            costar_index.remove_casting(details['movie_id'], details['actor_id'])
+    elif action == 'delete' and entity == 'movie':
+        costar_index.remove_movie(entity_id)
+    elif action == 'delete' and entity == 'actor':
+        costar_index.remove_actor(entity_id)
+    elif entity == 'catalog':
+        costar_index.invalidate()
@@ -1,31 +1,81 @@
 import os
-from sqlalchemy import Column, String, Integer, Date, ForeignKey, Table
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import (
+    Column, String, Integer, Date, DateTime, ForeignKey, Index, JSON, LargeBinary, Table, Text,
+    UniqueConstraint, delete, func, insert, literal, select, update
+)
 from sqlalchemy.orm import relationship
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from .search import index_document, remove_document, register_search_index
+from .signals import notify_catalog_change
 
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 db_dir = os.path.join(basedir, 'database')
-os.makedirs(db_dir, exist_ok=True)
-
 database_filename = 'casting_agency.db'
-database_path = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(db_dir, database_filename)}')
-
-if database_path and database_path.startswith('postgres://'):
-    database_path = database_path.replace('postgres://', 'postgresql://', 1)
 
 db = SQLAlchemy()
 migrate = Migrate()
 
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 movie_actor = Table('movie_actor', db.Model.metadata,
     Column('movie_id', Integer, ForeignKey('movies.id'), primary_key=True),
-    Column('actor_id', Integer, ForeignKey('actors.id'), primary_key=True)
+    Column('actor_id', Integer, ForeignKey('actors.id'), primary_key=True),
+    Column('created_at', DateTime, nullable=False, default=utcnow, index=True)
 )
 
-def setup_db(app, database_path=database_path):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+register_search_index(db.Model.metadata)
+
+
+def _update_returning(model, row_id, values, versions):
+    """One UPDATE ... RETURNING by id (and version); None when no row matched"""
+    if not values:
+        row = db.session.get(model, row_id)
+        if row is None or (versions is not None and row.version not in versions):
+            return None
+        return row
+
+    statement = update(model).where(model.id == row_id)
+    if versions is not None:
+        statement = statement.where(model.version.in_(versions))
+    statement = statement.values(**values, version=model.version + 1, updated_at=utcnow()).returning(model)
+    return db.session.execute(
+        statement,
+        execution_options={'synchronize_session': False, 'populate_existing': True}
+    ).scalar_one_or_none()
+
+
+def _delete_returning(model, row_id, versions):
+    statement = delete(model).where(model.id == row_id)
+    if versions is not None:
+        statement = statement.where(model.version.in_(versions))
+    return db.session.execute(
+        statement.returning(model.id),
+        execution_options={'synchronize_session': False}
+    ).first() is not None
+
+def database_uri():
+    """``DATABASE_URL``, or the bundled SQLite file (creating its directory)"""
+    database_path = os.environ.get('DATABASE_URL')
+    if not database_path:
+        os.makedirs(db_dir, exist_ok=True)
+        return f'sqlite:///{os.path.join(db_dir, database_filename)}'
+    if database_path.startswith('postgres://'):
+        database_path = database_path.replace('postgres://', 'postgresql://', 1)
+    return database_path
+
+
+def setup_db(app, database_path=None):
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_path or database_uri()
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
@@ -38,29 +88,83 @@ class Movie(db.Model):
     id = Column(Integer, primary_key=True)
     title = Column(String(120), nullable=False)
     release_date = Column(Date, nullable=False)
+    cast_count = Column(Integer, nullable=False, default=0, server_default='0', index=True)
+    updated_at = Column(DateTime, nullable=False, default=utcnow, onupdate=utcnow, index=True)
+    version = Column(Integer, nullable=False, server_default='1')
 
     actors = relationship('Actor', secondary=movie_actor, back_populates='movies')
 
+    # ORM UPDATE/DELETE add `AND version = :loaded` and bump it, raising
+    # StaleDataError when another writer got there first.
+    __mapper_args__ = {'version_id_col': version}
+
     def __init__(self, title, release_date):
         self.title = title
         self.release_date = release_date
 
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        index_document(db.session, 'movie', self.id, self.title)
         db.session.commit()
+        notify_catalog_change('movie', 'create', self.id)
 
     def update(self):
+        index_document(db.session, 'movie', self.id, self.title)
+        db.session.commit()
+        notify_catalog_change('movie', 'update', self.id)
+
+    @classmethod
+    def update_by_id(cls, movie_id, values, versions=None):
+        """Apply ``values`` with a single UPDATE ... RETURNING.
+
+        ``versions`` limits the update to those row versions (If-Match).
+        Returns the detached, updated movie, or None when no row matched.
+        """
+        movie = _update_returning(cls, movie_id, values, versions)
+        if movie is None:
+            db.session.rollback()
+            return None
+        if 'title' in values:
+            index_document(db.session, 'movie', movie.id, movie.title)
+        db.session.expunge(movie)
         db.session.commit()
+        notify_catalog_change('movie', 'update', movie_id)
+        return movie
 
     def delete(self):
-        db.session.delete(self)
+        Movie.delete_by_id(self.id)
+
+    @classmethod
+    def delete_by_id(cls, movie_id, versions=None):
+        """Delete a movie and its castings with set-based statements.
+
+        Returns False, leaving nothing changed, when no row matched.
+        """
+        castings = movie_actor.c.movie_id == movie_id
+        Tombstone.record_deletion('movie', movie_id)
+        db.session.execute(
+            update(Actor)
+            .where(Actor.id.in_(select(movie_actor.c.actor_id).where(castings)))
+            .values(filmography_count=Actor.filmography_count - 1),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(movie_actor.delete().where(castings))
+        if not _delete_returning(cls, movie_id, versions):
+            db.session.rollback()
+            return False
+        remove_document(db.session, 'movie', movie_id)
         db.session.commit()
+        notify_catalog_change('movie', 'delete', movie_id)
+        return True
 
     def format(self, include_actors=False):
         result = {
             'id': self.id,
             'title': self.title,
-            'release_date': self.release_date.strftime('%Y-%m-%d')
+            'release_date': self.release_date.strftime('%Y-%m-%d'),
+            'cast_count': self.cast_count,
+            'version': self.version
         }
         if include_actors:
             result['actors'] = [{'id': actor.id, 'name': actor.name} for actor in self.actors]
@@ -74,9 +178,14 @@ class Actor(db.Model):
     name = Column(String(120), nullable=False)
     birth_date = Column(Date, nullable=False)
     gender = Column(String(20), nullable=False)
+    filmography_count = Column(Integer, nullable=False, default=0, server_default='0', index=True)
+    updated_at = Column(DateTime, nullable=False, default=utcnow, onupdate=utcnow, index=True)
+    version = Column(Integer, nullable=False, server_default='1')
 
     movies = relationship('Movie', secondary=movie_actor, back_populates='actors')
 
+    __mapper_args__ = {'version_id_col': version}
+
     def __init__(self, name, birth_date, gender):
         self.name = name
         self.birth_date = birth_date
@@ -84,14 +193,52 @@ class Actor(db.Model):
 
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        index_document(db.session, 'actor', self.id, self.name)
         db.session.commit()
+        notify_catalog_change('actor', 'create', self.id)
 
     def update(self):
+        index_document(db.session, 'actor', self.id, self.name)
+        db.session.commit()
+        notify_catalog_change('actor', 'update', self.id)
+
+    @classmethod
+    def update_by_id(cls, actor_id, values, versions=None):
+        """Single-statement update; see Movie.update_by_id"""
+        actor = _update_returning(cls, actor_id, values, versions)
+        if actor is None:
+            db.session.rollback()
+            return None
+        if 'name' in values:
+            index_document(db.session, 'actor', actor.id, actor.name)
+        db.session.expunge(actor)
         db.session.commit()
+        notify_catalog_change('actor', 'update', actor_id)
+        return actor
 
     def delete(self):
-        db.session.delete(self)
+        Actor.delete_by_id(self.id)
+
+    @classmethod
+    def delete_by_id(cls, actor_id, versions=None):
+        """Set-based delete; see Movie.delete_by_id"""
+        castings = movie_actor.c.actor_id == actor_id
+        Tombstone.record_deletion('actor', actor_id)
+        db.session.execute(
+            update(Movie)
+            .where(Movie.id.in_(select(movie_actor.c.movie_id).where(castings)))
+            .values(cast_count=Movie.cast_count - 1),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(movie_actor.delete().where(castings))
+        if not _delete_returning(cls, actor_id, versions):
+            db.session.rollback()
+            return False
+        remove_document(db.session, 'actor', actor_id)
         db.session.commit()
+        notify_catalog_change('actor', 'delete', actor_id)
+        return True
 
     def calculate_age(self):
         from datetime import date
@@ -107,13 +254,160 @@ class Actor(db.Model):
             'name': self.name,
             'birth_date': self.birth_date.strftime('%Y-%m-%d'),
             'age': self.calculate_age(),
-            'gender': self.gender
+            'gender': self.gender,
+            'filmography_count': self.filmography_count,
+            'version': self.version
         }
         if include_movies:
             result['movies'] = [{'id': movie.id, 'title': movie.title} for movie in self.movies]
         return result
 
 
+# Tombstones are kept this long; delta-sync cursors older than that must
+# start over with a full sync.
+TOMBSTONE_RETENTION = timedelta(days=int(os.environ.get('TOMBSTONE_RETENTION_DAYS', 30)))
+TOMBSTONE_PURGE_INTERVAL = 3600
+
+_last_tombstone_purge = [0.0]
+_tombstone_purge_lock = threading.Lock()
+
+
+class Tombstone(db.Model):
+    """Marker left behind by a delete so delta-sync clients can drop the row"""
+    __tablename__ = 'tombstones'
+
+    id = Column(Integer, primary_key=True)
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(Integer, nullable=True)
+    movie_id = Column(Integer, nullable=True)
+    actor_id = Column(Integer, nullable=True)
+    deleted_at = Column(DateTime, nullable=False, default=utcnow, index=True)
+
+    @staticmethod
+    def purge_expired(now):
+        """Drop tombstones past the retention, at most once per interval"""
+        with _tombstone_purge_lock:
+            if time.monotonic() - _last_tombstone_purge[0] < TOMBSTONE_PURGE_INTERVAL:
+                return
+            _last_tombstone_purge[0] = time.monotonic()
+        db.session.execute(delete(Tombstone).where(Tombstone.deleted_at < now - TOMBSTONE_RETENTION))
+
+    @staticmethod
+    def record_casting(movie_id, actor_id):
+        deleted_at = utcnow()
+        Tombstone.purge_expired(deleted_at)
+        db.session.add(Tombstone(entity='casting', movie_id=movie_id, actor_id=actor_id, deleted_at=deleted_at))
+
+    @staticmethod
+    def record_deletion(entity, entity_id):
+        """Tombstone a movie or actor along with every casting it takes with it"""
+        column = movie_actor.c.movie_id if entity == 'movie' else movie_actor.c.actor_id
+        deleted_at = utcnow()
+        Tombstone.purge_expired(deleted_at)
+        db.session.execute(
+            insert(Tombstone).from_select(
+                ['entity', 'movie_id', 'actor_id', 'deleted_at'],
+                select(literal('casting'), movie_actor.c.movie_id, movie_actor.c.actor_id, literal(deleted_at))
+                .where(column == entity_id)
+            )
+        )
+        db.session.add(Tombstone(entity=entity, entity_id=entity_id, deleted_at=deleted_at))
+
+    def format(self):
+        if self.entity == 'casting':
+            return {'movie_id': self.movie_id, 'actor_id': self.actor_id}
+        return {'id': self.entity_id}
+
+
+class Job(db.Model):
+    """Durable unit of background work, run by `python manage.py worker`"""
+    __tablename__ = 'jobs'
+    __table_args__ = (Index('ix_jobs_status_run_after', 'status', 'run_after'),)
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(40), nullable=False)
+    status = Column(String(20), nullable=False, default='queued')
+    payload = Column(JSON, nullable=False, default=dict)
+    progress = Column(JSON, nullable=False, default=dict)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    created_by = Column(String(128), nullable=True)
+    # Role level of the creator; callers above it may read the job too.
+    created_by_level = Column(Integer, nullable=True)
+    run_after = Column(DateTime, nullable=False, default=utcnow)
+    locked_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=utcnow)
+    updated_at = Column(DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    def format(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+
+class IdempotencyKey(db.Model):
+    """First response to a request sent with an Idempotency-Key header.
+
+    ``status_code`` stays NULL while the first request is still running.
+    """
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (UniqueConstraint('principal', 'key', name='uq_idempotency_keys_principal_key'),)
+
+    id = Column(Integer, primary_key=True)
+    principal = Column(String(128), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    content_type = Column(String(100), nullable=True)
+    headers = Column(JSON, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+def adjust_casting_counters(movie_id, actor_id, delta):
+    """Move cast_count/filmography_count by delta inside the current transaction"""
+    db.session.execute(
+        update(Movie).where(Movie.id == movie_id).values(cast_count=Movie.cast_count + delta),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        update(Actor).where(Actor.id == actor_id).values(filmography_count=Actor.filmography_count + delta),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def rebuild_casting_counters():
+    """Recompute every counter from movie_actor with two set-based UPDATEs"""
+    db.session.execute(
+        update(Movie).values(cast_count=(
+            select(func.count())
+            .where(movie_actor.c.movie_id == Movie.id)
+            .scalar_subquery()
+        )),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        update(Actor).values(filmography_count=(
+            select(func.count())
+            .where(movie_actor.c.actor_id == Actor.id)
+            .scalar_subquery()
+        )),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+
+
 def db_drop_and_create_all():
     from datetime import date
 
@@ -150,4 +444,6 @@ def db_drop_and_create_all():
 
     movies[2].actors.append(actors[0])
 
-    db.session.commit()
\ No newline at end of file
+    db.session.commit()
+    rebuild_casting_counters()
+    notify_catalog_change('catalog', 'reset')
\ No newline at end of file
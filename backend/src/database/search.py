@@ -0,0 +1,282 @@
+"""Full-text search over movie titles and actor names.
+
+SQLite keeps a separate FTS5 table (trigram tokenizer) that the model write
+paths update alongside the base rows.  The FTS rowid encodes both the kind
+and the primary key (``id * 2`` for movies, ``id * 2 + 1`` for actors) so a
+single document can be replaced or removed with a rowid lookup instead of a
+scan.  Queries too short for trigrams use ``lower()`` expression indexes on
+the base columns instead.  Postgres relies on pg_trgm GIN indexes on the
+base columns, which the database maintains by itself.
+"""
+from sqlalchemy import DDL, event, text
+
+
+SEARCH_TABLE = 'search_index'
+SEARCH_KINDS = ('movie', 'actor')
+TRIGRAM_LENGTH = 3
+MAX_QUERY_TERMS = 8
+
+KIND_OFFSETS = {'movie': 0, 'actor': 1}
+KIND_SOURCES = {
+    'movie': ('movies', 'title'),
+    'actor': ('actors', 'name'),
+}
+
+SQLITE_CREATE_INDEX = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+    "USING fts5(label, tokenize='trigram')"
+)
+SQLITE_DROP_INDEX = f"DROP TABLE IF EXISTS {SEARCH_TABLE}"
+SQLITE_CREATE_PREFIX_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS ix_movies_title_prefix ON movies (lower(title))",
+    "CREATE INDEX IF NOT EXISTS ix_actors_name_prefix ON actors (lower(name))",
+)
+
+POSTGRES_CREATE_INDEXES = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_movies_title_trgm ON movies USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_actors_name_trgm ON actors USING gin (name gin_trgm_ops)",
+)
+
+_sqlite_index_state = {}
+
+
+class SearchQueryError(ValueError):
+    pass
+
+
+def register_search_index(metadata):
+    """Create and drop the dialect specific search structures with the schema."""
+    event.listen(metadata, 'after_create', DDL(SQLITE_CREATE_INDEX).execute_if(dialect='sqlite'))
+    event.listen(metadata, 'before_drop', DDL(SQLITE_DROP_INDEX).execute_if(dialect='sqlite'))
+    for statement in SQLITE_CREATE_PREFIX_INDEXES:
+        event.listen(metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    for statement in POSTGRES_CREATE_INDEXES:
+        event.listen(metadata, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+
+def _document_rowid(kind, ref_id):
+    return ref_id * 2 + KIND_OFFSETS[kind]
+
+
+def _uses_sqlite_index(session):
+    bind = session.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return False
+
+    key = str(bind.url)
+    if key not in _sqlite_index_state:
+        found = session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SEARCH_TABLE}
+        ).first()
+        if found is None:
+            # Databases created before the index existed keep working without
+            # search until `manage.py reindex` is run.  Do not cache the miss.
+            return False
+        _sqlite_index_state[key] = True
+    return _sqlite_index_state[key]
+
+
+def forget_index_state():
+    """Drop cached table lookups, e.g. after the schema was recreated."""
+    _sqlite_index_state.clear()
+
+
+def index_document(session, kind, ref_id, label):
+    """Insert or replace a document. Must run inside the writing transaction."""
+    if not _uses_sqlite_index(session):
+        return
+
+    rowid = _document_rowid(kind, ref_id)
+    session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :rowid"), {'rowid': rowid})
+    session.execute(
+        text(f"INSERT INTO {SEARCH_TABLE} (rowid, label) VALUES (:rowid, :label)"),
+        {'rowid': rowid, 'label': label}
+    )
+
+
+def remove_document(session, kind, ref_id):
+    if not _uses_sqlite_index(session):
+        return
+
+    session.execute(
+        text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :rowid"),
+        {'rowid': _document_rowid(kind, ref_id)}
+    )
+
+
+def rebuild_search_index(session):
+    """Recreate the SQLite index from the base tables. No-op elsewhere."""
+    bind = session.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for statement in POSTGRES_CREATE_INDEXES:
+            session.execute(text(statement))
+        session.commit()
+        return
+    if bind.dialect.name != 'sqlite':
+        return
+
+    session.execute(text(SQLITE_CREATE_INDEX))
+    for statement in SQLITE_CREATE_PREFIX_INDEXES:
+        session.execute(text(statement))
+    session.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    for kind, (table, column) in KIND_SOURCES.items():
+        session.execute(text(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, label) "
+            f"SELECT id * 2 + {KIND_OFFSETS[kind]}, {column} FROM {table}"
+        ))
+    session.commit()
+    forget_index_state()
+
+
+def _fts_phrase(value):
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _fts_term(term):
+    """Substring match on ``term`` or on either half of it.
+
+    A typo spoils at most one half of a word, so misspellings still match,
+    while every candidate shares a run of at least three characters with
+    the term instead of a single trigram.
+    """
+    half = max(TRIGRAM_LENGTH, (len(term) + 1) // 2)
+    if half >= len(term):
+        return _fts_phrase(term)
+    return f'({_fts_phrase(term[:half])} OR {_fts_phrase(term[-half:])})'
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _kind_filter(kinds):
+    if set(kinds) == set(SEARCH_KINDS):
+        return ''
+    return f" AND rowid % 2 = {KIND_OFFSETS[kinds[0]]}"
+
+
+def _search_sqlite_prefix(session, query, kinds, limit, offset):
+    # Too short for the trigram tokenizer: a range scan on the lower()
+    # indexes of the base columns, merged in label order so it stops as
+    # soon as the page is filled.
+    selects = []
+    for kind in kinds:
+        table, column = KIND_SOURCES[kind]
+        selects.append(
+            f"SELECT id * 2 + {KIND_OFFSETS[kind]} AS rowid, {column} AS label, lower({column}) AS sort_key "
+            f"FROM {table} WHERE lower({column}) >= :low AND lower({column}) < :high"
+        )
+    statement = text(
+        " UNION ALL ".join(selects) + " ORDER BY sort_key, rowid LIMIT :limit OFFSET :offset"
+    )
+    params = {'low': query, 'high': query[:-1] + chr(ord(query[-1]) + 1), 'limit': limit, 'offset': offset}
+    return [(rowid, label, 1.0) for rowid, label, _ in session.execute(statement, params)]
+
+
+def _search_sqlite(session, query, kinds, limit, offset):
+    terms = query.split()[:MAX_QUERY_TERMS]
+    long_terms = [term for term in terms if len(term) >= TRIGRAM_LENGTH]
+    short_terms = [term for term in terms if len(term) < TRIGRAM_LENGTH]
+
+    if not long_terms:
+        rows = _search_sqlite_prefix(session, query, kinds, limit, offset)
+    else:
+        # Every term of three or more characters must match (see _fts_term);
+        # shorter ones are checked on those candidates.  Prefix hits come
+        # first, then labels containing every term exactly, then bm25.
+        params = {'prefix': _escape_like(query) + '%', 'limit': limit, 'offset': offset}
+        exact, short = [], []
+        for number, term in enumerate(long_terms):
+            params[f'term{number}'] = term
+            exact.append(f"instr(lower(label), :term{number}) > 0")
+        for number, term in enumerate(short_terms):
+            params[f'short{number}'] = term
+            short.append(f" AND instr(lower(label), :short{number}) > 0")
+        params['match'] = ' AND '.join(_fts_term(term) for term in long_terms)
+        statement = text(
+            f"SELECT rowid, label, -bm25({SEARCH_TABLE}) AS score FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH :match{_kind_filter(kinds)}{''.join(short)} "
+            f"ORDER BY label LIKE :prefix ESCAPE '\\' DESC, ({' AND '.join(exact)}) DESC, "
+            f"bm25({SEARCH_TABLE}), length(label), rowid "
+            "LIMIT :limit OFFSET :offset"
+        )
+        rows = session.execute(statement, params)
+
+    hits = []
+    for rowid, label, score in rows:
+        kind = 'actor' if rowid % 2 else 'movie'
+        hits.append({'type': kind, 'id': rowid // 2, 'label': label, 'score': round(score, 4)})
+    return hits
+
+
+def _search_postgres(session, query, kinds, limit, offset):
+    selects = []
+    for kind in kinds:
+        table, column = KIND_SOURCES[kind]
+        selects.append(
+            f"SELECT '{kind}' AS kind, id, {column} AS label, similarity({column}, :query) AS score "
+            f"FROM {table} WHERE {column} % :query OR {column} ILIKE :prefix"
+        )
+
+    statement = text(
+        "SELECT kind, id, label, score FROM (" + " UNION ALL ".join(selects) + ") AS hits "
+        "ORDER BY label ILIKE :prefix DESC, score DESC, length(label), kind, id "
+        "LIMIT :limit OFFSET :offset"
+    )
+    params = {'query': query, 'prefix': _escape_like(query) + '%', 'limit': limit, 'offset': offset}
+    return [
+        {'type': kind, 'id': ref_id, 'label': label, 'score': round(float(score), 4)}
+        for kind, ref_id, label, score in session.execute(statement, params)
+    ]
+
+
+def _search_like(session, query, kinds, limit, offset):
+    selects = []
+    for kind in kinds:
+        table, column = KIND_SOURCES[kind]
+        selects.append(
+            f"SELECT '{kind}' AS kind, id, {column} AS label FROM {table} "
+            f"WHERE lower({column}) LIKE :pattern ESCAPE '\\'"
+        )
+
+    statement = text(
+        "SELECT kind, id, label FROM (" + " UNION ALL ".join(selects) + ") AS hits "
+        "ORDER BY lower(label) LIKE :prefix ESCAPE '\\' DESC, length(label), kind, id "
+        "LIMIT :limit OFFSET :offset"
+    )
+    escaped = _escape_like(query)
+    params = {'pattern': f'%{escaped}%', 'prefix': f'{escaped}%', 'limit': limit, 'offset': offset}
+    return [
+        {'type': kind, 'id': ref_id, 'label': label, 'score': 1.0}
+        for kind, ref_id, label in session.execute(statement, params)
+    ]
+
+
+def search_catalog(session, query, kinds=SEARCH_KINDS, page=0, per_page=20):
+    """Ranked search over titles and names.
+
+    Returns ``(hits, has_more)``; one extra row is fetched to detect further
+    pages so no COUNT over the match set is needed.
+    """
+    query = ' '.join((query or '').lower().split())
+    if not query:
+        raise SearchQueryError('Search query is required')
+
+    kinds = tuple(kinds)
+    if not kinds or any(kind not in SEARCH_KINDS for kind in kinds):
+        raise SearchQueryError('Invalid search type')
+
+    limit = per_page + 1
+    offset = page * per_page
+    dialect = session.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        hits = _search_postgres(session, query, kinds, limit, offset)
+    elif _uses_sqlite_index(session):
+        hits = _search_sqlite(session, query, kinds, limit, offset)
+    else:
+        hits = _search_like(session, query, kinds, limit, offset)
+
+    return hits[:per_page], len(hits) > per_page
@@ -0,0 +1,16 @@
+"""Signals sent after catalog writes have been committed.
+
+Receivers get the entity name as the sender (``'movie'``, ``'actor'``,
+``'casting'`` or ``'catalog'`` for a full reset) plus the action and ids as
+keyword arguments.
+"""
+from blinker import Namespace
+
+
+_signals = Namespace()
+
+catalog_changed = _signals.signal('catalog-changed')
+
+
+def notify_catalog_change(entity, action, entity_id=None, **details):
+    catalog_changed.send(entity, action=action, entity_id=entity_id, **details)
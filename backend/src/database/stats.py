@@ -0,0 +1,97 @@
+"""Aggregate catalog statistics computed with GROUP BY queries.
+
+Results are cached per worker and dropped whenever a ``catalog_changed``
+signal arrives.  The TTL bounds how long a worker can serve numbers that
+miss writes handled by another worker.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import func
+
+from .models import db, Movie, Actor, movie_actor
+from .signals import catalog_changed
+
+
+STATS_CACHE_TTL = int(os.environ.get('STATS_CACHE_TTL', 60))
+
+
+class StatsCache:
+    def __init__(self, ttl=STATS_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+            generation = self._generation
+
+        value = compute()
+        with self._lock:
+            # Not kept if the catalog changed while it was being computed.
+            if generation == self._generation:
+                self._entries[key] = (value, now + self.ttl)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+
+stats_cache = StatsCache()
+
+
+@catalog_changed.connect
+def _invalidate_stats(entity, **kwargs):
+    stats_cache.clear()
+
+
+def movies_per_year():
+    year = func.extract('year', Movie.release_date)
+    rows = (
+        db.session.query(year.label('year'), func.count(Movie.id))
+        .group_by(year)
+        .order_by(year)
+        .all()
+    )
+    return [{'year': int(year), 'movies': count} for year, count in rows]
+
+
+def cast_size_distribution():
+    rows = (
+        db.session.query(Movie.cast_count, func.count(Movie.id))
+        .group_by(Movie.cast_count)
+        .order_by(Movie.cast_count)
+        .all()
+    )
+    return [{'cast_size': size, 'movies': count} for size, count in rows]
+
+
+def actors_by_gender():
+    rows = (
+        db.session.query(Actor.gender, func.count(Actor.id))
+        .group_by(Actor.gender)
+        .order_by(func.count(Actor.id).desc(), Actor.gender)
+        .all()
+    )
+    return [{'gender': gender, 'actors': count} for gender, count in rows]
+
+
+def busiest_actors(limit=10):
+    movie_count = func.count(movie_actor.c.movie_id)
+    rows = (
+        db.session.query(Actor.id, Actor.name, movie_count)
+        .join(movie_actor, movie_actor.c.actor_id == Actor.id)
+        .group_by(Actor.id, Actor.name)
+        .order_by(movie_count.desc(), Actor.id)
+        .limit(limit)
+        .all()
+    )
+    return [{'id': actor_id, 'name': name, 'movies': count} for actor_id, name, count in rows]
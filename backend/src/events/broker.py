@@ -0,0 +1,173 @@
+"""Fan-out brokers for catalog change events.
+
+``InProcessBroker`` delivers to subscribers of the current worker only and
+is enough for a single gunicorn worker.  With several workers every publish
+has to reach every worker, so ``PostgresBroker`` (LISTEN/NOTIFY) and
+``RedisBroker`` (PUBLISH/SUBSCRIBE) forward through the shared service and
+deliver locally from a listener thread.
+"""
+import json
+import queue
+import select
+import threading
+
+
+SUBSCRIBER_QUEUE_SIZE = 100
+EVENTS_CHANNEL = 'catalog_events'
+
+
+class Subscription:
+    def __init__(self, broker, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self._broker = broker
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # A stalled client must not hold events for everyone else;
+            # the stream ends and the client resyncs from /changes.
+            self.overflowed = True
+
+    def get(self, timeout=None):
+        """Next event, or ``None`` when nothing arrived within ``timeout``."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._sequence = 0
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        self._deliver(event)
+
+    def _deliver(self, event):
+        with self._lock:
+            self._sequence += 1
+            event = dict(event, sequence=self._sequence)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+
+class _ListeningBroker(InProcessBroker):
+    """Publishes to a shared service and delivers what a listener thread reads back."""
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        self._listener = None
+
+    def subscribe(self):
+        self._ensure_listener()
+        return super().subscribe()
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen_forever, name='event-broker', daemon=True)
+            self._listener.start()
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                threading.Event().wait(1)
+
+
+class PostgresBroker(_ListeningBroker):
+    def __init__(self, url):
+        super().__init__(url)
+        self._publish_lock = threading.Lock()
+        self._publish_connection = None
+
+    def _connect(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        connection = psycopg2.connect(self.url)
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return connection
+
+    def publish(self, event):
+        payload = json.dumps(event)
+        with self._publish_lock:
+            try:
+                if self._publish_connection is None or self._publish_connection.closed:
+                    self._publish_connection = self._connect()
+                with self._publish_connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_notify(%s, %s)', (EVENTS_CHANNEL, payload))
+            except Exception:
+                self._publish_connection = None
+                raise
+
+    def _listen(self):
+        connection = self._connect()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {EVENTS_CHANNEL}')
+            while True:
+                if select.select([connection], [], [], 30) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notification = connection.notifies.pop(0)
+                    self._deliver(json.loads(notification.payload))
+        finally:
+            connection.close()
+
+
+class RedisBroker(_ListeningBroker):
+    def __init__(self, url):
+        super().__init__(url)
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+
+    def publish(self, event):
+        self._client.publish(EVENTS_CHANNEL, json.dumps(event))
+
+    def _listen(self):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(EVENTS_CHANNEL)
+        try:
+            for message in pubsub.listen():
+                self._deliver(json.loads(message['data']))
+        finally:
+            pubsub.close()
+
+
+def create_broker(url=None):
+    """Pick a broker from ``EVENT_BROKER_URL``; in-process when unset."""
+    if not url or url.startswith('memory:'):
+        return InProcessBroker()
+    if url.startswith(('postgres://', 'postgresql://')):
+        return PostgresBroker(url.replace('postgres://', 'postgresql://', 1))
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBroker(url)
+    raise ValueError(f'Unsupported event broker URL: {url}')
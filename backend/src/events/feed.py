@@ -0,0 +1,53 @@
+"""Server-Sent Events feed of committed catalog changes."""
+import json
+import os
+
+from ..database.signals import catalog_changed
+from .broker import create_broker
+
+
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get('EVENT_HEARTBEAT_SECONDS', 15))
+EVENT_RETRY_MILLISECONDS = 5000
+
+event_broker = create_broker(os.environ.get('EVENT_BROKER_URL'))
+
+
+@catalog_changed.connect
+def _publish_catalog_change(entity, action=None, entity_id=None, **details):
+    event = {'entity': entity, 'action': action, 'id': entity_id}
+    event.update(details)
+    try:
+        event_broker.publish(event)
+    except Exception:
+        # The write is already committed; live subscribers can recover the
+        # change from /changes, so a broker outage must not fail the request.
+        pass
+
+
+def format_sse(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event is not None:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream_events(broker=None, heartbeat=EVENT_HEARTBEAT_SECONDS):
+    """Yield SSE frames for one client until it disconnects or falls behind."""
+    subscription = (broker or event_broker).subscribe()
+    try:
+        yield f'retry: {EVENT_RETRY_MILLISECONDS}\n\n'
+        while True:
+            event = subscription.get(timeout=heartbeat)
+            if subscription.overflowed:
+                yield format_sse({'reason': 'client too slow, resync from /changes'}, event='overflow')
+                return
+            if event is None:
+                yield ': keep-alive\n\n'
+                continue
+            sequence = event.pop('sequence', None)
+            yield format_sse(event, event=event['entity'], event_id=sequence)
+    finally:
+        subscription.close()
@@ -0,0 +1,174 @@
+"""Idempotency-Key support for POST endpoints.
+
+The first request carrying a key inserts a row for ``(principal, key)``
+before the handler runs; the unique constraint makes that insert the lock,
+so concurrent retries get a ``409`` instead of running the write again.
+Once the handler returns, its response is stored and later retries within
+``IDEMPOTENCY_TTL`` seconds get it back unchanged.  Responses with a 5xx or
+429 status, and handlers that raise, release the key so the client can
+retry for real.
+"""
+import hashlib
+import os
+import threading
+import time
+from datetime import timedelta
+from functools import wraps
+
+from flask import Response, jsonify, make_response, request
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .auth.auth import current_principal
+from .database.models import db, IdempotencyKey, utcnow
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 60 * 60))
+# A key still marked in flight after this long belongs to a dead request.
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+IDEMPOTENCY_PURGE_INTERVAL = 300
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADERS = ('Location',)
+
+_last_purge = [0.0]
+_purge_lock = threading.Lock()
+
+
+def _request_hash():
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.full_path.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _purge_expired(now):
+    with _purge_lock:
+        if time.monotonic() - _last_purge[0] < IDEMPOTENCY_PURGE_INTERVAL:
+            return
+        _last_purge[0] = time.monotonic()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+    db.session.commit()
+
+
+def _is_stale(record, now):
+    if record.expires_at <= now:
+        return True
+    return record.status_code is None and record.created_at <= now - timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT)
+
+
+def _claim(principal, key, fingerprint):
+    """Return ``(record, owned)``; owned records must be stored or released"""
+    now = utcnow()
+    _purge_expired(now)
+
+    record = IdempotencyKey(
+        principal=principal,
+        key=key,
+        request_hash=fingerprint,
+        created_at=now,
+        expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL)
+    )
+    db.session.add(record)
+    try:
+        db.session.commit()
+        return record, True
+    except IntegrityError:
+        db.session.rollback()
+
+    existing = db.session.scalars(
+        select(IdempotencyKey).where(IdempotencyKey.principal == principal, IdempotencyKey.key == key)
+    ).first()
+    if existing is None or not _is_stale(existing, now):
+        return existing, False
+
+    # Take over an expired or abandoned key; only one retry can win.
+    taken = db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == existing.id, IdempotencyKey.created_at == existing.created_at)
+        .values(
+            request_hash=fingerprint, status_code=None, content_type=None, headers=None, body=None,
+            created_at=now, expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL)
+        ),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    db.session.commit()
+    return db.session.get(IdempotencyKey, existing.id, populate_existing=True), bool(taken)
+
+
+def _store(record_id, response):
+    db.session.rollback()
+    db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == record_id)
+        .values(
+            status_code=response.status_code,
+            content_type=response.content_type,
+            headers={name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers},
+            body=response.get_data()
+        ),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+
+
+def _release(record_id):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == record_id))
+    db.session.commit()
+
+
+def _replay(record):
+    response = Response(record.body, status=record.status_code, content_type=record.content_type)
+    for name, value in (record.headers or {}).items():
+        response.headers[name] = value
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _error(status_code, message):
+    return jsonify({
+        'success': False,
+        'error': status_code,
+        'message': message
+    }), status_code
+
+
+def idempotent(f):
+    """Honour Idempotency-Key on a handler that takes the auth payload first"""
+    @wraps(f)
+    def wrapper(payload, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return f(payload, *args, **kwargs)
+
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return _error(400, f'{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters')
+
+        fingerprint = _request_hash()
+        record, owned = _claim(current_principal(payload).user_id or '', key, fingerprint)
+
+        if not owned:
+            if record is not None and record.request_hash != fingerprint:
+                return _error(422, f'{IDEMPOTENCY_HEADER} was already used for a different request')
+            if record is None or record.status_code is None:
+                response, status_code = _error(409, 'A request with this Idempotency-Key is still in progress')
+                response.headers['Retry-After'] = '1'
+                return response, status_code
+            return _replay(record)
+
+        record_id = record.id
+        try:
+            response = make_response(f(payload, *args, **kwargs))
+        except Exception:
+            _release(record_id)
+            raise
+
+        if response.status_code >= 500 or response.status_code == 429:
+            _release(record_id)
+        else:
+            _store(record_id, response)
+        return response
+
+    return wrapper
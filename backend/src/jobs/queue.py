@@ -0,0 +1,196 @@
+"""Durable job queue on top of the ``jobs`` table.
+
+Jobs are claimed with a conditional UPDATE (``status`` still claimable), so
+several worker processes can poll the same table without handing one job to
+two of them.  A claim holds a lease of ``JOB_LEASE_SECONDS``; jobs left
+``running`` by a crashed worker become claimable again once it expires.
+Failures are retried with exponential backoff until ``max_attempts``.
+Handlers record finished steps in ``job.progress`` with ``checkpoint`` so a
+retry resumes after the last remote call that succeeded.
+
+Payload fields in ``SECRET_FIELDS`` are encrypted before they are stored
+(``JOB_SECRET_KEY``, shared by the web and worker processes) and read back
+with ``secret``; a value older than ``JOB_SECRET_TTL`` no longer decrypts.
+Without a key nothing secret can be queued: ``can_seal_secrets`` is false and
+callers do that work in the request instead.
+"""
+import base64
+import hashlib
+import os
+import time
+from datetime import timedelta
+
+from cryptography.fernet import Fernet, InvalidToken
+from sqlalchemy import and_, or_, select, update
+
+from ..database.models import db, Job, utcnow
+
+
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_DELAY = float(os.environ.get('JOB_RETRY_DELAY', 2))
+JOB_MAX_RETRY_DELAY = float(os.environ.get('JOB_MAX_RETRY_DELAY', 300))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 120))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+JOB_SECRET_KEY = os.environ.get('JOB_SECRET_KEY')
+JOB_SECRET_TTL = int(os.environ.get('JOB_SECRET_TTL', 86400))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+# Payload fields dropped once a job no longer needs them.
+SECRET_FIELDS = ('password',)
+
+_handlers = {}
+
+
+class PermanentJobError(Exception):
+    """Failure that a retry cannot fix"""
+
+
+def job_handler(kind):
+    """Register ``f(job) -> result`` as the handler for ``kind``"""
+    def decorator(f):
+        _handlers[kind] = f
+        return f
+    return decorator
+
+
+def can_seal_secrets():
+    return bool(JOB_SECRET_KEY)
+
+
+def _cipher():
+    if not JOB_SECRET_KEY:
+        raise PermanentJobError('JOB_SECRET_KEY is not set')
+    key = hashlib.sha256(b'job-secrets:' + JOB_SECRET_KEY.encode()).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def seal_secrets(payload):
+    """Payload with its ``SECRET_FIELDS`` encrypted"""
+    if not any(payload.get(field) is not None for field in SECRET_FIELDS):
+        return payload
+    cipher = _cipher()
+    return {
+        key: cipher.encrypt(value.encode()).decode() if key in SECRET_FIELDS and value is not None else value
+        for key, value in payload.items()
+    }
+
+
+def secret(job, field):
+    """Plaintext of an encrypted payload field"""
+    try:
+        return _cipher().decrypt(job.payload[field].encode(), ttl=JOB_SECRET_TTL).decode()
+    except InvalidToken:
+        raise PermanentJobError(f'{field} expired or was sealed with another JOB_SECRET_KEY')
+
+
+def enqueue(kind, payload, created_by=None, created_by_level=None, max_attempts=None):
+    job = Job(
+        kind=kind,
+        payload=seal_secrets(payload),
+        created_by=created_by,
+        created_by_level=created_by_level,
+        max_attempts=max_attempts or JOB_MAX_ATTEMPTS
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def checkpoint(job, **progress):
+    """Persist finished steps so a retried job skips them"""
+    job.progress = {**(job.progress or {}), **progress}
+    db.session.commit()
+
+
+def scrub_payload(job):
+    if any(field in job.payload for field in SECRET_FIELDS):
+        job.payload = {key: value for key, value in job.payload.items() if key not in SECRET_FIELDS}
+
+
+def retry_delay(attempts):
+    return min(JOB_RETRY_DELAY * 2 ** (attempts - 1), JOB_MAX_RETRY_DELAY)
+
+
+def _claimable(now):
+    return or_(
+        and_(Job.status == QUEUED, Job.run_after <= now),
+        and_(Job.status == RUNNING, Job.locked_until < now)
+    )
+
+
+def claim_next(now=None):
+    """Lease the next due job to this worker, or return None"""
+    now = now or utcnow()
+    candidates = db.session.scalars(
+        select(Job.id).where(_claimable(now)).order_by(Job.run_after, Job.id).limit(10)
+    ).all()
+
+    for job_id in candidates:
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, _claimable(now))
+            .values(
+                status=RUNNING,
+                attempts=Job.attempts + 1,
+                locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                updated_at=now
+            ),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id, populate_existing=True)
+    return None
+
+
+def run_job(job):
+    handler = _handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise PermanentJobError(f'Unknown job kind: {job.kind}')
+        if job.attempts > job.max_attempts:
+            raise PermanentJobError('Job lease expired too many times')
+        result = handler(job)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job.id, populate_existing=True)
+        job.error = str(e)
+        job.locked_until = None
+        if isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts:
+            job.status = FAILED
+            scrub_payload(job)
+        else:
+            job.status = QUEUED
+            job.run_after = utcnow() + timedelta(seconds=retry_delay(job.attempts))
+        db.session.commit()
+        return job
+
+    job.status = SUCCEEDED
+    job.result = result
+    job.error = None
+    job.locked_until = None
+    scrub_payload(job)
+    db.session.commit()
+    return job
+
+
+def run_pending(limit=None):
+    """Run due jobs until none are left (or ``limit`` ran). Returns the count."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def work(poll_interval=JOB_POLL_INTERVAL, should_stop=lambda: False):
+    while not should_stop():
+        if not run_pending():
+            time.sleep(poll_interval)
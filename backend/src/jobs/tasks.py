@@ -0,0 +1,79 @@
+"""Auth0 user provisioning and role changes run by the job worker."""
+from contextlib import contextmanager
+
+from ..auth.auth0_management import (
+    Auth0ManagementError,
+    assign_roles_to_user,
+    create_auth0_user,
+    get_all_roles,
+    get_auth0_users,
+    get_management_api_token,
+)
+from .queue import PermanentJobError, checkpoint, job_handler, scrub_payload, secret
+
+
+PROVISION_USER = 'provision_user'
+ASSIGN_USER_ROLES = 'assign_user_roles'
+
+
+@contextmanager
+def _fail_when_rejected():
+    """Fail the job at once when Auth0 refuses the request itself"""
+    try:
+        yield
+    except Auth0ManagementError as e:
+        if e.rejected:
+            raise PermanentJobError(e.message) from e
+        raise
+
+
+def _find_user_by_email(token, email):
+    users = get_auth0_users(token, search_query=f'email:"{email}"').get('users', [])
+    for user in users:
+        if user.get('email') == email:
+            return user
+    return None
+
+
+def _role_id(token, role_name):
+    for role in get_all_roles(token):
+        if role.get('name') == role_name:
+            return role.get('id')
+    return None
+
+
+@job_handler(PROVISION_USER)
+@_fail_when_rejected()
+def provision_user(job):
+    payload = job.payload
+    progress = job.progress or {}
+    token = get_management_api_token()
+
+    user = progress.get('user')
+    if user is None:
+        if job.attempts > 1:
+            # An earlier attempt may have created the user and then failed
+            # before recording it.
+            user = _find_user_by_email(token, payload['email'])
+        if user is None:
+            user = create_auth0_user(token, payload['email'], secret(job, 'password'), payload.get('name'))
+        scrub_payload(job)
+        checkpoint(job, user=user)
+
+    role_name = payload.get('role')
+    if role_name and not progress.get('role_assigned'):
+        role_id = _role_id(token, role_name)
+        if role_id:
+            assign_roles_to_user(token, user['user_id'], [role_id])
+        checkpoint(job, role_assigned=True)
+
+    return {'user': user, 'role_assigned': role_name}
+
+
+@job_handler(ASSIGN_USER_ROLES)
+@_fail_when_rejected()
+def assign_user_roles(job):
+    user_id = job.payload['user_id']
+    role_ids = job.payload['roles']
+    assign_roles_to_user(get_management_api_token(), user_id, role_ids)
+    return {'user_id': user_id, 'roles': role_ids}
@@ -0,0 +1,14 @@
+"""Job worker process: ``python manage.py worker [--once]``."""
+import signal
+
+from . import tasks  # noqa: F401  registers the job handlers
+from .queue import JOB_POLL_INTERVAL, run_pending, work
+
+
+def run_worker(once=False, poll_interval=JOB_POLL_INTERVAL):
+    if once:
+        return run_pending()
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    work(poll_interval, should_stop=lambda: bool(stopping))
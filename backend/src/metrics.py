@@ -0,0 +1,39 @@
+"""Process-local metrics rendered in the Prometheus text format.
+
+Components register a collector once; it is only called when ``/metrics``
+is scraped, so instrumented code pays nothing beyond its own counters.
+"""
+import threading
+
+
+_lock = threading.Lock()
+_collectors = {}
+
+
+def register_metric(name, kind, description, collect):
+    """``collect()`` returns a number or a list of ``(labels, value)`` pairs."""
+    with _lock:
+        _collectors[name] = (kind, description, collect)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return '{' + pairs + '}'
+
+
+def render_metrics():
+    with _lock:
+        collectors = sorted(_collectors.items())
+
+    lines = []
+    for name, (kind, description, collect) in collectors:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        samples = collect()
+        if not isinstance(samples, list):
+            samples = [({}, samples)]
+        for labels, value in samples:
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
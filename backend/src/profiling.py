@@ -0,0 +1,249 @@
+"""On-demand profiling of a running worker.
+
+Two kinds of session, both started through ``POST /profiling``:
+
+``requests``
+    cProfile the next ``count`` requests to one route.  The report is the
+    aggregated ``pstats`` dump (snakeviz, flameprof, gprof2dot) or a text
+    summary.  One request is profiled at a time.
+``sample``
+    Sample the stack of every thread in the worker every ``interval_ms`` for
+    ``seconds`` from a native thread.  The report is in the collapsed-stack
+    format read by flamegraph.pl and speedscope.
+
+Sessions live in the worker that started them.  With nothing armed, the only
+per-request cost is one check of an empty tuple.
+"""
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from flask import g, request
+
+try:
+    # The sampler must be a native thread even when gevent has patched threading.
+    from gevent import monkey
+    _Thread = monkey.get_original('threading', 'Thread')
+    _get_ident = monkey.get_original('_thread', 'get_ident')
+    _sleep = monkey.get_original('time', 'sleep')
+except ImportError:  # optional
+    _Thread = threading.Thread
+    _get_ident = threading.get_ident
+    _sleep = time.sleep
+
+
+PROFILE_MAX_REQUESTS = 100
+PROFILE_MAX_SECONDS = 60
+PROFILE_KEPT_SESSIONS = 5
+
+RUNNING = 'running'
+DONE = 'done'
+
+
+class ProfileSession:
+    kind = None
+    formats = ()
+
+    def __init__(self, session_id):
+        self.id = session_id
+        self.state = RUNNING
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def finish(self):
+        self.state = DONE
+        self.finished_at = time.time()
+
+    def format(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'formats': list(self.formats),
+        }
+
+
+class RequestProfile(ProfileSession):
+    kind = 'requests'
+    formats = ('pstats', 'text')
+
+    def __init__(self, session_id, route, count):
+        super().__init__(session_id)
+        self.route = route
+        self.count = count
+        self.profiled = 0
+        self._stats = None
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+
+    def begin(self):
+        """A started profiler for this request, or None if another is running"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another tool already owns the profiler hook
+            self._busy.release()
+            return None
+        return profiler
+
+    def end(self, profiler):
+        profiler.disable()
+        self._busy.release()
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profiler)
+            else:
+                self._stats.add(profiler)
+            self.profiled += 1
+            if self.profiled >= self.count and self.state == RUNNING:
+                self.finish()
+
+    def report(self, report_format):
+        with self._lock:
+            if self._stats is None:
+                return None
+            if report_format == 'pstats':
+                return marshal.dumps(self._stats.stats)
+            output = io.StringIO()
+            self._stats.stream = output
+            self._stats.sort_stats('cumulative').print_stats(50)
+            return output.getvalue()
+
+    def format(self):
+        return dict(super().format(), route=self.route, count=self.count, profiled=self.profiled)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_name}"
+
+
+def fold_stack(frame, thread_name):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.append(thread_name)
+    return ';'.join(reversed(names))
+
+
+class SampleProfile(ProfileSession):
+    kind = 'sample'
+    formats = ('folded',)
+
+    def __init__(self, session_id, seconds, interval):
+        super().__init__(session_id)
+        self.seconds = seconds
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+
+    def start(self):
+        _Thread(target=self._run, name=f'profiler-{self.id}', daemon=True).start()
+        return self
+
+    def _run(self):
+        own = _get_ident()
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, frame in frames.items():
+                    if ident != own:
+                        self._stacks[fold_stack(frame, names.get(ident, f'thread-{ident}'))] += 1
+                self.samples += 1
+            _sleep(self.interval)
+        self.finish()
+
+    def report(self, report_format):
+        with self._lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self._stacks.most_common())
+
+    def format(self):
+        return dict(super().format(), seconds=self.seconds, interval_ms=self.interval * 1000, samples=self.samples)
+
+
+class Profiler:
+    """Sessions of this worker; ``armed`` is what the request hooks check"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.sessions = OrderedDict()
+        self.armed = ()
+
+    def _keep(self, session):
+        self.sessions[session.id] = session
+        while len(self.sessions) > PROFILE_KEPT_SESSIONS:
+            self.sessions.popitem(last=False)
+
+    def profile_requests(self, route, count):
+        if not isinstance(route, str) or not route.startswith('/'):
+            raise ValueError('route must be a URL rule such as /movies/<int:movie_id>')
+        if not isinstance(count, int) or not 1 <= count <= PROFILE_MAX_REQUESTS:
+            raise ValueError(f'count must be between 1 and {PROFILE_MAX_REQUESTS}')
+        with self._lock:
+            session = RequestProfile(str(next(self._ids)), route, count)
+            self._keep(session)
+            self.armed = self.armed + (session,)
+        return session
+
+    def sample(self, seconds, interval_ms=10):
+        if not isinstance(seconds, (int, float)) or not 0 < seconds <= PROFILE_MAX_SECONDS:
+            raise ValueError(f'seconds must be between 0 and {PROFILE_MAX_SECONDS}')
+        if not isinstance(interval_ms, (int, float)) or not 1 <= interval_ms <= 1000:
+            raise ValueError('interval_ms must be between 1 and 1000')
+        with self._lock:
+            session = SampleProfile(str(next(self._ids)), seconds, interval_ms / 1000)
+            self._keep(session)
+        return session.start()
+
+    def get(self, session_id):
+        with self._lock:
+            return self.sessions.get(session_id)
+
+    def disarm(self, session):
+        with self._lock:
+            self.armed = tuple(armed for armed in self.armed if armed is not session)
+
+
+profiler = Profiler()
+
+
+def _begin_request_profile():
+    if not profiler.armed:
+        return
+    rule = request.url_rule.rule if request.url_rule else None
+    for session in profiler.armed:
+        if session.route == rule and session.state == RUNNING:
+            started = session.begin()
+            if started is not None:
+                g.request_profile = (session, started)
+            return
+
+
+def _end_request_profile(error=None):
+    entry = g.pop('request_profile', None)
+    if entry is None:
+        return
+    session, started = entry
+    session.end(started)
+    if session.state == DONE:
+        profiler.disarm(session)
+
+
+def init_profiling(app):
+    app.before_request(_begin_request_profile)
+    app.teardown_request(_end_request_profile)
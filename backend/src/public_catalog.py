@@ -0,0 +1,111 @@
+"""Anonymous catalog lists served from prebuilt bodies.
+
+``/public/movies`` and ``/public/actors`` never look at the Authorization
+header.  Each list (per sort order) is serialized once into JSON bytes with
+a strong ETag and reused until a ``catalog_changed`` signal drops it or
+``PUBLIC_CATALOG_TTL`` runs out; the TTL bounds how long a worker can miss
+writes handled by another worker.  Responses are ``Cache-Control: public``
+for the same TTL, so browsers and a CDN can serve them too, and a matching
+``If-None-Match`` gets a bodyless ``304``.
+"""
+import hashlib
+import os
+import threading
+import time
+
+from flask import Response, json, request
+
+from .database.models import Actor, Movie
+from .database.signals import catalog_changed
+from .metrics import register_metric
+from .singleflight import SingleFlight
+
+
+PUBLIC_CATALOG_TTL = int(os.environ.get('PUBLIC_CATALOG_TTL', 60))
+
+# kind -> (model, list key, total key, {sort: order_by})
+CATALOG_LISTS = {
+    'movies': (Movie, 'movies', 'total_movies', {
+        'id': (Movie.id,),
+        'cast_count': (Movie.cast_count.desc(), Movie.id),
+    }),
+    'actors': (Actor, 'actors', 'total_actors', {
+        'id': (Actor.id,),
+        'filmography_count': (Actor.filmography_count.desc(), Actor.id),
+    }),
+}
+
+
+class PublicCatalog:
+    def __init__(self, ttl=PUBLIC_CATALOG_TTL):
+        self.ttl = ttl
+        self.cache_control = f'public, max-age={ttl}, stale-while-revalidate={ttl}'
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+        self._flight = SingleFlight('public_catalog')
+        self.hits = 0
+        self.builds = 0
+
+    def sorts(self, kind):
+        return CATALOG_LISTS[kind][3]
+
+    def body(self, kind, sort):
+        """``(json_bytes, etag)`` of one list, built at most once per TTL"""
+        key = (kind, sort)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self.hits += 1
+                return entry[0], entry[1]
+        return self._flight.do(key, lambda: self._build(kind, sort))
+
+    def _build(self, kind, sort):
+        generation = self._generation
+        model, list_key, total_key, orders = CATALOG_LISTS[kind]
+        rows = model.query.order_by(*orders[sort]).all()
+        body = json.dumps({
+            'success': True,
+            list_key: [row.format() for row in rows],
+            total_key: len(rows)
+        }).encode() + b'\n'
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            # Not kept if the catalog changed while it was being built.
+            if generation == self._generation:
+                self._entries[(kind, sort)] = (body, etag, time.monotonic() + self.ttl)
+            self.builds += 1
+        return body, etag
+
+    def response(self, kind, sort):
+        body, etag = self.body(kind, sort)
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = self.cache_control
+        return response.make_conditional(request)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+
+public_catalog = PublicCatalog()
+
+
+@catalog_changed.connect
+def _invalidate_public_catalog(entity, **kwargs):
+    public_catalog.clear()
+
+
+register_metric(
+    'public_catalog_hits_total', 'counter',
+    'Public catalog lists served from a prebuilt body',
+    lambda: public_catalog.hits
+)
+register_metric(
+    'public_catalog_builds_total', 'counter',
+    'Public catalog lists serialized from the database',
+    lambda: public_catalog.builds
+)
@@ -0,0 +1,240 @@
+"""Token-bucket rate limits per client IP and per verified principal.
+
+Each budget (``<requests>/<seconds>``) is a bucket of that many tokens that
+refills evenly over the period.  Every request first takes one token from
+its client IP's bucket for its budget, before any auth work.  A request whose
+bearer token ``requires_auth`` then verifies also takes one from the bucket
+of its ``sub`` (``principal_verified`` signal).  Nothing is keyed by an
+unverified claim, so a forged token can neither buy a fresh bucket nor drain
+someone else's.
+
+Views pick a budget with ``@rate_limited('expensive')``; ``None`` exempts
+them.  Every limited response carries ``RateLimit-Policy``, ``-Limit``,
+``-Remaining`` and ``-Reset`` for the tighter of its buckets; an empty bucket
+answers ``429`` with ``Retry-After``.
+
+Buckets live in the worker by default, so each worker grants the full
+budget.  With ``RATE_LIMIT_STORAGE_URL`` (needs the ``redis`` package) all
+workers share them; if Redis is unreachable, requests are let through.
+"""
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app, g, request
+from werkzeug.exceptions import TooManyRequests
+
+from .auth.auth import principal_verified
+from .metrics import register_metric
+
+try:
+    import redis
+except ImportError:  # optional
+    redis = None
+
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMIT_BUDGETS = {
+    'default': os.environ.get('RATE_LIMIT_DEFAULT', '300/60'),
+    'expensive': os.environ.get('RATE_LIMIT_EXPENSIVE', '30/60'),
+}
+RATE_LIMIT_STORAGE_URL = os.environ.get('RATE_LIMIT_STORAGE_URL')
+# Proxies in front of the app that append to X-Forwarded-For (1 on Render).
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0))
+RATE_LIMIT_MAX_KEYS = 10000
+
+Decision = namedtuple('Decision', 'allowed remaining reset retry_after')
+
+
+class Budget:
+    def __init__(self, name, spec):
+        requests, _, seconds = spec.partition('/')
+        try:
+            self.capacity, self.period = int(requests), float(seconds)
+        except ValueError:
+            raise ValueError(f'rate limit {name!r} must look like <requests>/<seconds>, got {spec!r}')
+        if self.capacity < 1 or self.period <= 0:
+            raise ValueError(f'rate limit {name!r} must allow at least 1 request per positive period')
+        self.name = name
+        self.rate = self.capacity / self.period
+        self.policy = f'{self.capacity};w={self.period:g}'
+
+    def decide(self, allowed, tokens):
+        return Decision(
+            allowed,
+            int(tokens),
+            math.ceil((self.capacity - tokens) / self.rate),
+            0 if allowed else max(1, math.ceil((1 - tokens) / self.rate)),
+        )
+
+
+class MemoryBackend:
+    """Buckets of this worker.
+
+    Past ``max_keys`` buckets, the ones that have refilled are dropped: a
+    full bucket is the same as no bucket, so this never resets a caller who
+    is still being limited.  Buckets refill within ``1 / rate`` seconds of
+    their last request, so the ones left are bounded by the request rate.
+    """
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._prune_at = max_keys
+
+    def take(self, budget, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp, _ = self._buckets.get(key, (budget.capacity, now, budget))
+            tokens = min(budget.capacity, tokens + (now - stamp) * budget.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, budget)
+            if len(self._buckets) > self._prune_at:
+                self._prune(now)
+        return budget.decide(allowed, tokens)
+
+    def _prune(self, now):
+        self._buckets = {
+            key: entry for key, entry in self._buckets.items()
+            if entry[0] + (now - entry[1]) * entry[2].rate < entry[2].capacity
+        }
+        self._prune_at = max(self.max_keys, 2 * len(self._buckets))
+
+
+# Refill and take in one round trip, on Redis' clock so workers agree.
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(state[1]) or capacity
+local stamp = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - stamp) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBackend:
+    """Buckets shared by every worker; fails open when Redis is unavailable"""
+
+    def __init__(self, url, prefix='ratelimit:'):
+        if redis is None:
+            raise RuntimeError('RATE_LIMIT_STORAGE_URL needs the redis package')
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.1)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+        self.errors = 0
+
+    def take(self, budget, key):
+        try:
+            allowed, tokens = self._take(keys=[self.prefix + key], args=[budget.capacity, budget.rate])
+        except redis.RedisError:
+            self.errors += 1
+            return budget.decide(True, budget.capacity)
+        return budget.decide(bool(allowed), float(tokens))
+
+
+def rate_limited(budget):
+    """Charge a view to ``budget`` instead of ``default``; None exempts it"""
+    def decorator(f):
+        f.rate_limit_budget = budget
+        return f
+    return decorator
+
+
+def client_ip():
+    if RATE_LIMIT_TRUSTED_PROXIES:
+        forwarded = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+        if len(forwarded) >= RATE_LIMIT_TRUSTED_PROXIES:
+            return forwarded[-RATE_LIMIT_TRUSTED_PROXIES]
+    return request.remote_addr or 'unknown'
+
+
+class RateLimiter:
+    def __init__(self, budgets=None, backend=None, enabled=None):
+        self.budgets = {
+            name: Budget(name, spec) for name, spec in (budgets or RATE_LIMIT_BUDGETS).items()
+        }
+        if backend is None:
+            backend = RedisBackend(RATE_LIMIT_STORAGE_URL) if RATE_LIMIT_STORAGE_URL else MemoryBackend()
+        self.backend = backend
+        self.enabled = RATE_LIMIT_ENABLED if enabled is None else enabled
+        self.rejected = {name: 0 for name in self.budgets}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.extensions['rate_limiter'] = self
+        app.before_request(self.check)
+        app.after_request(self.add_headers)
+        principal_verified.connect(self.charge_principal, app)
+
+    def check(self):
+        """Charge the client IP, before the request reaches auth or the view"""
+        if not self.enabled or request.endpoint is None:
+            return
+        view = current_app.view_functions[request.endpoint]
+        name = getattr(view, 'rate_limit_budget', 'default')
+        if name is None:
+            return
+        g.rate_limit_budget = name
+        self._take(name, f'ip:{client_ip()}')
+
+    def charge_principal(self, sender, subject=None, **extra):
+        """Charge the ``sub`` of a token ``requires_auth`` has just verified"""
+        name = g.get('rate_limit_budget')
+        if name is None or not subject:
+            return
+        self._take(name, f'sub:{subject}')
+
+    def _take(self, name, caller):
+        budget = self.budgets[name]
+        decision = self.backend.take(budget, f'{name}:{caller}')
+        current = g.get('rate_limit')
+        if current is None or decision.remaining < current[1].remaining or not decision.allowed:
+            g.rate_limit = (budget, decision)
+        if not decision.allowed:
+            with self._lock:
+                self.rejected[name] += 1
+            raise TooManyRequests(
+                description='Too many requests, slow down and retry later',
+                retry_after=decision.retry_after
+            )
+
+    def add_headers(self, response):
+        entry = g.pop('rate_limit', None)
+        if entry is None:
+            return response
+        budget, decision = entry
+        response.headers['RateLimit-Policy'] = budget.policy
+        response.headers['RateLimit-Limit'] = str(budget.capacity)
+        response.headers['RateLimit-Remaining'] = str(decision.remaining)
+        response.headers['RateLimit-Reset'] = str(decision.reset)
+        return response
+
+    def rejected_samples(self):
+        with self._lock:
+            return [({'budget': name}, count) for name, count in sorted(self.rejected.items())]
+
+
+def init_rate_limits(app):
+    limiter = RateLimiter()
+    limiter.init_app(app)
+    register_metric(
+        'rate_limit_rejected_total', 'counter',
+        'Requests refused with 429, per budget',
+        limiter.rejected_samples
+    )
+    return limiter
@@ -0,0 +1,190 @@
+"""Structured JSON request logging.
+
+Every request gets an id (a well-formed ``X-Request-ID`` from the client, or
+a new one) that is echoed in the response.  When it finishes, one JSON line
+goes to the ``casting_agency.requests`` logger with the route, status,
+latency and the time spent in the database and in Auth0.  Fast successful
+requests are sampled at ``LOG_SAMPLE_RATE``; 4xx and 5xx responses are
+always logged, and requests slower than ``SLOW_REQUEST_MS`` are logged with
+the SQL they ran.
+"""
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from flask import g, got_request_exception, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.05))
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000))
+MAX_LOGGED_STATEMENTS = 50
+MAX_STATEMENT_LENGTH = 2000
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+_REQUEST_ID = re.compile(r'[A-Za-z0-9._:-]{1,128}')
+
+logger = logging.getLogger('casting_agency.requests')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra={'fields': {...}}`` adds keys"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """Write ``casting_agency.*`` logs to stderr as JSON lines (idempotent)"""
+    root = logging.getLogger('casting_agency')
+    if any(isinstance(handler.formatter, JsonFormatter) for handler in root.handlers):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+
+class RequestTimings:
+    __slots__ = ('request_id', 'started', 'db_ms', 'db_queries', 'auth0_ms', 'auth0_calls', 'statements', 'error')
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.db_ms = 0.0
+        self.db_queries = 0
+        self.auth0_ms = 0.0
+        self.auth0_calls = 0
+        self.statements = []
+        self.error = None
+
+
+def current_timings():
+    """Timings of the request being handled, or None outside a request"""
+    if not has_request_context():
+        return None
+    return g.get('timings')
+
+
+@contextmanager
+def timed_auth0_call():
+    timings = current_timings()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.auth0_ms += (time.perf_counter() - started) * 1000
+            timings.auth0_calls += 1
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = current_timings()
+    if timings is None:
+        return
+    elapsed_ms = (time.perf_counter() - conn.info.pop('query_started', time.perf_counter())) * 1000
+    timings.db_ms += elapsed_ms
+    timings.db_queries += 1
+    if len(timings.statements) < MAX_LOGGED_STATEMENTS:
+        timings.statements.append({'sql': statement[:MAX_STATEMENT_LENGTH], 'ms': round(elapsed_ms, 2)})
+
+
+def log_handler_error(error):
+    """Log an exception that a handler turns into an error response"""
+    timings = current_timings()
+    if timings is not None:
+        timings.error = f'{error.__class__.__name__}: {error}'
+    logger.error('handler error', exc_info=error, extra={'fields': {
+        'request_id': timings.request_id if timings else None,
+        'method': request.method if has_request_context() else None,
+        'path': request.path if has_request_context() else None,
+    }})
+
+
+def _start_request():
+    request_id = request.headers.get(REQUEST_ID_HEADER, '')
+    if not _REQUEST_ID.fullmatch(request_id):
+        request_id = uuid.uuid4().hex
+    g.timings = RequestTimings(request_id)
+
+
+def _record_exception(sender, exception, **extra):
+    timings = current_timings()
+    if timings is not None and timings.error is None:
+        timings.error = f'{exception.__class__.__name__}: {exception}'
+
+
+def _finish_request(response):
+    timings = current_timings()
+    if timings is None:
+        return response
+    response.headers[REQUEST_ID_HEADER] = timings.request_id
+
+    duration_ms = (time.perf_counter() - timings.started) * 1000
+    slow = duration_ms >= SLOW_REQUEST_MS
+    status = response.status_code
+    if status >= 500:
+        level = logging.ERROR
+    elif slow:
+        level = logging.WARNING
+    elif status >= 400 or random.random() < LOG_SAMPLE_RATE:
+        level = logging.INFO
+    else:
+        return response
+    if not logger.isEnabledFor(level):
+        return response
+
+    principal = g.get('principal')
+    fields = {
+        'request_id': timings.request_id,
+        'method': request.method,
+        'path': request.path,
+        'route': request.url_rule.rule if request.url_rule else None,
+        'status': status,
+        'duration_ms': round(duration_ms, 2),
+        'db_ms': round(timings.db_ms, 2),
+        'db_queries': timings.db_queries,
+        'auth0_ms': round(timings.auth0_ms, 2),
+        'auth0_calls': timings.auth0_calls,
+        'user': principal.user_id if principal is not None else None,
+        'response_bytes': response.content_length,
+    }
+    if timings.error:
+        fields['error'] = timings.error
+    if slow:
+        fields['slow'] = True
+        fields['sql'] = timings.statements
+    logger.log(level, 'request', extra={'fields': fields})
+    return response
+
+
+def init_request_logging(app):
+    configure_logging()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    got_request_exception.connect(_record_exception, app)
@@ -0,0 +1,142 @@
+"""Concurrency limits and circuit breakers for slow or failing dependencies."""
+import threading
+import time
+from functools import wraps
+
+from werkzeug.exceptions import ServiceUnavailable
+
+
+class ConcurrencyLimit:
+    """Admit at most ``limit`` concurrent calls; reject the rest with a 503.
+
+    ``wait`` is how long a caller may queue for a slot before being turned
+    away.  Usable as a view decorator or a ``with`` block.
+    """
+
+    def __init__(self, name, limit, wait=0.5, retry_after=1):
+        self.name = name
+        self.limit = limit
+        self.wait = wait
+        self.retry_after = retry_after
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self):
+        if not self._semaphore.acquire(timeout=self.wait):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def __enter__(self):
+        if not self.try_acquire():
+            raise ServiceUnavailable(
+                description=f'Too many concurrent {self.name} requests, try again shortly',
+                retry_after=self.retry_after
+            )
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.release()
+        return False
+
+    def __call__(self, f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            with self:
+                return f(*args, **kwargs)
+        return wrapper
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f'{name} is unavailable, retry in {retry_after}s')
+
+
+class CircuitBreaker:
+    """Stop calling a dependency after repeated failures.
+
+    ``closed``: calls go through and consecutive failures are counted.
+    ``open``: calls fail immediately until ``reset_timeout`` has passed.
+    ``half_open``: a single probe call is let through; its outcome closes
+    or re-opens the circuit.  A call that was already in flight when the
+    circuit opened cannot close it by succeeding late.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """Raise ``CircuitOpenError`` unless this call may proceed."""
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = self.reset_timeout - (self._clock() - self._opened_at)
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, max(1, int(remaining + 0.999)))
+                self._state = self.HALF_OPEN
+
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 1)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.OPEN:
+                return
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._probe_in_flight = False
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+            self._probe_in_flight = False
+
+    def reset(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._opened_at = None
+            self._probe_in_flight = False
+            self.consecutive_failures = 0
@@ -0,0 +1,113 @@
+"""Coalesce identical concurrent calls into one in-flight computation.
+
+The first caller for a key runs the function; callers arriving with the
+same key while it is running wait and receive the same result (or the same
+exception) instead of repeating the work.  Nothing is cached once the call
+finishes, so results are never staler than a call made on arrival.  Under
+gevent workers the waits are cooperative.
+"""
+import threading
+from functools import wraps
+
+from flask import Response, make_response, request
+
+from .metrics import register_metric
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+        with _groups_lock:
+            _groups[name] = self
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self.executed += 1
+            call.done.set()
+        return call.value
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+def coalesce_reads(flight):
+    """View decorator: share one response among identical concurrent GETs.
+
+    The key is the method and full path, so only use it on views whose
+    response depends on nothing else.  Each caller gets its own copy of the
+    leader's status, headers and body.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            def render():
+                response = make_response(f(*args, **kwargs))
+                return response.status_code, list(response.headers.items()), response.get_data()
+
+            status, headers, body = flight.do((request.method, request.full_path), render)
+            return Response(body, status=status, headers=headers)
+        return wrapper
+    return decorator
+
+
+def _samples(attribute):
+    with _groups_lock:
+        groups = list(_groups.values())
+    return [({'group': group.name}, getattr(group, attribute)) for group in groups]
+
+
+register_metric(
+    'singleflight_executed_total', 'counter',
+    'Calls that ran the underlying computation',
+    lambda: _samples('executed')
+)
+register_metric(
+    'singleflight_coalesced_total', 'counter',
+    'Calls that waited for and shared an identical in-flight computation',
+    lambda: _samples('coalesced')
+)
+register_metric(
+    'singleflight_in_flight', 'gauge',
+    'Distinct computations currently in flight',
+    lambda: _samples('in_flight')
+)
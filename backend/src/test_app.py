@@ -2,6 +2,7 @@ import unittest
 import json
 import sys
 import os
+import tempfile
 from unittest.mock import patch
 from functools import wraps
 
@@ -547,7 +548,8 @@ def create_rbac_mock_auth(user_permissions):
         def requires_auth_decorator(f):
             @wraps(f)
             def wrapper(*args, **kwargs):
-                if permission and permission not in user_permissions:
+                required = (permission,) if isinstance(permission, str) else permission
+                if any(p and p not in user_permissions for p in required):
                     from src.auth.auth import AuthError
                     raise AuthError({
                         'code': 'unauthorized',
@@ -970,5 +972,2312 @@ class RBACTestCase(unittest.TestCase):
             self.assertEqual(res.status_code, 201)
 
 
+PRODUCER_PERMISSIONS = [
+    'get:movies', 'post:movies', 'patch:movies', 'delete:movies',
+    'get:actors', 'post:actors', 'patch:actors', 'delete:actors',
+    'post:casting', 'delete:casting',
+    'get:users', 'post:users', 'patch:users', 'delete:users'
+]
+
+
+TEST_DATABASE_DIR = tempfile.TemporaryDirectory(prefix='casting_agency_tests_')
+METRICS_TOKEN = 'test-metrics-token'
+METRICS_HEADERS = {'Authorization': f'Bearer {METRICS_TOKEN}'}
+
+
+def create_app_with_permissions(permissions):
+    # Each app gets its own throwaway SQLite file; DATABASE_URL is only read
+    # while the app is created, so it is restored straight afterwards and the
+    # bundled dev database is never touched.
+    handle, database_path = tempfile.mkstemp(suffix='.db', dir=TEST_DATABASE_DIR.name)
+    os.close(handle)
+    environ = {
+        'DATABASE_URL': f'sqlite:///{database_path}',
+        'METRICS_TOKEN': os.environ.get('METRICS_TOKEN', METRICS_TOKEN)
+    }
+    with patch.dict(os.environ, environ):
+        with patch('src.auth.auth.requires_auth', side_effect=create_rbac_mock_auth(permissions)):
+            import importlib
+            import src.app
+            importlib.reload(src.app)
+            app = src.app.create_app()
+
+        with app.app_context():
+            db_drop_and_create_all()
+
+    return app
+
+
+class SearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def test_search_prefix_match(self):
+        res = self.client().get('/search?q=the')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        labels = [hit['label'] for hit in data['results']]
+        self.assertIn('The Godfather', labels)
+        self.assertTrue(labels[0].lower().startswith('the'))
+
+    def test_search_fuzzy_match(self):
+        res = self.client().get('/search?q=shawshenk')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['results'][0]['label'], 'The Shawshank Redemption')
+        self.assertEqual(data['results'][0]['type'], 'movie')
+
+    def test_search_actors_only(self):
+        res = self.client().get('/search?q=uma&type=actor')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['results'])
+        self.assertTrue(all(hit['type'] == 'actor' for hit in data['results']))
+        self.assertEqual(data['results'][0]['label'], 'Uma Thurman')
+
+    def test_search_short_query(self):
+        res = self.client().get('/search?q=to')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([hit['label'] for hit in data['results']], ['Tom Hanks'])
+
+    def test_search_short_query_uses_prefix_index(self):
+        from sqlalchemy import event
+        from src.database.models import db
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            self.client().get('/search?q=to')
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+        statement, parameters = next((sql, params) for sql, params in statements if 'lower(' in sql)
+        with self.app.app_context():
+            rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+            plan = ' '.join(row[-1] for row in rows)
+        self.assertIn('ix_movies_title_prefix', plan)
+        self.assertIn('ix_actors_name_prefix', plan)
+
+    def test_search_requires_every_term(self):
+        data = json.loads(self.client().get('/search?q=tom hanks').data)
+        self.assertEqual([hit['label'] for hit in data['results']], ['Tom Hanks'])
+
+        data = json.loads(self.client().get('/search?q=tom fiction').data)
+        self.assertEqual(data['results'], [])
+
+        data = json.loads(self.client().get('/search?q=pulp fx').data)
+        self.assertEqual(data['results'], [])
+
+    def test_search_pagination(self):
+        res = self.client().get('/search?q=ma&per_page=1')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['has_more'], False)
+
+        res = self.client().get('/search?q=man&per_page=1')
+        data = json.loads(res.data)
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['has_more'], True)
+
+    def test_search_index_follows_writes(self):
+        res = self.client().post('/movies', json={'title': 'Interstellar', 'release_date': '2014-11-07'})
+        movie_id = json.loads(res.data)['created']
+
+        data = json.loads(self.client().get('/search?q=interstel').data)
+        self.assertEqual(data['results'][0]['id'], movie_id)
+
+        self.client().patch(f'/movies/{movie_id}', json={'title': 'Tenet'})
+        data = json.loads(self.client().get('/search?q=interstel').data)
+        self.assertFalse(data['results'])
+        data = json.loads(self.client().get('/search?q=tenet').data)
+        self.assertEqual(data['results'][0]['id'], movie_id)
+
+        self.client().delete(f'/movies/{movie_id}')
+        data = json.loads(self.client().get('/search?q=tenet').data)
+        self.assertFalse(data['results'])
+
+    def test_400_search_without_query(self):
+        res = self.client().get('/search')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_400_search_invalid_type(self):
+        res = self.client().get('/search?q=the&type=director')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_search_checks_permission_of_each_kind(self):
+        movies_only = create_app_with_permissions(['get:movies']).test_client()
+        self.assertEqual(movies_only.get('/search?q=the&type=movie').status_code, 200)
+        self.assertEqual(movies_only.get('/search?q=uma&type=actor').status_code, 403)
+        self.assertEqual(movies_only.get('/search?q=the').status_code, 403)
+
+        actors_only = create_app_with_permissions(['get:actors']).test_client()
+        self.assertEqual(actors_only.get('/search?q=uma&type=actor').status_code, 200)
+        self.assertEqual(actors_only.get('/search?q=the&type=movie').status_code, 403)
+        self.assertEqual(actors_only.get('/search?q=the').status_code, 403)
+
+
+class CostarGraphTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def test_get_actor_costars(self):
+        res = self.client().get('/actors/1/costars')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_costars'], 1)
+        self.assertEqual(data['costars'], [{'id': 3, 'name': 'Christian Bale', 'shared_movies': 1}])
+
+    def test_costars_ranked_by_shared_movies(self):
+        self.client().post('/movies/1/actors/5')
+        self.client().post('/movies/3/actors/5')
+        self.client().post('/movies/4/actors/1')
+
+        res = self.client().get('/actors/1/costars?limit=1')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_costars'], 3)
+        self.assertEqual(data['costars'], [{'id': 5, 'name': 'Tom Hanks', 'shared_movies': 2}])
+
+    def test_costars_follow_casting_removal(self):
+        self.client().get('/actors/1/costars')
+        self.client().delete('/movies/3/actors/3')
+
+        data = json.loads(self.client().get('/actors/1/costars').data)
+        self.assertEqual(data['total_costars'], 0)
+        self.assertEqual(data['costars'], [])
+
+    def test_get_actor_path(self):
+        self.client().post('/movies/1/actors/5')
+
+        res = self.client().get('/actors/3/path/5')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['connected'], True)
+        self.assertEqual(data['degrees'], 2)
+        self.assertEqual(
+            [(step['type'], step['id']) for step in data['path']],
+            [('actor', 3), ('movie', 3), ('actor', 1), ('movie', 1), ('actor', 5)]
+        )
+
+    def test_get_actor_path_not_connected(self):
+        res = self.client().get('/actors/2/path/4')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['connected'], False)
+        self.assertEqual(data['path'], [])
+
+    def test_404_costars_invalid_actor(self):
+        res = self.client().get('/actors/1000/costars')
+        self.assertEqual(res.status_code, 404)
+
+        res = self.client().get('/actors/1/path/1000')
+        self.assertEqual(res.status_code, 404)
+
+    def test_shortest_path_prefers_fewest_movies(self):
+        from src.database.costar_graph import CostarIndex
+
+        index = CostarIndex()
+        index.build([(1, 1), (1, 2), (2, 2), (2, 3), (3, 3), (3, 4), (4, 1), (4, 4)])
+
+        self.assertEqual(index.shortest_path(1, 4), [1, 4, 4])
+        self.assertEqual(index.shortest_path(1, 3), [1, 1, 2, 2, 3])
+        self.assertIsNone(index.shortest_path(1, 3, max_degrees=1))
+
+    def test_concurrent_rebuild_scans_once_and_keeps_new_castings(self):
+        import threading
+        from unittest.mock import MagicMock
+        from src.database.costar_graph import CostarIndex
+
+        index = CostarIndex()
+        scanning = threading.Event()
+        release = threading.Event()
+
+        def scan(statement):
+            scanning.set()
+            release.wait(5)
+            return MagicMock(all=lambda: [(1, 1), (1, 2)])
+
+        session = MagicMock()
+        session.execute.side_effect = scan
+        threads = [threading.Thread(target=index.ensure_built, args=(session,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(scanning.wait(5))
+        # Committed after the scan read movie_actor, signalled before the swap.
+        index.add_casting(2, 3)
+        index.add_casting(2, 1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(session.execute.call_count, 1)
+        self.assertEqual(index.costars(1), (2, [(2, 1), (3, 1)]))
+
+
+class StatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def test_movies_by_year(self):
+        res = self.client().get('/stats/movies-by-year')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['movies_by_year'], [
+            {'year': 1972, 'movies': 1},
+            {'year': 1994, 'movies': 3},
+            {'year': 2008, 'movies': 1}
+        ])
+
+    def test_cast_sizes(self):
+        self.client().post('/movies', json={'title': 'Interstellar', 'release_date': '2014-11-07'})
+
+        res = self.client().get('/stats/cast-sizes')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['cast_sizes'], [
+            {'cast_size': 0, 'movies': 1},
+            {'cast_size': 1, 'movies': 4},
+            {'cast_size': 2, 'movies': 1}
+        ])
+
+    def test_actors_by_gender(self):
+        res = self.client().get('/stats/actors-by-gender')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['actors_by_gender'], [
+            {'gender': 'Male', 'actors': 4},
+            {'gender': 'Female', 'actors': 1}
+        ])
+
+    def test_busiest_actors(self):
+        res = self.client().get('/stats/busiest-actors?limit=1')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['busiest_actors'], [{'id': 1, 'name': 'Morgan Freeman', 'movies': 2}])
+
+    def test_stats_cache_invalidated_on_write(self):
+        self.client().get('/stats/busiest-actors?limit=1')
+        self.client().post('/movies/1/actors/5')
+        self.client().post('/movies/2/actors/5')
+
+        data = json.loads(self.client().get('/stats/busiest-actors?limit=1').data)
+        self.assertEqual(data['busiest_actors'], [{'id': 5, 'name': 'Tom Hanks', 'movies': 3}])
+
+    def test_stats_cache_drops_value_computed_across_a_write(self):
+        from src.database.stats import StatsCache
+
+        cache = StatsCache(ttl=60)
+
+        def compute_during_write():
+            cache.clear()
+            return 'stale'
+
+        self.assertEqual(cache.get_or_compute('key', compute_during_write), 'stale')
+        self.assertEqual(cache.get_or_compute('key', lambda: 'fresh'), 'fresh')
+
+    def test_400_busiest_actors_invalid_limit(self):
+        res = self.client().get('/stats/busiest-actors?limit=0')
+        self.assertEqual(res.status_code, 400)
+
+
+class CastingCountersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def get_counts(self):
+        movies = json.loads(self.client().get('/movies').data)['movies']
+        actors = json.loads(self.client().get('/actors').data)['actors']
+        return (
+            {movie['id']: movie['cast_count'] for movie in movies},
+            {actor['id']: actor['filmography_count'] for actor in actors}
+        )
+
+    def test_seeded_counters(self):
+        cast_counts, filmography_counts = self.get_counts()
+
+        self.assertEqual(cast_counts, {1: 1, 2: 1, 3: 2, 4: 1, 5: 1})
+        self.assertEqual(filmography_counts, {1: 2, 2: 1, 3: 1, 4: 1, 5: 1})
+
+    def test_counters_follow_casting(self):
+        self.client().post('/movies/1/actors/5')
+        cast_counts, filmography_counts = self.get_counts()
+        self.assertEqual(cast_counts[1], 2)
+        self.assertEqual(filmography_counts[5], 2)
+
+        self.client().delete('/movies/1/actors/5')
+        cast_counts, filmography_counts = self.get_counts()
+        self.assertEqual(cast_counts[1], 1)
+        self.assertEqual(filmography_counts[5], 1)
+
+    def test_duplicate_casting_does_not_count(self):
+        self.client().post('/movies/1/actors/1')
+        cast_counts, filmography_counts = self.get_counts()
+
+        self.assertEqual(cast_counts[1], 1)
+        self.assertEqual(filmography_counts[1], 2)
+
+    def test_counters_follow_deletes(self):
+        self.client().delete('/movies/3')
+        cast_counts, filmography_counts = self.get_counts()
+        self.assertEqual(filmography_counts[1], 1)
+        self.assertEqual(filmography_counts[3], 0)
+
+        self.client().delete('/actors/4')
+        cast_counts, filmography_counts = self.get_counts()
+        self.assertEqual(cast_counts[4], 0)
+
+    def test_sort_movies_by_cast_count(self):
+        res = self.client().get('/movies?sort=cast_count')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([movie['id'] for movie in data['movies']], [3, 1, 2, 4, 5])
+
+    def test_sort_actors_by_filmography_count(self):
+        res = self.client().get('/actors?sort=filmography_count')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['actors'][0]['id'], 1)
+
+    def test_400_invalid_sort(self):
+        res = self.client().get('/movies?sort=title; drop table movies')
+        self.assertEqual(res.status_code, 400)
+
+    def test_rebuild_casting_counters(self):
+        from src.database.models import db, rebuild_casting_counters, Movie
+
+        with self.app.app_context():
+            db.session.query(Movie).update({Movie.cast_count: 42})
+            db.session.commit()
+            rebuild_casting_counters()
+
+        cast_counts, _ = self.get_counts()
+        self.assertEqual(cast_counts, {1: 1, 2: 1, 3: 2, 4: 1, 5: 1})
+
+
+class DeltaSyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+        settle = patch('src.database.changes.SYNC_SETTLE_SECONDS', 0)
+        settle.start()
+        self.addCleanup(settle.stop)
+
+    def sync(self, cursor=None, limit=100):
+        changes = []
+        while True:
+            url = f'/changes?limit={limit}' + (f'&since={cursor}' if cursor else '')
+            res = self.client().get(url)
+            self.assertEqual(res.status_code, 200)
+            data = json.loads(res.data)
+            changes.extend(data['changes'])
+            cursor = data['next_cursor']
+            if not data['has_more']:
+                return changes, cursor
+
+    def test_full_sync(self):
+        changes, cursor = self.sync(limit=4)
+
+        self.assertTrue(cursor)
+        self.assertEqual(len([change for change in changes if change['type'] == 'movie']), 5)
+        self.assertEqual(len([change for change in changes if change['type'] == 'actor']), 5)
+        self.assertEqual(len([change for change in changes if change['type'] == 'casting']), 6)
+        self.assertTrue(all(change['action'] == 'upsert' for change in changes))
+
+    def test_no_changes_after_cursor(self):
+        _, cursor = self.sync()
+
+        res = self.client().get(f'/changes?since={cursor}')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['changes'], [])
+        self.assertEqual(data['has_more'], False)
+        self.assertEqual(self.sync(data['next_cursor'])[0], [])
+
+    def test_changes_since_cursor(self):
+        _, cursor = self.sync()
+
+        self.client().patch('/movies/1', json={'title': 'Updated Title'})
+        self.client().delete('/movies/3/actors/1')
+        self.client().delete('/actors/4')
+
+        changes, _ = self.sync(cursor)
+        summary = [(change['type'], change['action'], change['data'].get('id')) for change in changes]
+
+        self.assertIn(('movie', 'upsert', 1), summary)
+        self.assertIn(('actor', 'delete', 4), summary)
+        self.assertIn(('casting', 'delete', None), summary)
+        self.assertNotIn(('movie', 'upsert', 2), summary)
+
+        deleted_castings = [change['data'] for change in changes
+                            if change['type'] == 'casting' and change['action'] == 'delete']
+        self.assertIn({'movie_id': 3, 'actor_id': 1}, deleted_castings)
+        self.assertIn({'movie_id': 4, 'actor_id': 4}, deleted_castings)
+
+    def test_pages_split_rows_sharing_a_timestamp(self):
+        _, cursor = self.sync()
+        self.client().delete('/actors/1')
+
+        changes, _ = self.sync(cursor, limit=1)
+        tombstones = [change for change in changes if change['action'] == 'delete']
+
+        self.assertEqual(len(tombstones), 3)
+        self.assertEqual(len({change['changed_at'] for change in tombstones}), 1)
+
+    def test_late_commit_inside_settle_window_is_not_skipped(self):
+        from datetime import timedelta
+        from sqlalchemy import text
+        from src.database.models import db, utcnow
+
+        now = utcnow()
+        with self.app.app_context():
+            for table, column in (('movies', 'updated_at'), ('actors', 'updated_at'), ('movie_actor', 'created_at')):
+                db.session.execute(text(f'UPDATE {table} SET {column} = :at'), {'at': now - timedelta(minutes=2)})
+            db.session.execute(text('UPDATE movies SET updated_at = :at WHERE id = 1'), {'at': now - timedelta(seconds=10)})
+            db.session.commit()
+
+        with patch('src.database.changes.SYNC_SETTLE_SECONDS', 60):
+            changes, cursor = self.sync()
+        self.assertNotIn(1, [change['data']['id'] for change in changes if change['type'] == 'movie'])
+
+        # Stamped before that sync, committed after it.
+        with self.app.app_context():
+            db.session.execute(text('UPDATE movies SET updated_at = :at WHERE id = 2'), {'at': now - timedelta(seconds=30)})
+            db.session.commit()
+
+        changes, _ = self.sync(cursor)
+        self.assertEqual(sorted(change['data']['id'] for change in changes), [1, 2])
+
+    def test_cursor_older_than_retention_requires_resync(self):
+        from src.database.changes import encode_cursor
+        from src.database.models import TOMBSTONE_RETENTION, utcnow
+
+        cursor = encode_cursor(utcnow() - TOMBSTONE_RETENTION - TOMBSTONE_RETENTION / 10, 'movie', [1])
+        res = self.client().get(f'/changes?since={cursor}')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 410)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['resync_required'], True)
+
+    def test_expired_tombstones_are_purged(self):
+        from src.database import models
+        from src.database.models import Tombstone, db, utcnow
+
+        with self.app.app_context():
+            db.session.add(Tombstone(entity='movie', entity_id=99, deleted_at=utcnow() - models.TOMBSTONE_RETENTION * 2))
+            db.session.commit()
+
+        with patch.object(models, '_last_tombstone_purge', [0.0]):
+            self.client().delete('/movies/3/actors/1')
+
+        with self.app.app_context():
+            self.assertEqual([tombstone.entity for tombstone in Tombstone.query.all()], ['casting'])
+
+    def test_400_invalid_cursor(self):
+        res = self.client().get('/changes?since=not-a-cursor')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+
+class EventFeedTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def test_broker_fans_out_to_subscribers(self):
+        from src.events.broker import InProcessBroker
+
+        broker = InProcessBroker()
+        first = broker.subscribe()
+        second = broker.subscribe()
+        broker.publish({'entity': 'movie', 'action': 'create', 'id': 1})
+
+        self.assertEqual(first.get(timeout=1)['id'], 1)
+        self.assertEqual(second.get(timeout=1)['id'], 1)
+
+        first.close()
+        self.assertEqual(broker.subscriber_count, 1)
+
+    def test_slow_subscriber_overflows(self):
+        from src.events.broker import InProcessBroker, SUBSCRIBER_QUEUE_SIZE
+        from src.events.feed import stream_events
+
+        broker = InProcessBroker()
+        stream = stream_events(broker, heartbeat=0.01)
+        next(stream)
+        for number in range(SUBSCRIBER_QUEUE_SIZE + 1):
+            broker.publish({'entity': 'movie', 'action': 'update', 'id': number})
+
+        self.assertIn('event: overflow', next(stream))
+        self.assertEqual(list(stream), [])
+        self.assertEqual(broker.subscriber_count, 0)
+
+    def test_event_stream(self):
+        res = self.client().get('/events')
+        frames = iter(res.response)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/event-stream')
+        self.assertTrue(next(frames).decode().startswith('retry:'))
+
+        self.client().post('/movies/1/actors/5')
+        frame = next(frames).decode()
+        res.close()
+
+        self.assertIn('event: casting', frame)
+        data = json.loads(frame.split('data: ', 1)[1])
+        self.assertEqual(data, {'entity': 'casting', 'action': 'create', 'id': None, 'movie_id': 1, 'actor_id': 5})
+
+    def test_unsupported_broker_url(self):
+        from src.events.broker import create_broker
+
+        with self.assertRaises(ValueError):
+            create_broker('amqp://localhost')
+
+
+class ResilienceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def test_concurrency_limit_rejects_when_full(self):
+        from werkzeug.exceptions import ServiceUnavailable
+        from src.resilience import ConcurrencyLimit
+
+        limit = ConcurrencyLimit('test', 1, wait=0.01, retry_after=3)
+
+        with limit:
+            self.assertEqual(limit.in_flight, 1)
+            with self.assertRaises(ServiceUnavailable) as raised:
+                with limit:
+                    pass
+
+        self.assertEqual(raised.exception.retry_after, 3)
+        self.assertEqual(limit.in_flight, 0)
+        self.assertEqual(limit.rejected, 1)
+
+    def test_503_includes_retry_after(self):
+        from src.resilience import ConcurrencyLimit
+
+        limit = ConcurrencyLimit('test', 1, wait=0.01, retry_after=3)
+
+        @self.app.route('/busy')
+        @limit
+        def busy():
+            return 'ok'
+
+        with limit:
+            res = self.client().get('/busy')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers['Retry-After'], '3')
+        self.assertEqual(data['success'], False)
+        self.assertEqual(self.client().get('/busy').status_code, 200)
+
+    def test_metrics_require_token(self):
+        self.assertEqual(self.client().get('/metrics').status_code, 401)
+        res = self.client().get('/metrics', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(json.loads(res.data)['success'], False)
+        self.assertEqual(self.client().get('/metrics', headers=METRICS_HEADERS).status_code, 200)
+
+        with patch.dict(os.environ, {'METRICS_TOKEN': ''}):
+            self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.assertEqual(self.app.test_client().get('/metrics', headers=METRICS_HEADERS).status_code, 404)
+
+
+class Auth0ResilienceTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from loadtest.auth0_stub import Auth0Stub
+
+        cls.stub = Auth0Stub().start()
+        cls.url_patch = patch('src.auth.auth0_management.AUTH0_BASE_URL', cls.stub.url)
+        cls.url_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.url_patch.stop()
+        cls.stub.stop()
+
+    def setUp(self):
+        from src.auth.http_client import auth0_breaker
+
+        self.breaker = auth0_breaker
+        self.breaker.reset()
+        self.stub.set_faults(latency=0, error_rate=0)
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        self.breaker.reset()
+
+    def test_breaker_opens_after_failures(self):
+        from src.auth.auth0_management import Auth0ManagementError, get_all_roles
+
+        self.stub.set_faults(error_rate=1.0)
+        for _ in range(self.breaker.failure_threshold):
+            with self.assertRaises(Auth0ManagementError) as raised:
+                get_all_roles('token')
+            self.assertEqual(raised.exception.status_code, 500)
+
+        calls = self.stub.request_count
+        with self.assertRaises(Auth0ManagementError) as raised:
+            get_all_roles('token')
+
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertTrue(raised.exception.retry_after >= 1)
+        self.assertEqual(self.stub.request_count, calls)
+        self.assertEqual(self.breaker.state, 'open')
+
+    def test_half_open_probe_closes_breaker(self):
+        from src.auth.auth0_management import get_all_roles
+
+        with patch.object(self.breaker, 'reset_timeout', 0.05):
+            self.stub.set_faults(error_rate=1.0)
+            for _ in range(self.breaker.failure_threshold):
+                self.assertRaises(Exception, get_all_roles, 'token')
+            self.assertEqual(self.breaker.state, 'open')
+
+            import time
+            time.sleep(0.06)
+            self.assertEqual(self.breaker.state, 'half_open')
+
+            self.stub.set_faults(error_rate=0)
+            self.assertTrue(get_all_roles('token'))
+            self.assertEqual(self.breaker.state, 'closed')
+
+    def test_failed_probe_reopens_breaker(self):
+        from src.resilience import CircuitBreaker, CircuitOpenError
+
+        now = [0.0]
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+
+        now[0] = 10.0
+        breaker.before_call()
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, 'open')
+        self.assertEqual(breaker.times_opened, 2)
+
+    def test_late_success_does_not_close_open_breaker(self):
+        from src.resilience import CircuitBreaker, CircuitOpenError
+
+        now = [0.0]
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+        breaker.before_call()
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+
+        self.assertEqual(breaker.state, 'open')
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+
+        now[0] = 10.0
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_slow_auth0_times_out(self):
+        from src.auth.auth0_management import Auth0ManagementError, get_all_roles
+
+        self.stub.set_faults(latency=0.5)
+        with patch('src.auth.http_client.AUTH0_READ_TIMEOUT', 0.05):
+            with self.assertRaises(Auth0ManagementError) as raised:
+                get_all_roles('token')
+
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(self.breaker.consecutive_failures, 1)
+
+    def test_open_breaker_returns_fast_503(self):
+        self.stub.set_faults(error_rate=1.0)
+        for _ in range(self.breaker.failure_threshold):
+            self.client().get('/users')
+
+        res = self.client().get('/users')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(data['success'], False)
+        self.assertIn('Retry-After', res.headers)
+
+    def test_breaker_state_in_metrics(self):
+        self.stub.set_faults(error_rate=1.0)
+        for _ in range(self.breaker.failure_threshold):
+            self.client().get('/roles')
+
+        res = self.client().get('/metrics', headers=METRICS_HEADERS)
+        body = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('auth0_circuit_state 2', body)
+        self.assertIn('# TYPE auth0_circuit_opened_total counter', body)
+
+
+class RolePolicyTestCase(unittest.TestCase):
+
+    ASSISTANT = ['get:movies', 'get:actors']
+    DIRECTOR = ['get:movies', 'get:actors', 'post:actors', 'delete:actors']
+    PRODUCER = DIRECTOR + ['post:movies', 'delete:movies']
+
+    def test_levels_resolve_once_per_permission_list(self):
+        from src.auth.role_hierarchy import compile_permissions, get_user_role_level
+
+        self.assertEqual(get_user_role_level([]), 0)
+        self.assertEqual(get_user_role_level(['patch:movies']), 0)
+        self.assertEqual(get_user_role_level(self.ASSISTANT), 1)
+        self.assertEqual(get_user_role_level(['post:actors']), 2)
+        self.assertEqual(get_user_role_level(self.PRODUCER), 3)
+
+        policy = compile_permissions(self.DIRECTOR)
+        self.assertIs(compile_permissions(list(self.DIRECTOR)), policy)
+        self.assertIs(compile_permissions(policy), policy)
+        self.assertIn('post:actors', policy)
+        self.assertNotIn('post:movies', policy)
+
+    def test_decision_matrix(self):
+        from src.auth.role_hierarchy import can_assign_role, can_manage_user
+
+        def roles(name):
+            return [{'name': name}] if name else []
+
+        manage = [
+            (self.PRODUCER, 'Executive Producer', False),
+            (self.PRODUCER, 'Casting Director', True),
+            (self.PRODUCER, None, True),
+            (self.DIRECTOR, 'Casting Director', False),
+            (self.DIRECTOR, 'Casting Assistant', True),
+            (self.ASSISTANT, 'Casting Assistant', False),
+            ([], None, False),
+        ]
+        for manager, target, allowed in manage:
+            self.assertEqual(can_manage_user(manager, roles(target))[0], allowed, (manager, target))
+
+        self.assertEqual(can_manage_user([], [])[1], 'No management permissions')
+        self.assertEqual(can_assign_role(self.PRODUCER, 'Casting Director'), (True, None))
+        self.assertEqual(can_assign_role(self.PRODUCER, 'Executive Producer')[0], False)
+        self.assertEqual(can_assign_role(self.DIRECTOR, 'Casting Director')[0], False)
+        self.assertEqual(can_assign_role(self.DIRECTOR, 'Casting Assistant'), (True, None))
+        self.assertEqual(can_assign_role(self.ASSISTANT, 'Casting Assistant')[0], False)
+        self.assertEqual(can_assign_role(self.PRODUCER, 'Stunt Double'), (False, 'Invalid role: Stunt Double'))
+
+    def test_filter_and_assignable_roles(self):
+        from src.auth.role_hierarchy import filter_users_by_access_level, get_assignable_roles
+
+        users = [
+            {'user_id': 'a', 'permissions': self.ASSISTANT},
+            {'user_id': 'd', 'permissions': self.DIRECTOR},
+            {'user_id': 'p', 'permissions': self.PRODUCER},
+            {'user_id': 'n'},
+        ]
+        self.assertEqual(filter_users_by_access_level(users, self.PRODUCER), users)
+        self.assertEqual(
+            [user['user_id'] for user in filter_users_by_access_level(users, self.DIRECTOR)],
+            ['a', 'n']
+        )
+        self.assertEqual(filter_users_by_access_level(users, self.ASSISTANT), [])
+
+        all_roles = [{'name': 'Casting Assistant'}, {'name': 'Casting Director'},
+                     {'name': 'Executive Producer'}, {'name': 'Other'}]
+        self.assertEqual([role['name'] for role in get_assignable_roles(self.PRODUCER, all_roles)],
+                         ['Casting Assistant', 'Casting Director'])
+        self.assertEqual([role['name'] for role in get_assignable_roles(self.DIRECTOR, all_roles)],
+                         ['Casting Assistant'])
+        self.assertEqual(get_assignable_roles(self.ASSISTANT, all_roles), [])
+
+    def test_check_permissions(self):
+        from src.auth.auth import AuthError, check_permissions
+
+        self.assertTrue(check_permissions('post:actors', {'permissions': self.DIRECTOR}))
+        with self.assertRaises(AuthError) as raised:
+            check_permissions('post:movies', {'permissions': self.DIRECTOR})
+        self.assertEqual(raised.exception.status_code, 403)
+        with self.assertRaises(AuthError) as raised:
+            check_permissions('get:movies', {})
+        self.assertEqual(raised.exception.status_code, 400)
+
+
+class PrincipalTestCase(unittest.TestCase):
+
+    def test_requires_auth_stores_principal(self):
+        from flask import Flask, g
+        from src.auth.auth import Principal, requires_auth
+
+        app = Flask(__name__)
+        seen = []
+
+        @requires_auth('get:movies')
+        def handler(payload):
+            seen.append(g.principal)
+            return 'ok'
+
+        with app.test_request_context('/movies'):
+            handler()
+
+        principal = seen[0]
+        self.assertIsInstance(principal, Principal)
+        self.assertEqual(principal.level, 1)
+        self.assertIsNone(principal.user_id)
+        self.assertIn('get:actors', principal)
+
+    def test_current_principal_falls_back_to_payload(self):
+        from flask import Flask
+        from src.auth.auth import current_principal
+        from src.auth.role_hierarchy import can_assign_role
+
+        app = Flask(__name__)
+        payload = {'sub': 'auth0|42', 'permissions': PRODUCER_PERMISSIONS}
+
+        with app.test_request_context('/users'):
+            principal = current_principal(payload)
+            self.assertIs(current_principal(payload), principal)
+            self.assertEqual(principal.user_id, 'auth0|42')
+            self.assertEqual(principal.level, 3)
+            self.assertEqual(can_assign_role(principal, 'Casting Director'), (True, None))
+
+        with app.test_request_context('/users'):
+            other = current_principal({'permissions': []})
+            self.assertEqual(other.level, 0)
+
+
+class JobQueueTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from loadtest.auth0_stub import Auth0Stub
+
+        cls.stub = Auth0Stub().start()
+        cls.url_patch = patch('src.auth.auth0_management.AUTH0_BASE_URL', cls.stub.url)
+        cls.url_patch.start()
+        cls.key_patch = patch('src.jobs.queue.JOB_SECRET_KEY', 'test-job-secret')
+        cls.key_patch.start()
+        cls.env_patch = patch.dict(os.environ, {'JOB_WORKER_ENABLED': 'true'})
+        cls.env_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.env_patch.stop()
+        cls.key_patch.stop()
+        cls.url_patch.stop()
+        cls.stub.stop()
+
+    def setUp(self):
+        from src.auth.http_client import auth0_breaker
+
+        auth0_breaker.reset()
+        self.stub.set_faults(latency=0, error_rate=0)
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def create_user_async(self, email):
+        return self.client().post('/users', headers={'Prefer': 'respond-async'}, json={
+            'email': email,
+            'password': 'Secret-123',
+            'name': 'New Hire',
+            'role': 'Casting Assistant'
+        })
+
+    def run_jobs(self, limit=None):
+        from src.jobs.queue import run_pending
+
+        with self.app.app_context():
+            return run_pending(limit)
+
+    def test_async_create_user_is_processed_by_worker(self):
+        from src.database.models import Job, db
+
+        users_before = len(self.stub.users)
+        res = self.create_user_async('async@example.com')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(data['job']['status'], 'queued')
+        self.assertEqual(res.headers['Location'], f"/jobs/{data['job']['id']}")
+        self.assertEqual(len(self.stub.users), users_before)
+
+        self.assertEqual(self.run_jobs(), 1)
+
+        res = self.client().get(res.headers['Location'])
+        job = json.loads(res.data)['job']
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['result']['user']['email'], 'async@example.com')
+        self.assertEqual(len(self.stub.users), users_before + 1)
+
+        with self.app.app_context():
+            self.assertNotIn('password', db.session.get(Job, job['id']).payload)
+
+    def test_retry_resumes_after_created_user(self):
+        from src.auth.auth0_management import Auth0ManagementError
+
+        users_before = len(self.stub.users)
+        job_id = json.loads(self.create_user_async('retry@example.com').data)['job']['id']
+
+        with patch('src.jobs.queue.JOB_RETRY_DELAY', 0), \
+                patch('src.jobs.tasks.assign_roles_to_user',
+                      side_effect=[Auth0ManagementError('Failed to assign roles', 400), None]) as assign:
+            self.run_jobs(limit=1)
+            job = json.loads(self.client().get(f'/jobs/{job_id}').data)['job']
+            self.assertEqual(job['status'], 'queued')
+            self.assertEqual(job['attempts'], 1)
+            self.assertIn('assign roles', job['error'])
+
+            self.run_jobs()
+
+        job = json.loads(self.client().get(f'/jobs/{job_id}').data)['job']
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['attempts'], 2)
+        self.assertEqual(assign.call_count, 2)
+        self.assertEqual(len(self.stub.users), users_before + 1)
+
+    def test_job_fails_after_max_attempts(self):
+        from src.jobs.queue import enqueue
+
+        with self.app.app_context():
+            job_id = enqueue('assign_user_roles', {'user_id': 'auth0|user1', 'roles': ['rol_assistant']},
+                             max_attempts=1).id
+
+        self.stub.set_faults(error_rate=1.0)
+        self.run_jobs()
+        self.stub.set_faults(error_rate=0)
+
+        job = json.loads(self.client().get(f'/jobs/{job_id}').data)['job']
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(self.run_jobs(), 0)
+
+    def test_expired_lease_is_reclaimed(self):
+        from datetime import timedelta
+        from src.database.models import Job, db, utcnow
+        from src.jobs.queue import claim_next, enqueue
+
+        with self.app.app_context():
+            job = enqueue('assign_user_roles', {'user_id': 'auth0|user1', 'roles': []})
+            self.assertEqual(claim_next().id, job.id)
+            self.assertIsNone(claim_next())
+
+            job = db.session.get(Job, job.id)
+            job.locked_until = utcnow() - timedelta(seconds=1)
+            db.session.commit()
+
+            reclaimed = claim_next()
+            self.assertEqual(reclaimed.id, job.id)
+            self.assertEqual(reclaimed.attempts, 2)
+
+    def test_unknown_job_returns_404(self):
+        res = self.client().get('/jobs/9999')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_password_is_encrypted_at_rest(self):
+        from src.database.models import Job, db
+        from src.jobs.queue import secret
+
+        job_id = json.loads(self.create_user_async('sealed@example.com').data)['job']['id']
+
+        with self.app.app_context():
+            job = db.session.get(Job, job_id)
+            self.assertNotIn('Secret-123', json.dumps(job.payload))
+            self.assertEqual(secret(job, 'password'), 'Secret-123')
+
+    def test_prefer_async_ignored_without_worker(self):
+        from src.database.models import Job
+
+        with patch.dict(os.environ, {'JOB_WORKER_ENABLED': 'false'}):
+            self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        res = self.app.test_client().post('/users', headers={'Prefer': 'respond-async'}, json={
+            'email': 'noworker@example.com',
+            'password': 'Secret-123'
+        })
+
+        self.assertEqual(res.status_code, 201)
+        with self.app.app_context():
+            self.assertEqual(Job.query.count(), 0)
+
+    def test_create_user_runs_in_request_without_secret_key(self):
+        from src.database.models import Job
+
+        users_before = len(self.stub.users)
+        with patch('src.jobs.queue.JOB_SECRET_KEY', None):
+            res = self.create_user_async('unsealed@example.com')
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(json.loads(res.data)['user']['email'], 'unsealed@example.com')
+        self.assertEqual(len(self.stub.users), users_before + 1)
+        with self.app.app_context():
+            self.assertEqual(Job.query.count(), 0)
+
+    def test_rejected_by_auth0_fails_without_retry(self):
+        from src.auth.auth0_management import Auth0ManagementError
+
+        job_id = json.loads(self.create_user_async('weak@example.com').data)['job']['id']
+        rejected = Auth0ManagementError('Failed to create user: PasswordStrengthError', 400, upstream_status=400)
+
+        with patch('src.jobs.tasks.create_auth0_user', side_effect=rejected) as create:
+            self.run_jobs()
+
+        job = json.loads(self.client().get(f'/jobs/{job_id}').data)['job']
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['attempts'], 1)
+        self.assertEqual(create.call_count, 1)
+        self.assertIn('PasswordStrengthError', job['error'])
+
+    def test_job_visible_to_creator_and_higher_roles_only(self):
+        from src.auth.role_hierarchy import DIRECTOR_LEVEL, PRODUCER_LEVEL
+        from src.jobs.queue import enqueue
+
+        with self.app.app_context():
+            peer = enqueue('assign_user_roles', {'user_id': 'auth0|user1', 'roles': []},
+                           created_by='auth0|other-producer', created_by_level=PRODUCER_LEVEL).id
+            junior = enqueue('assign_user_roles', {'user_id': 'auth0|user1', 'roles': []},
+                             created_by='auth0|director', created_by_level=DIRECTOR_LEVEL).id
+
+        self.assertEqual(self.client().get(f'/jobs/{peer}').status_code, 404)
+        self.assertEqual(self.client().get(f'/jobs/{junior}').status_code, 200)
+
+
+class IdempotencyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+        self.movie = {'title': 'Heat', 'release_date': '1995-12-15'}
+
+    def post_movie(self, key, body=None):
+        return self.client().post('/movies', json=body or self.movie, headers={'Idempotency-Key': key})
+
+    def movie_count(self):
+        from src.database.models import Movie
+
+        with self.app.app_context():
+            return Movie.query.count()
+
+    def test_retry_replays_first_response(self):
+        before = self.movie_count()
+        first = self.post_movie('retry-1')
+        second = self.post_movie('retry-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+        self.assertEqual(self.movie_count(), before + 1)
+
+    def test_casting_retry_is_not_a_duplicate(self):
+        res = self.client().post('/movies/1/actors/3', headers={'Idempotency-Key': 'cast-1'})
+        retry = self.client().post('/movies/1/actors/3', headers={'Idempotency-Key': 'cast-1'})
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, res.data)
+
+    def test_key_reused_for_different_request(self):
+        self.post_movie('reuse-1')
+        res = self.post_movie('reuse-1', {'title': 'Ronin', 'release_date': '1998-09-25'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_in_flight_key_is_short_circuited(self):
+        from datetime import timedelta
+        from src.database.models import IdempotencyKey, db, utcnow
+        from src.idempotency import _claim, _request_hash
+
+        with self.app.test_request_context('/movies', method='POST', json=self.movie):
+            fingerprint = _request_hash()
+        with self.app.app_context():
+            record, owned = _claim('', 'busy-1', fingerprint)
+            record_id = record.id
+            self.assertTrue(owned)
+
+        before = self.movie_count()
+        res = self.post_movie('busy-1')
+
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(res.headers['Retry-After'], '1')
+        self.assertEqual(self.movie_count(), before)
+
+        # An abandoned claim can be taken over once the lock times out.
+        with self.app.app_context():
+            stale = db.session.get(IdempotencyKey, record_id)
+            stale.created_at = utcnow() - timedelta(minutes=5)
+            db.session.commit()
+
+        self.assertEqual(self.post_movie('busy-1').status_code, 201)
+        self.assertEqual(self.movie_count(), before + 1)
+
+    def test_failed_request_releases_key(self):
+        res = self.post_movie('bad-1', {'title': 'No date'})
+        self.assertEqual(res.status_code, 400)
+
+        with patch('src.database.models.Movie.insert', side_effect=RuntimeError('db down')):
+            self.assertEqual(self.post_movie('bad-2').status_code, 422)
+        self.assertEqual(self.post_movie('bad-2').status_code, 201)
+
+    def test_expired_key_runs_again(self):
+        before = self.movie_count()
+        with patch('src.idempotency.IDEMPOTENCY_TTL', -1):
+            self.post_movie('ttl-1')
+        self.assertEqual(self.post_movie('ttl-1').status_code, 201)
+        self.assertEqual(self.movie_count(), before + 2)
+
+
+class SingleFlightTestCase(unittest.TestCase):
+
+    def run_concurrently(self, flight, target, count):
+        import threading
+        import time
+
+        results = [None] * count
+
+        def call(index):
+            try:
+                results[index] = target()
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=call, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while flight.coalesced < count - 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return threads, results
+
+    def test_concurrent_calls_share_one_computation(self):
+        import threading
+        from src.singleflight import SingleFlight
+
+        flight = SingleFlight('test')
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return {'value': 42}
+
+        threads, results = self.run_concurrently(flight, lambda: flight.do('key', compute), 5)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.executed, 1)
+        self.assertEqual(flight.coalesced, 4)
+        self.assertTrue(all(result == {'value': 42} for result in results))
+        self.assertEqual(flight.do('key', lambda: 'fresh'), 'fresh')
+
+    def test_error_reaches_every_waiter(self):
+        import threading
+        from src.singleflight import SingleFlight
+
+        flight = SingleFlight('test')
+        release = threading.Event()
+
+        def compute():
+            release.wait(5)
+            raise ValueError('boom')
+
+        threads, results = self.run_concurrently(flight, lambda: flight.do('key', compute), 3)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(flight.in_flight, 0)
+
+    def test_identical_reads_are_coalesced(self):
+        import threading
+        from src.singleflight import SingleFlight, coalesce_reads
+
+        app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        flight = SingleFlight('test_reads')
+        release = threading.Event()
+
+        served = []
+
+        @app.route('/slow-read')
+        @coalesce_reads(flight)
+        def slow_read():
+            from flask import jsonify
+            served.append(1)
+            release.wait(5)
+            return jsonify({'success': True, 'served': len(served)})
+
+        threads, results = self.run_concurrently(flight, lambda: app.test_client().get('/slow-read'), 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(served), 1)
+        self.assertEqual({result.status_code for result in results}, {200})
+        self.assertEqual({result.data for result in results}, {results[0].data})
+        self.assertEqual(results[0].headers['Content-Type'], 'application/json')
+
+        metrics = app.test_client().get('/metrics', headers=METRICS_HEADERS).data.decode()
+        self.assertIn('singleflight_coalesced_total{group="test_reads"} 3', metrics)
+        self.assertIn('singleflight_executed_total{group="catalog_reads"}', metrics)
+
+    def test_jwks_fetch_is_coalesced(self):
+        import threading
+        from src.auth.auth import fetch_jwks, reset_jwks_cache
+        from src.auth.http_client import auth0_flight
+
+        reset_jwks_cache()
+        release = threading.Event()
+        fetches = []
+
+        def slow_fetch():
+            fetches.append(1)
+            release.wait(5)
+            return {'keys': []}
+
+        coalesced = auth0_flight.coalesced
+        with patch('src.auth.auth._fetch_jwks', side_effect=slow_fetch):
+            threads, results = self.run_concurrently(auth0_flight, fetch_jwks, 3)
+            release.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(fetches), 1)
+        self.assertEqual(auth0_flight.coalesced - coalesced, 2)
+        self.assertEqual(results, [{'keys': []}] * 3)
+
+
+class OptimisticConcurrencyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def test_get_returns_version_etag(self):
+        res = self.client().get('/movies/1')
+        data = json.loads(res.data)
+
+        self.assertTrue(res.headers['ETag'].startswith('"1-'))
+        self.assertEqual(data['movie']['version'], 1)
+
+    def test_etag_follows_the_representation(self):
+        plain = self.client().get('/movies/1').headers['ETag']
+        with_actors = self.client().get('/movies/1?include_actors=true').headers['ETag']
+        self.assertNotEqual(plain, with_actors)
+
+        self.client().post('/movies/1/actors/5')
+        recast = self.client().get('/movies/1').headers['ETag']
+        self.assertNotEqual(recast, plain)
+
+        # Any of them still names version 1 for If-Match.
+        res = self.client().patch('/movies/1', json={'title': 'Edited'}, headers={'If-Match': with_actors})
+        self.assertEqual(res.status_code, 200)
+
+    def test_patch_with_current_etag(self):
+        res = self.client().patch('/movies/1', json={'title': 'Edited'}, headers={'If-Match': '"1"'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.headers['ETag'].startswith('"2-'))
+        self.assertEqual(data['movie']['version'], 2)
+
+    def test_patch_with_stale_etag_returns_412(self):
+        self.client().patch('/actors/1', json={'name': 'First Editor'}, headers={'If-Match': '"1"'})
+        res = self.client().patch('/actors/1', json={'name': 'Second Editor'}, headers={'If-Match': '"1"'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 412)
+        self.assertEqual(data['success'], False)
+        actor = json.loads(self.client().get('/actors/1').data)['actor']
+        self.assertEqual(actor['name'], 'First Editor')
+        self.assertEqual(actor['version'], 2)
+
+    def test_patch_without_if_match_still_works(self):
+        res = self.client().patch('/actors/2', json={'gender': 'Female'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.headers['ETag'].startswith('"2-'))
+
+    def test_delete_requires_matching_etag(self):
+        res = self.client().delete('/movies/2', headers={'If-Match': '"7"'})
+        self.assertEqual(res.status_code, 412)
+
+        res = self.client().delete('/movies/2', headers={'If-Match': '"1", "7"'})
+        self.assertEqual(res.status_code, 200)
+
+    def test_concurrent_write_between_read_and_update(self):
+        from sqlalchemy import text
+        from src.database.models import db
+
+        etag = self.client().get('/movies/3').headers['ETag']
+        with self.app.app_context():
+            db.session.execute(text('UPDATE movies SET version = version + 1 WHERE id = 3'))
+            db.session.commit()
+
+        res = self.client().patch('/movies/3', json={'title': 'Lost Update'}, headers={'If-Match': etag})
+
+        self.assertEqual(res.status_code, 412)
+        movie = json.loads(self.client().get('/movies/3').data)['movie']
+        self.assertEqual(movie['title'], 'The Dark Knight')
+
+    def test_writes_do_not_load_rows(self):
+        from sqlalchemy import event
+        from src.database.models import db
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.split()[0].upper())
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            patched = self.client().patch('/movies/3', json={'title': 'Renamed'})
+            deleted = self.client().delete('/movies/3')
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+        self.assertEqual(patched.status_code, 200)
+        self.assertEqual(deleted.status_code, 200)
+        self.assertNotIn('SELECT', statements)
+
+    def test_if_match_on_missing_row_is_404(self):
+        res = self.client().patch('/movies/999', json={'title': 'Nope'}, headers={'If-Match': '"1"'})
+        self.assertEqual(res.status_code, 404)
+
+        res = self.client().delete('/actors/999', headers={'If-Match': '"1"'})
+        self.assertEqual(res.status_code, 404)
+
+
+class StartupTestCase(unittest.TestCase):
+    """Importing the app is cheap and side-effect free; the factory does the work"""
+
+    IMPORT_BUDGET_MS = float(os.environ.get('STARTUP_IMPORT_BUDGET_MS', 1500))
+    CREATE_APP_BUDGET_MS = float(os.environ.get('STARTUP_CREATE_APP_BUDGET_MS', 500))
+
+    def run_python(self, code, *flags):
+        import subprocess
+        import tempfile
+
+        env = dict(os.environ)
+        env.pop('DATABASE_URL', None)
+        env['PYTHONPATH'] = backend_dir
+        with tempfile.TemporaryDirectory() as cwd:
+            result = subprocess.run(
+                [sys.executable, *flags, '-c', code],
+                cwd=cwd, env=env, capture_output=True, text=True, timeout=120
+            )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        return result
+
+    def test_import_has_no_side_effects(self):
+        result = self.run_python(
+            "import os, sys\n"
+            "calls = []\n"
+            "os.makedirs = lambda *args, **kwargs: calls.append(args)\n"
+            "import src.app\n"
+            "assert not calls, calls\n"
+            "assert not hasattr(src.app, 'APP')\n"
+            "print('ok')\n"
+        )
+        self.assertEqual(result.stdout.strip(), 'ok')
+
+    def test_cli_app_skips_auth_stack(self):
+        result = self.run_python(
+            "import os, sys, tempfile\n"
+            "os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'cli.db')\n"
+            "import manage\n"
+            "manage.create_cli_app()\n"
+            "print(' '.join(sorted(name for name in sys.modules if name.startswith(('src.', 'jose')))))\n"
+        )
+        loaded = result.stdout.split()
+        self.assertIn('src.database.models', loaded)
+        for module in ('src.app', 'src.cors', 'src.auth.auth', 'src.auth.auth0_management', 'jose'):
+            self.assertNotIn(module, loaded)
+
+    def test_startup_time_budget(self):
+        result = self.run_python(
+            "import os, time\n"
+            "os.environ['DATABASE_URL'] = 'sqlite://'\n"
+            "from src.app import create_app\n"
+            "start = time.perf_counter()\n"
+            "create_app()\n"
+            "print((time.perf_counter() - start) * 1000)\n",
+            '-X', 'importtime'
+        )
+        import_us = next(
+            int(line.split('|')[1])
+            for line in result.stderr.splitlines()
+            if line.startswith('import time:') and line.split('|')[2].strip() == 'src.app'
+        )
+        self.assertLess(import_us / 1000, self.IMPORT_BUDGET_MS)
+        self.assertLess(float(result.stdout.strip()), self.CREATE_APP_BUDGET_MS)
+
+
+class WarmUpTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tearDown()
+
+    def tearDown(self):
+        from src.auth.auth import reset_jwks_cache
+        from src.auth.auth0_management import reset_management_token
+
+        reset_jwks_cache()
+        reset_management_token()
+
+    def test_ready_without_warmup(self):
+        app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        res = app.test_client().get('/ready')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['ready'], True)
+
+    def test_not_ready_until_warmup_succeeds(self):
+        import threading
+
+        release = threading.Event()
+        steps = {'database': lambda: release.wait(5), 'mappers': lambda: None}
+        with patch.dict(os.environ, {'WARMUP_ON_START': 'true'}), \
+                patch('src.warmup.default_steps', return_value=steps):
+            app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        warmup = app.extensions['warmup']
+
+        res = app.test_client().get('/ready')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(data['checks']['database']['status'], 'pending')
+        self.assertIn('Retry-After', res.headers)
+
+        release.set()
+        warmup._thread.join(5)
+        res = app.test_client().get('/ready')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual({name: check['status'] for name, check in data['checks'].items()},
+                         {'database': 'ok', 'mappers': 'ok'})
+
+    def test_auth0_outage_does_not_block_readiness(self):
+        def auth0_down():
+            raise RuntimeError('Auth0 unavailable')
+
+        steps = {'database': lambda: None, 'mappers': lambda: None, 'jwks': auth0_down,
+                 'management_token': auth0_down}
+        with patch.dict(os.environ, {'WARMUP_ON_START': 'true'}), \
+                patch('src.warmup.default_steps', return_value=steps):
+            app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        warmup = app.extensions['warmup']
+
+        self.assertFalse(warmup.run_once())
+        res = app.test_client().get('/ready')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['checks']['jwks']['status'], 'failed')
+        self.assertFalse(data['checks']['jwks']['blocking'])
+        self.assertTrue(data['checks']['database']['blocking'])
+        self.assertEqual(app.test_client().get('/movies').status_code, 200)
+
+    def test_steps_run_in_parallel(self):
+        import threading
+        from src.warmup import WarmUp
+
+        barrier = threading.Barrier(3, timeout=5)
+        warmup = WarmUp(create_app_with_permissions(PRODUCER_PERMISSIONS),
+                        {name: barrier.wait for name in ('a', 'b', 'c')})
+
+        self.assertTrue(warmup.run_once())
+
+    def test_failed_step_is_retried_alone(self):
+        from src.warmup import WarmUp
+
+        calls = []
+
+        def flaky():
+            calls.append('flaky')
+            if len([call for call in calls if call == 'flaky']) == 1:
+                raise RuntimeError('Auth0 unavailable')
+
+        warmup = WarmUp(create_app_with_permissions(PRODUCER_PERMISSIONS),
+                        {'flaky': flaky, 'steady': lambda: calls.append('steady')})
+
+        self.assertFalse(warmup.run_once())
+        self.assertEqual(warmup.status()['flaky']['error'], 'Auth0 unavailable')
+        self.assertTrue(warmup.run_once())
+        self.assertEqual(sorted(calls), ['flaky', 'flaky', 'steady'])
+
+    def test_default_steps_fill_auth_caches(self):
+        from loadtest.auth0_stub import Auth0Stub
+        from src.auth.auth import fetch_jwks
+        from src.auth.auth0_management import get_management_api_token
+        from src.warmup import WarmUp, default_steps
+
+        stub = Auth0Stub().start()
+        self.addCleanup(stub.stop)
+        jwks = {'keys': [{'kid': 'k1'}]}
+        with patch('src.auth.auth0_management.AUTH0_BASE_URL', stub.url), \
+                patch('src.auth.auth._fetch_jwks', return_value=jwks) as fetch:
+            warmup = WarmUp(create_app_with_permissions(PRODUCER_PERMISSIONS), default_steps())
+            self.assertTrue(warmup.run_once(), warmup.status())
+
+            calls = stub.request_count
+            self.assertEqual(get_management_api_token(), 'stub-management-token')
+            self.assertEqual(fetch_jwks(), jwks)
+
+        self.assertEqual(stub.request_count, calls)
+        self.assertEqual(fetch.call_count, 1)
+
+
+class CompressionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        from src.compression import compressed_bodies
+
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+        compressed_bodies.clear()
+        threshold = patch('src.compression.COMPRESSION_MIN_SIZE', 200)
+        threshold.start()
+        self.addCleanup(threshold.stop)
+
+    def test_gzip_when_accepted(self):
+        import gzip
+
+        plain = self.client().get('/movies')
+        res = self.client().get('/movies', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertEqual(int(res.headers['Content-Length']), len(res.data))
+        self.assertLess(len(res.data), len(plain.data))
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+
+    def test_compressed_response_has_its_own_etag(self):
+        plain = self.client().get('/public/movies')
+        res = self.client().get('/public/movies', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(res.headers['ETag'], plain.headers['ETag'][:-1] + '-gzip"')
+
+        res = self.client().get('/public/movies', headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': res.headers['ETag']
+        })
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+        res = self.client().get('/public/movies', headers={'If-None-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 200)
+
+    def test_compressed_etag_still_names_the_version(self):
+        with patch('src.compression.COMPRESSION_MIN_SIZE', 0):
+            res = self.client().get('/movies/3?include_actors=true', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(res.headers['ETag'].endswith('-gzip"'))
+
+        res = self.client().patch('/movies/3', json={'title': 'Edited'}, headers={'If-Match': res.headers['ETag']})
+        self.assertEqual(res.status_code, 200)
+
+    def test_identity_without_accept_encoding(self):
+        res = self.client().get('/movies')
+
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertTrue(json.loads(res.data)['success'])
+
+    def test_refused_encoding_is_not_used(self):
+        res = self.client().get('/movies', headers={'Accept-Encoding': 'gzip;q=0, identity'})
+
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    def test_small_bodies_are_not_compressed(self):
+        res = self.client().get('/', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    def test_hot_response_is_compressed_once(self):
+        from unittest.mock import Mock
+        import src.compression
+
+        with patch.dict(src.compression.ENCODERS, gzip=Mock(wraps=src.compression._gzip)) as encoders:
+            first = self.client().get('/actors', headers={'Accept-Encoding': 'gzip'})
+            second = self.client().get('/actors', headers={'Accept-Encoding': 'gzip'})
+
+            self.assertEqual(encoders['gzip'].call_count, 1)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(second.headers['Content-Encoding'], 'gzip')
+
+        metrics = self.client().get('/metrics', headers=METRICS_HEADERS).data.decode()
+        self.assertIn('http_compressed_responses_total{encoding="gzip"}', metrics)
+
+    def test_brotli_preferred_when_available(self):
+        import src.compression
+
+        if 'br' not in src.compression.ENCODERS:
+            self.skipTest('brotli is not installed')
+        res = self.client().get('/movies', headers={'Accept-Encoding': 'gzip, br'})
+
+        self.assertEqual(res.headers['Content-Encoding'], 'br')
+
+
+class CorsTestCase(unittest.TestCase):
+
+    ORIGIN = 'http://localhost:4200'
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def preflight(self, path, origin=ORIGIN):
+        return self.client().options(path, headers={
+            'Origin': origin,
+            'Access-Control-Request-Method': 'PATCH',
+            'Access-Control-Request-Headers': 'authorization, if-match'
+        })
+
+    def test_preflight_answered_with_max_age(self):
+        res = self.preflight('/movies/1')
+
+        self.assertEqual(res.status_code, 204)
+        self.assertEqual(res.headers.getlist('Access-Control-Allow-Origin'), [self.ORIGIN])
+        self.assertEqual(res.headers.getlist('Access-Control-Allow-Methods'), ['GET, POST, PATCH, DELETE, OPTIONS'])
+        self.assertIn('If-Match', res.headers['Access-Control-Allow-Headers'])
+        self.assertEqual(res.headers['Access-Control-Allow-Credentials'], 'true')
+        self.assertEqual(res.headers['Access-Control-Max-Age'], '86400')
+        self.assertEqual(res.data, b'')
+
+    def test_preflight_skips_request_hooks(self):
+        calls = []
+        self.app.before_request(lambda: calls.append('hook'))
+
+        res = self.preflight('/users')
+
+        self.assertEqual(res.status_code, 204)
+        self.assertEqual(calls, [])
+
+    def test_preflight_from_unknown_origin(self):
+        res = self.preflight('/movies', origin='https://evil.example')
+
+        self.assertEqual(res.status_code, 204)
+        self.assertNotIn('Access-Control-Allow-Origin', res.headers)
+
+    def test_cross_origin_request_headers(self):
+        res = self.client().get('/movies', headers={'Origin': self.ORIGIN})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers.getlist('Access-Control-Allow-Origin'), [self.ORIGIN])
+        self.assertEqual(
+            res.headers['Access-Control-Expose-Headers'],
+            'ETag, Location, X-Request-ID, Retry-After, '
+            'RateLimit-Policy, RateLimit-Limit, RateLimit-Remaining, RateLimit-Reset'
+        )
+        self.assertIn('Origin', res.headers['Vary'])
+        self.assertNotIn('Access-Control-Allow-Methods', res.headers)
+
+    def test_same_origin_request_gets_no_cors_headers(self):
+        res = self.client().get('/movies')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse([name for name in res.headers.keys() if name.startswith('Access-Control-')])
+        self.assertIn('Origin', res.headers['Vary'])
+
+    def test_origins_from_configuration(self):
+        with patch.dict(os.environ, {'CORS_ORIGINS': 'https://admin.example/, https://app.example'}):
+            app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+
+        res = app.test_client().get('/movies', headers={'Origin': 'https://admin.example'})
+        self.assertEqual(res.headers['Access-Control-Allow-Origin'], 'https://admin.example')
+        res = app.test_client().get('/movies', headers={'Origin': self.ORIGIN})
+        self.assertNotIn('Access-Control-Allow-Origin', res.headers)
+
+
+class RequestLogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def logged(self, method, path, sample_rate=1.0, slow_ms=60000, **kwargs):
+        with patch('src.request_log.LOG_SAMPLE_RATE', sample_rate), \
+                patch('src.request_log.SLOW_REQUEST_MS', slow_ms), \
+                self.assertLogs('casting_agency.requests', 'INFO') as logs:
+            res = self.client().open(path, method=method, **kwargs)
+        return res, [record.fields for record in logs.records]
+
+    def test_request_id_is_generated_or_echoed(self):
+        res = self.client().get('/')
+        self.assertRegex(res.headers['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+        res = self.client().get('/', headers={'X-Request-ID': 'edge-1234'})
+        self.assertEqual(res.headers['X-Request-ID'], 'edge-1234')
+
+        res = self.client().get('/', headers={'X-Request-ID': 'bad id'})
+        self.assertNotEqual(res.headers['X-Request-ID'], 'bad id')
+
+    def test_access_log_fields(self):
+        res, entries = self.logged('GET', '/movies/1', headers={'X-Request-ID': 'req-1'})
+
+        self.assertEqual(res.status_code, 200)
+        entry = entries[-1]
+        self.assertEqual(entry['request_id'], 'req-1')
+        self.assertEqual(entry['route'], '/movies/<int:movie_id>')
+        self.assertEqual(entry['status'], 200)
+        self.assertGreaterEqual(entry['db_queries'], 1)
+        self.assertGreater(entry['duration_ms'], 0)
+        self.assertNotIn('sql', entry)
+
+    def test_fast_successes_are_sampled(self):
+        with patch('src.request_log.LOG_SAMPLE_RATE', 0.0), \
+                self.assertNoLogs('casting_agency.requests', 'INFO'):
+            self.client().get('/movies')
+
+    def test_errors_are_always_logged(self):
+        res, entries = self.logged('GET', '/movies/9999', sample_rate=0.0)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(entries[-1]['status'], 404)
+
+    def test_slow_request_logs_sql(self):
+        with patch('src.request_log.LOG_SAMPLE_RATE', 0.0), \
+                patch('src.request_log.SLOW_REQUEST_MS', 0), \
+                self.assertLogs('casting_agency.requests', 'WARNING') as logs:
+            self.client().get('/actors')
+
+        entry = logs.records[-1].fields
+        self.assertTrue(entry['slow'])
+        self.assertTrue(any('FROM actors' in statement['sql'] for statement in entry['sql']))
+
+    def test_swallowed_handler_error_is_logged(self):
+        with patch('src.database.models.Actor.format', side_effect=RuntimeError('boom')):
+            res, entries = self.logged('GET', '/actors')
+
+        self.assertEqual(res.status_code, 422)
+        self.assertIn('RuntimeError: boom', [entry.get('error') for entry in entries])
+
+    def test_auth0_time_is_recorded(self):
+        from loadtest.auth0_stub import Auth0Stub
+
+        stub = Auth0Stub().start()
+        self.addCleanup(stub.stop)
+        with patch('src.auth.auth0_management.AUTH0_BASE_URL', stub.url):
+            res, entries = self.logged('GET', '/roles')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreaterEqual(entries[-1]['auth0_calls'], 1)
+        self.assertGreater(entries[-1]['auth0_ms'], 0)
+
+    def test_json_formatter(self):
+        import logging
+        from src.request_log import JsonFormatter
+
+        record = logging.LogRecord('casting_agency.requests', logging.INFO, __file__, 1, 'request', None, None)
+        record.fields = {'status': 200}
+        line = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(line['message'], 'request')
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(line['level'], 'info')
+
+
+class ProfilingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS + ['profile:api'])
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        from src.profiling import profiler
+
+        profiler.armed = ()
+
+    def start(self, **body):
+        res = self.client().post('/profiling', json=body)
+        return res, json.loads(res.data)
+
+    def test_requires_profile_permission(self):
+        app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        res = app.test_client().post('/profiling', json={'mode': 'sample', 'seconds': 1})
+
+        self.assertEqual(res.status_code, 403)
+
+    def test_nothing_is_profiled_when_off(self):
+        with patch('src.profiling.cProfile.Profile') as profile:
+            res = self.client().get('/movies')
+
+        self.assertEqual(res.status_code, 200)
+        profile.assert_not_called()
+
+    def test_profile_next_requests_to_route(self):
+        import marshal
+
+        res, data = self.start(mode='requests', route='/movies', count=2)
+        self.assertEqual(res.status_code, 202)
+        location = res.headers['Location']
+
+        self.client().get('/actors')
+        for _ in range(3):
+            self.client().get('/movies')
+
+        profile = json.loads(self.client().get(location).data)['profile']
+        self.assertEqual(profile['state'], 'done')
+        self.assertEqual(profile['profiled'], 2)
+
+        text = self.client().get(location + '/report?format=text')
+        self.assertIn('get_movies', text.data.decode())
+        self.assertNotIn('get_actors', text.data.decode())
+
+        dump = self.client().get(location + '/report')
+        self.assertEqual(dump.mimetype, 'application/octet-stream')
+        functions = [function for (_, _, function) in marshal.loads(dump.data)]
+        self.assertIn('get_movies', functions)
+
+    def test_sample_worker(self):
+        import threading
+        import time
+
+        stop = threading.Event()
+
+        def busy_handler():
+            while not stop.is_set():
+                sum(range(1000))
+
+        thread = threading.Thread(target=busy_handler, name='busy')
+        thread.start()
+        try:
+            res, data = self.start(mode='sample', seconds=0.2, interval_ms=5)
+            self.assertEqual(res.status_code, 202)
+            location = res.headers['Location']
+            deadline = time.monotonic() + 5
+            while json.loads(self.client().get(location).data)['profile']['state'] != 'done':
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.05)
+        finally:
+            stop.set()
+            thread.join()
+
+        report = self.client().get(location + '/report').data.decode()
+        busy = [line for line in report.splitlines() if 'busy_handler' in line]
+        self.assertTrue(busy)
+        stack, count = busy[0].rsplit(' ', 1)
+        self.assertTrue(stack.startswith('busy;'))
+        self.assertGreater(int(count), 0)
+
+    def test_invalid_sessions_are_rejected(self):
+        for body in ({}, {'mode': 'requests', 'route': 'movies'}, {'mode': 'requests', 'route': '/movies', 'count': 0},
+                     {'mode': 'sample', 'seconds': 3600}):
+            res, data = self.start(**body)
+            self.assertEqual(res.status_code, 400, body)
+            self.assertEqual(data['success'], False)
+
+        self.assertEqual(self.client().get('/profiling/unknown').status_code, 404)
+
+
+class Auth0StubTokenTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from loadtest.auth0_stub import Auth0Stub
+
+        cls.stub = Auth0Stub(key_bits=1024).start()
+        cls.url_patch = patch('src.auth.auth.AUTH0_BASE_URL', cls.stub.url)
+        cls.url_patch.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.url_patch.stop()
+        cls.stub.stop()
+
+    def setUp(self):
+        import importlib
+        import src.app
+        from src.auth.auth import reset_jwks_cache
+
+        reset_jwks_cache()
+        importlib.reload(src.app)
+        self.app = src.app.create_app()
+        with self.app.app_context():
+            db_drop_and_create_all()
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        from src.auth.auth import reset_jwks_cache
+
+        reset_jwks_cache()
+
+    def auth(self, token):
+        return {'Authorization': f'Bearer {token}'}
+
+    def test_role_tokens_pass_real_verification(self):
+        res = self.client().get('/movies/1', headers=self.auth(self.stub.mint_token('Casting Assistant')))
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client().post('/actors', headers=self.auth(self.stub.mint_token('Casting Assistant')),
+                                 json={'name': 'New Actor', 'birth_date': '1990-01-01', 'gender': 'Female'})
+        self.assertEqual(res.status_code, 403)
+
+        res = self.client().post('/actors', headers=self.auth(self.stub.mint_token('Casting Director')),
+                                 json={'name': 'New Actor', 'birth_date': '1990-01-01', 'gender': 'Female'})
+        self.assertEqual(res.status_code, 201)
+
+    def test_expired_and_foreign_tokens_are_rejected(self):
+        # Catalog reads fall back to anonymous access, so probe a protected route.
+        valid = self.stub.mint_token('Executive Producer')
+        self.assertEqual(self.client().delete('/movies/1', headers=self.auth(valid)).status_code, 200)
+
+        expired = self.stub.mint_token('Executive Producer', expires_in=-60)
+        self.assertEqual(self.client().delete('/movies/2', headers=self.auth(expired)).status_code, 401)
+
+        wrong_audience = self.stub.mint_token('Executive Producer', aud='someone-else')
+        self.assertEqual(self.client().delete('/movies/2', headers=self.auth(wrong_audience)).status_code, 401)
+
+    def test_tokens_endpoint(self):
+        import requests
+
+        res = requests.post(f'{self.stub.url}/__tokens', json={'role': 'Casting Director'}, timeout=5)
+        token = res.json()['access_token']
+        self.assertEqual(self.client().get('/movies/1', headers=self.auth(token)).status_code, 200)
+
+        res = requests.post(f'{self.stub.url}/__tokens', json={'role': 'Intern'}, timeout=5)
+        self.assertEqual(res.status_code, 400)
+
+    def test_traffic_mix_weights(self):
+        from loadtest.traffic_mix import parse_mix
+
+        mix = parse_mix('browse=3,users=1')
+        self.assertEqual([(scenario.name, scenario.weight) for scenario in mix], [('browse', 3.0), ('users', 1.0)])
+        self.assertRaises(ValueError, parse_mix, 'checkout=1')
+
+
+class PerformanceTestCase(unittest.TestCase):
+    """Statement budgets and (with ``PERF_GATE=1``) timing baselines from loadtest/perf_baselines.json"""
+
+    def setUp(self):
+        from loadtest.benchmarks import add_catalog_rows, load_baselines, tolerance
+
+        self.baselines = load_baselines()
+        self.tolerance = tolerance(self.baselines)
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        with self.app.app_context():
+            add_catalog_rows()
+
+    def test_statement_budgets(self):
+        from loadtest.benchmarks import measure_statements
+
+        for key, (status, count) in measure_statements(self.app).items():
+            with self.subTest(key):
+                self.assertLess(status, 400)
+                self.assertIn(key, self.baselines['statements'], 'no budget; run python -m loadtest.benchmarks --update')
+                self.assertEqual(count, self.baselines['statements'][key], 'budget changed; run python -m loadtest.benchmarks --update')
+
+    def test_statement_count_does_not_grow_with_rows(self):
+        from loadtest.benchmarks import add_catalog_rows, count_statements
+
+        before = count_statements(self.app, 'GET', '/actors')[1]
+        with self.app.app_context():
+            add_catalog_rows(50)
+
+        self.assertEqual(count_statements(self.app, 'GET', '/actors')[1], before)
+
+    @unittest.skipUnless(os.environ.get('PERF_GATE') == '1', 'timing baselines run with PERF_GATE=1')
+    def test_timing_baselines(self):
+        from loadtest.benchmarks import BENCHMARKS, time_benchmark
+
+        with self.app.app_context():
+            for benchmark in BENCHMARKS:
+                with self.subTest(benchmark.name):
+                    baseline = self.baselines['timings_ms'][benchmark.name]
+                    elapsed = time_benchmark(benchmark)
+                    self.assertLessEqual(
+                        elapsed, baseline * self.tolerance,
+                        f'{benchmark.name} took {elapsed:.1f} ms, baseline {baseline} ms x {self.tolerance}'
+                    )
+
+            # Resets leave no imported rows behind, in the tables or the search index.
+            from sqlalchemy import text
+            from src.database.models import Actor, Movie, db
+            from src.database.search import SEARCH_TABLE
+            indexed = db.session.execute(text(f'SELECT count(*) FROM {SEARCH_TABLE}')).scalar()
+            self.assertEqual(indexed, Movie.query.count() + Actor.query.count())
+
+
+class RateLimitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        with patch.dict('src.rate_limit.RATE_LIMIT_BUDGETS', {'default': '3/60', 'expensive': '1/60'}):
+            self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+
+    def get(self, path, ip='10.0.0.1', **headers):
+        return self.client().get(path, headers=headers, environ_base={'REMOTE_ADDR': ip})
+
+    def bearer(self, subject):
+        from jose import jwt
+
+        return f"Bearer {jwt.encode({'sub': subject}, 'secret', algorithm='HS256')}"
+
+    def test_headers_count_down(self):
+        first = self.get('/movies')
+        second = self.get('/movies')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers['RateLimit-Policy'], '3;w=60')
+        self.assertEqual(first.headers['RateLimit-Limit'], '3')
+        self.assertEqual(first.headers['RateLimit-Remaining'], '2')
+        self.assertEqual(second.headers['RateLimit-Remaining'], '1')
+        self.assertEqual(second.headers['RateLimit-Reset'], '40')
+
+    def test_empty_bucket_is_429_per_ip(self):
+        for _ in range(3):
+            self.assertEqual(self.get('/actors').status_code, 200)
+
+        res = self.get('/movies')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 429)
+        self.assertEqual(res.headers['Retry-After'], '20')
+        self.assertEqual(res.headers['RateLimit-Remaining'], '0')
+
+        self.assertEqual(self.get('/movies', ip='10.0.0.2').status_code, 200)
+        metrics = self.client().get('/metrics', headers=METRICS_HEADERS).data.decode()
+        self.assertIn('rate_limit_rejected_total{budget="default"} 1', metrics)
+
+    def test_unverified_tokens_share_the_ip_bucket(self):
+        for n in range(3):
+            self.get('/movies', Authorization=self.bearer(f'auth0|user{n}'))
+
+        self.assertEqual(self.get('/movies', Authorization=self.bearer('auth0|fresh')).status_code, 429)
+        self.assertEqual(self.get('/movies', ip='10.0.0.2').status_code, 200)
+
+    def test_verified_principal_bucket(self):
+        import importlib
+        import src.app
+        from loadtest.auth0_stub import Auth0Stub
+        from src.auth.auth import reset_jwks_cache
+
+        stub = Auth0Stub(key_bits=1024).start()
+        self.addCleanup(stub.stop)
+        self.addCleanup(reset_jwks_cache)
+        reset_jwks_cache()
+        with patch('src.auth.auth.AUTH0_BASE_URL', stub.url), \
+                patch.dict('src.rate_limit.RATE_LIMIT_BUDGETS', {'default': '3/60', 'expensive': '1/60'}):
+            importlib.reload(src.app)
+            app = src.app.create_app()
+            with app.app_context():
+                db_drop_and_create_all()
+
+            def get_job(ip, token):
+                return app.test_client().get('/jobs/999', environ_base={'REMOTE_ADDR': ip},
+                                             headers={'Authorization': f'Bearer {token}'}).status_code
+
+            director = stub.mint_token('Casting Director', user_id='auth0|victim')
+            # Forged tokens naming the victim only drain the sender's IP bucket.
+            forged = self.bearer('auth0|victim').split(' ', 1)[1]
+            self.assertEqual([get_job('10.6.6.6', forged) for _ in range(4)], [401, 401, 401, 429])
+            self.assertEqual(get_job('10.1.1.1', director), 404)
+
+            # The verified principal has one bucket whatever address it uses.
+            self.assertEqual([get_job(f'10.2.2.{n}', director) for n in range(3)], [404, 404, 429])
+
+    def test_only_refilled_buckets_are_dropped(self):
+        from src.rate_limit import Budget, MemoryBackend
+
+        budget, backend = Budget('default', '2/60'), MemoryBackend(max_keys=5)
+        with patch('src.rate_limit.time.monotonic', return_value=100.0):
+            backend.take(budget, 'victim')
+            backend.take(budget, 'victim')
+            for n in range(50):
+                backend.take(budget, f'rotating{n}')
+            self.assertFalse(backend.take(budget, 'victim').allowed)
+
+        with patch('src.rate_limit.time.monotonic', return_value=1000.0):
+            backend.take(budget, 'late')
+            for n in range(200):
+                backend.take(budget, f'late{n}')
+        self.assertLessEqual(len(backend._buckets), 201)
+        self.assertNotIn('victim', backend._buckets)
+
+    def test_expensive_routes_have_their_own_budget(self):
+        self.assertEqual(self.get('/search?q=the').status_code, 200)
+        res = self.get('/stats/movies-by-year')
+
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res.headers['RateLimit-Limit'], '1')
+        self.assertEqual(res.headers['Retry-After'], '60')
+        self.assertEqual(self.get('/movies').status_code, 200)
+
+    def test_health_and_preflight_are_not_limited(self):
+        for _ in range(5):
+            self.assertEqual(self.get('/ready').status_code, 200)
+            res = self.client().options('/movies', environ_base={'REMOTE_ADDR': '10.0.0.1'}, headers={
+                'Origin': 'http://localhost:4200', 'Access-Control-Request-Method': 'GET'
+            })
+            self.assertEqual(res.status_code, 204)
+            self.assertNotIn('RateLimit-Limit', res.headers)
+
+        self.assertEqual(self.get('/movies').headers['RateLimit-Remaining'], '2')
+
+    def test_client_ip_behind_trusted_proxy(self):
+        with patch('src.rate_limit.RATE_LIMIT_TRUSTED_PROXIES', 1):
+            for _ in range(3):
+                self.get('/movies', ip='10.9.9.9', **{'X-Forwarded-For': '1.2.3.4, 5.6.7.8'})
+            blocked = self.get('/movies', ip='10.9.9.9', **{'X-Forwarded-For': '9.9.9.9, 5.6.7.8'})
+            other = self.get('/movies', ip='10.9.9.9', **{'X-Forwarded-For': '5.6.7.9'})
+
+        self.assertEqual(blocked.status_code, 429)
+        self.assertEqual(other.status_code, 200)
+
+    def test_bucket_refills_over_time(self):
+        from src.rate_limit import Budget, MemoryBackend
+
+        budget, backend = Budget('default', '2/1'), MemoryBackend()
+        with patch('src.rate_limit.time.monotonic', return_value=100.0):
+            self.assertTrue(backend.take(budget, 'k').allowed)
+            self.assertTrue(backend.take(budget, 'k').allowed)
+            self.assertFalse(backend.take(budget, 'k').allowed)
+        with patch('src.rate_limit.time.monotonic', return_value=100.5):
+            decision = backend.take(budget, 'k')
+
+        self.assertTrue(decision.allowed)
+        self.assertEqual(decision.remaining, 0)
+
+    def test_invalid_budget(self):
+        from src.rate_limit import Budget
+
+        self.assertRaises(ValueError, Budget, 'default', 'lots')
+        self.assertRaises(ValueError, Budget, 'default', '0/60')
+
+
+class PublicCatalogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        from src.public_catalog import public_catalog
+
+        self.app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        self.client = self.app.test_client
+        self.catalog = public_catalog
+        self.catalog.clear()
+
+    def test_same_list_as_movies_with_shared_cache_headers(self):
+        res = self.client().get('/public/movies')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data), json.loads(self.client().get('/movies').data))
+        self.assertTrue(res.headers['Cache-Control'].startswith('public, max-age='))
+        self.assertTrue(res.headers['ETag'])
+        self.assertNotIn('Authorization', res.headers.get('Vary', ''))
+
+        actors = json.loads(self.client().get('/public/actors?sort=filmography_count').data)
+        self.assertEqual(actors['total_actors'], 5)
+        self.assertEqual(actors['actors'][0]['name'], 'Morgan Freeman')
+
+    def test_never_reads_the_token(self):
+        with patch('src.auth.auth.get_token_auth_header') as header, \
+                patch('src.auth.auth.verify_decode_jwt') as verify:
+            res = self.client().get('/public/movies', headers={'Authorization': 'Bearer expired'})
+
+        self.assertEqual(res.status_code, 200)
+        header.assert_not_called()
+        verify.assert_not_called()
+
+    def test_served_from_prebuilt_body(self):
+        from loadtest.benchmarks import count_statements
+
+        self.assertEqual(count_statements(self.app, 'GET', '/public/movies'), (200, 1))
+        self.assertEqual(count_statements(self.app, 'GET', '/public/movies'), (200, 0))
+        self.assertEqual(count_statements(self.app, 'GET', '/public/movies?sort=cast_count'), (200, 1))
+
+    def test_if_none_match(self):
+        etag = self.client().get('/public/actors').headers['ETag']
+        res = self.client().get('/public/actors', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_writes_drop_the_prebuilt_body(self):
+        before = self.client().get('/public/movies')
+        self.client().patch('/movies/1', json={'title': 'Renamed'})
+        after = self.client().get('/public/movies')
+
+        self.assertNotEqual(before.headers['ETag'], after.headers['ETag'])
+        self.assertEqual(json.loads(after.data)['movies'][0]['title'], 'Renamed')
+
+    def test_unknown_sort(self):
+        self.assertEqual(self.client().get('/public/movies?sort=title').status_code, 400)
+
+    def test_rate_limited_per_ip_whatever_the_token(self):
+        with patch.dict('src.rate_limit.RATE_LIMIT_BUDGETS', {'default': '2/60', 'expensive': '1/60'}):
+            app = create_app_with_permissions(PRODUCER_PERMISSIONS)
+        statuses = [
+            app.test_client().get('/public/movies', headers={'Authorization': f'Bearer fake{n}'}).status_code
+            for n in range(3)
+        ]
+
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_catalog_reads_skip_token_verification(self):
+        import importlib
+        import src.app
+
+        importlib.reload(src.app)
+        app = src.app.create_app()
+        with app.app_context():
+            db_drop_and_create_all()
+        with patch('src.auth.auth.verify_decode_jwt') as verify:
+            res = app.test_client().get('/movies', headers={'Authorization': 'Bearer expired.token.here'})
+
+        self.assertEqual(res.status_code, 200)
+        verify.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,122 @@
+"""Opt-in warm-up of a fresh worker before it takes traffic.
+
+With ``WARMUP_ON_START=true`` every app built by ``create_app`` opens a
+database connection, configures the SQLAlchemy mappers and preloads the JWKS
+and a Management API token, all in parallel on a background thread.
+Gunicorn calls the factory in each worker after the fork, so nothing warmed
+here is shared between workers.  ``GET /ready`` answers 503 until the
+database and mapper steps have succeeded.  The Auth0 preloads are best
+effort: they are retried with backoff like the others but never hold back
+readiness, so an Auth0 outage does not keep new workers from serving the
+public catalog (protected routes degrade as described in resilience.py).
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+from .auth.auth import fetch_jwks
+from .auth.auth0_management import get_management_api_token
+from .database.models import db
+
+
+WARMUP_RETRY_DELAY = float(os.environ.get('WARMUP_RETRY_DELAY', 2))
+WARMUP_MAX_RETRY_DELAY = 30
+
+PENDING = 'pending'
+OK = 'ok'
+FAILED = 'failed'
+
+
+def warmup_enabled():
+    return os.environ.get('WARMUP_ON_START', 'false').lower() == 'true'
+
+
+def open_database_connection():
+    with db.engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+
+# Steps that only save the first protected request a round trip to Auth0.
+BEST_EFFORT_STEPS = ('jwks', 'management_token')
+
+
+def default_steps(skip_auth=False):
+    steps = {
+        'database': open_database_connection,
+        'mappers': configure_mappers,
+    }
+    if not skip_auth:
+        steps['jwks'] = fetch_jwks
+        steps['management_token'] = get_management_api_token
+    return steps
+
+
+class WarmUp:
+    """Runs named steps once each inside an app context.
+
+    Ready when every step not named in ``best_effort`` has succeeded; the
+    best-effort ones keep being retried in the background.
+    """
+
+    def __init__(self, app, steps, best_effort=()):
+        self.app = app
+        self.steps = dict(steps)
+        self.best_effort = frozenset(best_effort) & set(self.steps)
+        self.results = {
+            name: {'status': PENDING, 'blocking': name not in self.best_effort} for name in self.steps
+        }
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        with self._lock:
+            return all(
+                result['status'] == OK for name, result in self.results.items() if name not in self.best_effort
+            )
+
+    @property
+    def complete(self):
+        with self._lock:
+            return all(result['status'] == OK for result in self.results.values())
+
+    def status(self):
+        with self._lock:
+            return {name: dict(result) for name, result in self.results.items()}
+
+    def _run_step(self, name):
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                self.steps[name]()
+            result = {'status': OK}
+        except Exception as e:
+            result = {'status': FAILED, 'error': str(e)}
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        result['blocking'] = name not in self.best_effort
+        with self._lock:
+            self.results[name] = result
+
+    def run_once(self):
+        """Run every step that has not succeeded yet, in parallel; True once all have"""
+        pending = [name for name, result in self.status().items() if result['status'] != OK]
+        if pending:
+            with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix='warmup') as pool:
+                list(pool.map(self._run_step, pending))
+        return self.complete
+
+    def run(self):
+        attempt = 0
+        while not self.run_once():
+            attempt += 1
+            time.sleep(min(WARMUP_RETRY_DELAY * 2 ** (attempt - 1), WARMUP_MAX_RETRY_DELAY))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+            self._thread.start()
+        return self